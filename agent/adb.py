@@ -0,0 +1,113 @@
+import shutil
+import subprocess
+from typing import Dict, List, NamedTuple, Optional
+
+"""
+adb helpers for running the scrcpy server on one or more devices.
+
+Wraps the steps of start_server.sh and play_game.sh per device serial: listing
+devices, pushing the server jar, starting the server and forwarding a local TCP
+port to its socket. Every command takes the serial explicitly (adb -s), so
+several emulators can be driven side by side.
+"""
+
+SERVER_JAR = "scrcpy-server.jar"
+SERVER_DEVICE_PATH = "/data/local/tmp/scrcpy-server.jar"
+SERVER_VERSION = "3.3.4"
+SOCKET_NAME = "scrcpy"
+
+# Defaults from start_server.sh; agent/stream.py negotiates crop, size, bitrate and fps on top
+SERVER_OPTIONS = {
+    "tunnel_forward": "true",
+    "control": "true",
+    "audio": "false",
+    "max_size": "1024",
+    # The server has called this video_bit_rate since scrcpy 2.0
+    "video_bit_rate": "2000000",
+}
+
+
+class Device(NamedTuple):
+    serial: str
+    state: str  # "device" when usable; "offline", "unauthorized", ...
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "device"
+
+
+def find_adb(adb_path: Optional[str] = None) -> str:
+    """
+    adb executable: the given path, else the one on PATH.
+    """
+    if adb_path:
+        return adb_path
+    found = shutil.which("adb")
+    if found is None:
+        raise FileNotFoundError("adb not found on PATH; pass its path explicitly")
+    return found
+
+
+def parse_devices(output: str) -> List[Device]:
+    """
+    Parses `adb devices` output.
+    """
+    devices = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line or line.startswith("List of devices") or line.startswith("*"):
+            continue
+        fields = line.split()
+        if len(fields) >= 2:
+            devices.append(Device(fields[0], fields[1]))
+    return devices
+
+
+def list_devices(adb_path: str) -> List[Device]:
+    output = subprocess.run([adb_path, "devices"], capture_output=True, text=True, check=True).stdout
+    return parse_devices(output)
+
+
+def _run(adb_path: str, serial: str, *args: str) -> str:
+    return subprocess.run([adb_path, "-s", serial, *args], capture_output=True, text=True, check=True).stdout
+
+
+def push_server(adb_path: str, serial: str, jar: str = SERVER_JAR) -> None:
+    _run(adb_path, serial, "push", jar, SERVER_DEVICE_PATH)
+    _run(adb_path, serial, "shell", f"chmod 755 {SERVER_DEVICE_PATH}")
+
+
+def forward(adb_path: str, serial: str, port: int, socket_name: str = SOCKET_NAME) -> None:
+    _run(adb_path, serial, "forward", f"tcp:{port}", f"localabstract:{socket_name}")
+
+
+def remove_forward(adb_path: str, serial: str, port: int) -> None:
+    subprocess.run([adb_path, "-s", serial, "forward", "--remove", f"tcp:{port}"], capture_output=True)
+
+
+def server_command(options: Optional[Dict[str, str]] = None) -> str:
+    """
+    Shell command starting the scrcpy server on the device.
+
+    Args:
+        options: Server options overriding SERVER_OPTIONS
+    """
+    merged = {**SERVER_OPTIONS, **(options or {})}
+    arguments = " ".join(f"{key}={value}" for key, value in merged.items())
+    return (f"CLASSPATH={SERVER_DEVICE_PATH} app_process / com.genymobile.scrcpy.Server {SERVER_VERSION} "
+            f"{arguments}")
+
+
+def start_server(adb_path: str, serial: str, options: Optional[Dict[str, str]] = None,
+                 log_path: Optional[str] = None) -> subprocess.Popen:
+    """
+    Starts the scrcpy server on a device. It runs until the returned process is
+    terminated or the client disconnects.
+    """
+    log = open(log_path, "ab") if log_path else subprocess.DEVNULL
+    try:
+        return subprocess.Popen([adb_path, "-s", serial, "shell", server_command(options)],
+                                stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        if log_path:
+            log.close()
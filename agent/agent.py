@@ -1,34 +1,290 @@
+from __future__ import annotations
+
+import asyncio
 import socket
-from typing import Optional
-import av
-import cv2
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
 import time
 import subprocess
 import threading
-import numpy as np
+from agent.async_client import AsyncScrcpyClient, StreamInfo, parse_handshake, recv_exact
+from agent.background import BackgroundSubtractor
+from agent.change_map import ChangeMap
+from agent.coords import CoordinateSpaces
+from agent.decoder import DecoderConfig, create_codec_context, decode_frames, open_stream, tune_socket
+from agent.frame_access import Box, FrameView
+from agent.frame_ring import AnalysisPool
+from agent.hud_reader import CardBank, HudReader, HudState
+from agent.lazy import HEAVY_MODULES, lazy_import, load
+from agent.pipeline import FramePipeline
+from agent.preview import Overlay, Preview
+from agent.replay import DEVICE_NAME_LENGTH, VIDEO_HEADER, RecordingReader, StreamRecorder
+from agent.scheduler import SchedulerConfig, TickScheduler, WorldState
+from agent.send_command import ControlSender
+from agent.stream import ANALYZER_REGIONS, StreamSettings, regions
+from agent.telemetry import Telemetry
+from agent.tower_tracker import TowerTracker
+from constants import CARD_SLOT_BOXES
+if TYPE_CHECKING:
+    from tokenizer.game_types import GameState
+    from tokenizer.timeline import TimelineWriter
 # import xml.etree.ElementTree as ET
 
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
 """
 This class is used to play Clash Royale.
 """
 
 UI_STATE_FILE = "/data/local/tmp/t.xml"
 
+# Per-frame time budgets of the in-process perception tasks (see agent/scheduler.py)
+TASK_BUDGETS_MS = {"towers": 4.0, "hud": 2.0}
+
+class AgentOutputs(NamedTuple):
+    """
+    Files a ClashAgent writes while it plays.
+    """
+    record_path: Optional[str] = None  # raw video socket bytes, for replay (see agent/replay.py)
+    timeline_path: Optional[str] = None  # per-frame game states (see tokenizer/timeline.py)
+
+
+class ProcessedFrame(NamedTuple):
+    """
+    A processed frame with the tower states as of that frame. The states are
+    copied on the process stage, so the display stage never reads the tracker
+    while the next frame updates it.
+    """
+    view: FrameView
+    towers: Dict[str, Tuple[bool, float]]  # name -> (alive, health)
+
+
 class ClashAgent:
-    def __init__(self, __adb_path="/Users/akashwudali/Library/Android/sdk/platform-tools/adb", __background_image_path="/Users/akashwudali/ClashAI/tower_images/background_image.png"):
+    """
+    Args:
+        __adb_path: adb executable
+        __background_image_path: Empty arena image, for highlighting troops in the preview
+        queue_size: Frames buffered between stages when playing pipelined
+        telemetry: Stage timings; a default Telemetry if None
+        host, port: Address of the adb forward to the scrcpy server
+        outputs: Recording and timeline files to write (none by default)
+        decoder_config: Decoder threading and low-delay settings
+        cards_path: Directory of card images named after their card, for the HUD reader
+        preview: Preview mode (see agent/preview.py); "headless" skips the background
+            highlighting and overlays, which only run for frames the viewer shows
+        analysis_tasks: Tasks to run in worker processes instead of in process
+            (see agent/frame_ring.py), as names or {name: task kwargs}
+        warm_start: Load libraries and models on a background thread while connecting
+        launch_time: Wall clock time the launcher started, to measure startup from
+        connect_timeout: Seconds to keep retrying the connection and handshake
+        policy: Called on every scheduler tick with the WorldState and the controls
+        scheduling: Policy tick rate and per-frame perception budget
+        stream: Negotiated server settings (see agent/stream.py); None for the full screen
+    """
+
+    def __init__(
+        self,
+        __adb_path="/Users/akashwudali/Library/Android/sdk/platform-tools/adb",
+        __background_image_path="/Users/akashwudali/ClashAI/tower_images/background_image.png",
+        queue_size: int = 1,
+        telemetry: Optional[Telemetry] = None,
+        host: str = "127.0.0.1",
+        port: int = 27183,
+        outputs: AgentOutputs = AgentOutputs(),
+        decoder_config: Optional[DecoderConfig] = None,
+        cards_path: Optional[str] = None,
+        preview: str = "window",
+        analysis_tasks: Optional[Union[Sequence[str], Dict[str, dict]]] = None,
+        warm_start: bool = False,
+        launch_time: Optional[float] = None,
+        connect_timeout: float = 5.0,
+        policy: Optional[Callable[[WorldState, ControlSender], Any]] = None,
+        scheduling: SchedulerConfig = SchedulerConfig(),
+        stream: Optional[StreamSettings] = None,
+    ):
         self.__video_socket: Optional[socket.socket] = None
         self.__control_socket: Optional[socket.socket] = None
         self.ready: bool = False
 
         self.__ADB_PATH = __adb_path
+        self.__queue_size = queue_size
+        self.telemetry = telemetry if telemetry is not None else Telemetry()
+        self.__address = (host, port)
+        # Raw video socket bytes are saved here for replay (see agent/replay.py)
+        self.__record_path = outputs.record_path
+        self.__recorder: Optional[StreamRecorder] = None
+        # Negotiated server settings (see agent/stream.py); None for the full screen
+        self.__stream = stream
+        self.__video_size = stream.video_size if stream is not None else (576, 1024)
+        self.coords: Optional[CoordinateSpaces] = None
+        # Analyzer regions in stream px, rescaled whenever the stream geometry is known
+        self.__regions = ANALYZER_REGIONS
+        self.__decoder_config = decoder_config if decoder_config is not None else DecoderConfig()
+        if stream is not None:
+            self.__decoder_config = stream.decoder_config(self.__decoder_config)
+        self.controls: Optional[ControlSender] = None
+        self.__connect_timeout = connect_timeout
+
+        self.__background_image_path = __background_image_path
+        self.__background_image: Optional[np.ndarray] = None
+        self.change_map: Optional[ChangeMap] = None
+        self.__bgr_boxes: List[Box] = []
+        self.tower_tracker: Optional[TowerTracker] = None
+        # Preview mode (see agent/preview.py); the viewer is started by play()
+        self.__preview_mode = preview
+        self.preview: Optional[Preview] = None
+        # Tasks offloaded to worker processes (see agent/frame_ring.py), e.g. ["towers"]
+        # or {"towers": {}, "hud": {"cards_path": "cards"}}; they replace the in-process analysis
+        self.__analysis_tasks = analysis_tasks
+        self.analysis: Optional[AnalysisPool] = None
+        self.__timeline_frame = -1
+        # Card images named after their card, e.g. cards/knight.png
+        self.__cards_path = cards_path
+        self.__card_bank: Optional[CardBank] = None
+        self.hud_reader: Optional[HudReader] = None
+        self.hud: Optional[HudState] = None
+        # Latest troops from the "troops" analysis worker (see tokenizer/troop_detector.py)
+        self.troops: Optional[GameState] = None
+        self.__towers: Optional[Dict[str, np.ndarray]] = None
+        # Per-frame game states are appended here; readers can open it mid-match
+        self.__timeline_path = outputs.timeline_path
+        self.__timeline: Optional[TimelineWriter] = None
+        self.__frames_processed = 0
+        self.__start_time = time.perf_counter()
+        # Wall clock time the launcher started (e.g. $CLASH_LAUNCH_TIME from play_game.sh)
+        self.__launch_time = launch_time
+        self.__background_subtractor: Optional[BackgroundSubtractor] = None
+        # Perception tasks run per frame within their budgets; the policy gets the
+        # latest results on its own fixed tick, with the controls to act through
+        self.__policy = policy
+        self.scheduler = TickScheduler(self.__decide if policy is not None else None, tick_hz=scheduling.tick_hz,
+                                       frame_budget_ms=scheduling.frame_budget_ms, telemetry=self.telemetry)
+        self.__frame_number = -1
+        self.__previous_frame = -1
+        self.__last_run: Dict[str, int] = {}
+
+        # Libraries, decoder and models are set up here, or on a background thread
+        # while play() connects to the device when warm starting
+        self.__warm_thread: Optional[threading.Thread] = None
+        if warm_start:
+            self.__warm_thread = threading.Thread(target=self.__setup, name="warm-start", daemon=True)
+            self.__warm_thread.start()
+        else:
+            self.__setup()
+
+    @property
+    def frames_processed(self) -> int:
+        """
+        Frames that reached the analysis stage so far.
+        """
+        return self.__frames_processed
+
+    def __setup(self) -> None:
+        """
+        Loads the heavy libraries and builds the decoder and analysis models.
+        """
+        with self.telemetry.stage("setup"):
+            load(*(lazy_import(name) for name in HEAVY_MODULES))
+            # Opening a codec context loads and initializes libavcodec's H.264 decoder
+            create_codec_context(self.__decoder_config)
+
+            if self.__cards_path:
+                self.__card_bank = CardBank.from_directory(self.__cards_path)
+            self.__background_image = cv2.imread(self.__background_image_path)
+            # Built for the expected stream size; rebuilt if the video header says otherwise
+            self.__apply_geometry(*self.__video_size)
+            if self.tower_tracker is not None:
+                self.scheduler.add_task("towers", self.__read_towers, budget_ms=TASK_BUDGETS_MS["towers"])
+            if self.hud_reader is not None:
+                self.scheduler.add_task("hud", self.__read_hud, budget_ms=TASK_BUDGETS_MS["hud"])
+            if self.__timeline_path:
+                # Imported here: the timeline's record layout is built with NumPy at import time
+                from tokenizer.timeline import TimelineWriter
+                self.__timeline = TimelineWriter(self.__timeline_path)
+
+    def __apply_geometry(self, width: int, height: int) -> None:
+        """
+        Rescales the constants.py regions to the stream's size and crop, and builds
+        the analyzers for them. Does nothing if they were built for this size already.
+        Analyzers whose regions the stream does not cover are not built.
+        """
+        if self.change_map is not None and self.coords.video_size == (width, height):
+            return
+        self.__video_size = (width, height)
+        crop = self.__stream.crop if self.__stream is not None else None
+        self.coords = CoordinateSpaces.from_stream(width, height, crop=crop)
+        analyzers = self.__stream.analyzers if self.__stream is not None else ANALYZER_REGIONS
+        self.__regions = regions(self.coords, analyzers)
+        wanted = {"towers"}
+        if self.__card_bank is not None:
+            wanted.add("hud")
+        if self.__background_image is not None:
+            wanted.add("troops")
+        missing = wanted - set(self.__regions)
+        if missing:
+            print(f"⚠️ Stream does not cover {', '.join(sorted(missing))}; not analyzing it")
+
+        self.change_map = ChangeMap(width, height)
+        self.tower_tracker = TowerTracker(self.__regions["towers"]) if "towers" in self.__regions else None
+        self.hud_reader = None
+        if self.__card_bank is not None and "hud" in self.__regions:
+            hud = self.__regions["hud"]
+            self.hud_reader = HudReader(self.__card_bank, slots={name: hud[name] for name in CARD_SLOT_BOXES},
+                                        next_card=hud["next_card"], elixir_bar=hud["elixir_bar"])
+        self.__background_subtractor = None
+        if self.__background_image is not None and "troops" in self.__regions:
+            # Background is resized and buffers are allocated once, not per frame
+            self.__background_subtractor = BackgroundSubtractor(threshold=40)
+            self.__background_subtractor.add_region("battle_field", self.__regions["troops"]["battle_field"],
+                                                    self.__background_image)
+
+        # Regions the pipelined convert stage turns into BGR; analysis offloaded to
+        # workers reads the frame ring instead
+        self.__bgr_boxes = []
+        if not self.__analysis_tasks:
+            for analyzer in (self.tower_tracker, self.hud_reader):
+                if analyzer is not None:
+                    self.__bgr_boxes.extend(analyzer.bgr_boxes())
+
+    def __analysis_kwargs(self) -> Dict[str, dict]:
+        """
+        Offloaded tasks with the regions of the current stream, unless set explicitly.
+        """
+        tasks = self.__analysis_tasks
+        tasks = tasks if isinstance(tasks, dict) else {name: {} for name in tasks}
+        uncovered = sorted(name for name in tasks if name in ANALYZER_REGIONS and name not in self.__regions)
+        if uncovered:
+            raise ValueError(f"Stream does not cover the regions of {uncovered}; "
+                             f"negotiate it for them (python -m agent.stream --analyzers ...)")
+        geometry = {}
+        if "towers" in self.__regions:
+            geometry["towers"] = {"boxes": self.__regions["towers"]}
+        if "troops" in self.__regions:
+            geometry["troops"] = {"box": self.__regions["troops"]["battle_field"], "coords": self.coords}
+        if "hud" in self.__regions:
+            hud = self.__regions["hud"]
+            geometry["hud"] = {"slots": {name: hud[name] for name in CARD_SLOT_BOXES},
+                               "next_card": hud["next_card"], "elixir_bar": hud["elixir_bar"]}
+        return {name: {**geometry.get(name, {}), **kwargs} for name, kwargs in tasks.items()}
+
+    def __wait_for_setup(self) -> None:
+        """
+        Waits for a warm start to finish. Must run before the play loop touches
+        cv2, av or NumPy, so no module is imported by two threads at once.
+        """
+        if self.__warm_thread is not None:
+            self.__warm_thread.join()
+            self.__warm_thread = None
 
-        self.__background_image = cv2.imread(__background_image_path)
-        self.__arena_bounding_box = {
-            "x": 45,
-            "y": 105,
-            "width": 488,
-            "height": 664
-        }
+    def __report_startup(self) -> None:
+        if self.__launch_time is not None:
+            elapsed_ms = (time.time() - self.__launch_time) * 1000
+            since = "launch"
+        else:
+            elapsed_ms = (time.perf_counter() - self.__start_time) * 1000
+            since = "agent creation"
+        self.telemetry.record("startup", elapsed_ms)
+        print(f"⏱️ First frame reached processing {elapsed_ms:.0f}ms after {since}")
 
     def __setup_screen_recording_environment(self):
         """
@@ -46,71 +302,78 @@ class ClashAgent:
         Returns:
             Updated frame with differences set to black
         """
-        if self.__background_image is None or self.__arena_bounding_box is None:
+        if self.__background_subtractor is None:
             return frame
         
-        # Create a copy to avoid modifying the original
-        # updated_frame = frame.copy()
-        
-        # Extract bounding box coordinates
-        x = self.__arena_bounding_box["x"]
-        y = self.__arena_bounding_box["y"]
-        w = self.__arena_bounding_box["width"]
-        h = self.__arena_bounding_box["height"]
-        
-        # Extract ROI (Region of Interest) from current frame
-        roi = frame[y:y+h, x:x+w]
-        
-        # Ensure background image matches ROI dimensions
-        if self.__background_image.shape[:2] != roi.shape[:2]:
-            bg_resized = cv2.resize(self.__background_image, (w, h), interpolation=cv2.INTER_AREA)
-        else:
-            bg_resized = self.__background_image
-        
-        # Calculate absolute difference between background and current ROI
-        diff = cv2.absdiff(bg_resized, roi)
-        
-        # Convert to grayscale for thresholding
-        gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-        
-        # Create binary mask for differences (threshold value similar to annotate_image.py)
-        _, mask = cv2.threshold(gray_diff, 40, 255, cv2.THRESH_BINARY)
-        
-        # Set all differences to black (0, 0, 0)
-        roi[mask == 255] = (0, 0, 0)
-        
-        # Update the frame with modified ROI
-        frame[y:y+h, x:x+w] = roi
-        
-        return frame
+        # Updates the arena region in place
+        return self.__background_subtractor.apply(frame)
     
+    def __open_connections(self, deadline: float) -> StreamInfo:
+        """
+        Opens the video and control connections and reads the handshake with
+        exact-length reads. Raises on a refused connection or a short handshake.
+        """
+        # 1. Establish Video Connection (First)
+        self.__video_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__video_socket.connect(self.__address)
+        print("✅ Video Socket Connected")
+
+        # 2. Establish Control Connection (Second)
+        # Small delay helps the server distinguish the two incoming connections
+        time.sleep(0.1)
+        self.__control_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__control_socket.connect(self.__address)
+        print("✅ Control Socket Connected")
+
+        # 3. Read Device Metadata and Video Header (Codec, Width, Height)
+        # The server only sends these on the video channel
+        self.__video_socket.settimeout(max(deadline - time.perf_counter(), 0.5))
+        device_name_raw = recv_exact(self.__video_socket, DEVICE_NAME_LENGTH)
+        header = recv_exact(self.__video_socket, VIDEO_HEADER.size)
+        self.__video_socket.settimeout(None)
+        info = parse_handshake(device_name_raw, header)
+
+        if self.__record_path is not None:
+            self.__recorder = StreamRecorder(self.__record_path)
+            self.__recorder.write(device_name_raw)
+            self.__recorder.write(header)
+        print(f"📱 Device Name: {info.device_name}")
+        print(f"📊 Header Received (Hex): {header.hex()}")
+        return info
+
+    def __close_sockets(self) -> None:
+        for sock in (self.__video_socket, self.__control_socket):
+            if sock is not None:
+                sock.close()
+        self.__video_socket = self.__control_socket = None
+
     def __connect_socket(self) -> None:
         try:
-            # 1. Establish Video Connection (First)
-            self.__video_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.__video_socket.connect(('127.0.0.1', 27183))
-            print("✅ Video Socket Connected")
-
-            # 2. Establish Control Connection (Second)
-            # Small delay helps the server distinguish the two incoming connections
-            time.sleep(0.1) 
-            self.__control_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.__control_socket.connect(('127.0.0.1', 27183))
-            print("✅ Control Socket Connected")
-
-            # 3. Read Device Metadata from the Video Socket
-            # The server only sends this on the video channel
-            device_name_raw = self.__video_socket.recv(64)
-            device_name = device_name_raw.decode('utf-8', errors='ignore').strip('\x00')
-            print(f"📱 Device Name: {device_name}")
-
-            # 4. Read Video Header (Codec, Width, Height)
-            header = self.__video_socket.recv(12)
-            if len(header) == 12:
-                print(f"📊 Header Received (Hex): {header.hex()}")
-            else:
-                print("⚠️ Header incomplete or delayed")
-            
+            # Retried until connect_timeout, as the adb forward may still be coming up
+            # or the server may drop the connection before the handshake is complete
+            deadline = time.perf_counter() + self.__connect_timeout
+            delay = 0.05
+            while True:
+                try:
+                    info = self.__open_connections(deadline)
+                    break
+                except (OSError, ValueError) as e:
+                    self.__close_sockets()
+                    if time.perf_counter() >= deadline:
+                        raise
+                    if not isinstance(e, ConnectionRefusedError):
+                        print(f"⚠️ Handshake failed ({e!r}), reconnecting in {delay:.2f}s")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+
+            # The warm start has had the whole handshake to finish
+            with self.telemetry.stage("setup_wait"):
+                self.__wait_for_setup()
+            self.__apply_geometry(info.width, info.height)
+
+            # Touch positions are sent in the coordinates of the video stream
+            self.controls = ControlSender(self.__control_socket, telemetry=self.telemetry,
+                                          coords=self.coords).start()
             self.ready = True
 
         except KeyboardInterrupt:
@@ -123,60 +386,295 @@ class ClashAgent:
             else:
                 print("Failed to create Android client")
     
-    def play(self):
+    def __process_frame(self, view: FrameView) -> ProcessedFrame:
+        """
+        Runs the analysis stage on a decoded frame and returns it, with the tower
+        states it produced, for the preview.
+        """
+        self.__analyze_frame(view)
+        return ProcessedFrame(view, self.__tower_snapshot())
+
+    def __tower_snapshot(self) -> Dict[str, Tuple[bool, float]]:
+        if self.tower_tracker is None:
+            return {}
+        return {name: (state.alive, state.health) for name, state in self.tower_tracker.states.items()}
+
+    def __analyze_frame(self, view: FrameView) -> None:
+        """
+        Analysis reads regions from the view (view.gray / view.bgr) rather than
+        converting the whole frame; the full conversion is only for the preview.
+        Exact duplicates of the previous frame are skipped entirely, and towers are
+        only looked at when a tile under them changed.
+        """
+        with self.telemetry.stage("changes"):
+            changed = self.change_map.update(view)
+        frame_number = self.__frames_processed
+        self.__frames_processed += 1
+        if frame_number == 0:
+            self.__report_startup()
+        if not changed:
+            return
+        if self.analysis is not None:
+            self.__offload_frame(view, frame_number)
+            return
+
+        self.__previous_frame, self.__frame_number = self.__frame_number, frame_number
+        ran = self.scheduler.on_frame(view, frame_number)
+        for name in ran:
+            self.__last_run[name] = frame_number
+        if self.__timeline is not None and "towers" in ran:
+            elixir = self.hud.elixir if self.hud is not None else float("nan")
+            self.__timeline.append_towers(frame_number, time.perf_counter() - self.__start_time,
+                                          self.tower_tracker.states, troops=self.troops, elixir=elixir)
+
+    def __changes_since_last_run(self, task: str) -> Optional[ChangeMap]:
+        """
+        The change map only covers the last frame, so it can only be trusted by a
+        task that also ran on the previous analyzed frame (duplicates in between
+        change nothing); otherwise the task re-checks everything.
+        """
+        if self.__last_run.get(task) == self.__previous_frame:
+            return self.change_map
+        return None
+
+    def __read_towers(self, view: FrameView):
+        changes = self.__changes_since_last_run("towers")
+        dirty = changes.dirty_regions(self.__regions["towers"]) if changes is not None else None
+        self.tower_tracker.update(view, dirty=dirty)
+        return self.tower_tracker.arrays()
+
+    def __read_hud(self, view: FrameView) -> HudState:
+        self.hud = self.hud_reader.read(view, self.__changes_since_last_run("hud"))
+        return self.hud
+
+    def __decide(self, state: WorldState) -> None:
+        """
+        Policy tick: runs the policy once the controls are connected.
+        """
+        if self.controls is not None:
+            self.__policy(state, self.controls)
+
+    def __offload_frame(self, view: FrameView, frame_number: int) -> None:
+        """
+        Hands the frame to the analysis workers and picks up whatever results they
+        have finished, tagged with the frame they came from.
+        """
+        dead = self.analysis.dead()
+        if dead:
+            raise RuntimeError(f"Analysis worker(s) for {', '.join(dead)} died")
+        with self.telemetry.stage("submit"):
+            self.analysis.submit(view, frame_number)
+            results = self.analysis.poll().merged()
+        for name, (result_frame, value) in results.items():
+            self.scheduler.deliver(name, result_frame, value, timestamp=self.analysis.ring.timestamp(result_frame))
+        if "hud" in results:
+            self.hud = results["hud"][1]
+        if "troops" in results:
+            self.troops = results["troops"][1]
+        if "towers" in results:
+            self.__towers = results["towers"][1]
+        # One record per newer tower or troop result, holding the latest of both
+        result_frame = max(results.get(name, (-1, None))[0] for name in ("towers", "troops"))
+        if self.__timeline is not None and result_frame > self.__timeline_frame:
+            self.__timeline_frame = result_frame
+            timestamp = self.analysis.ring.timestamp(result_frame)
+            timestamp = time.perf_counter() if timestamp is None else timestamp
+            elixir = self.hud.elixir if self.hud is not None else float("nan")
+            towers = self.__towers if self.__towers is not None else {}
+            self.__timeline.append(result_frame, timestamp - self.__start_time, towers.get("alive"),
+                                   towers.get("health"), troops=self.troops, elixir=elixir)
+
+    def __overlays(self, towers: Dict[str, Tuple[bool, float]]) -> List[Overlay]:
+        """
+        Tower boxes labeled with their state, drawn by the preview.
+        """
+        overlays = []
+        for name, (alive, health) in towers.items():
+            color = (0, 255, 0) if alive else (0, 0, 255)
+            overlays.append({"box": self.__regions["towers"][name], "color": color, "label": f"{health:.0%}"})
+        return overlays
+
+    def __show_frame(self, processed: ProcessedFrame) -> bool:
+        """
+        Hands a processed frame to the preview. Returns False once the viewer is closed.
+        Background highlighting and overlays only happen for frames the preview shows.
+        """
+        return self.preview.publish(processed.view, lambda: self.__overlays(processed.towers),
+                                    render=self.__highlight_differences)
+
+    def __convert_frame(self, frame) -> FrameView:
+        """
+        Pipelined convert stage: wraps the frame and converts the BGR regions the
+        analyzers read, so the process stage finds them already converted.
+        """
+        return FrameView(frame).prefetch(self.__bgr_boxes)
+
+    def __run_sequential(self, container) -> None:
+        telemetry = self.telemetry
+        # Times waiting on the socket ("receive") apart from decoding ("decode")
+        frames = decode_frames(container, telemetry)
+        while True:
+            frame_start = time.perf_counter()
+
+            # Step 1: Next decoded frame, wrapped without converting it
+            frame = next(frames, None)
+            if frame is None:
+                break
+            view = FrameView(frame)
+            
+            # Step 2: Process frame
+            with telemetry.stage("process"):
+                processed = self.__process_frame(view)
+            
+            # Step 3: Preview frame (rate limited, off the main process)
+            with telemetry.stage("display"):
+                keep_going = self.__show_frame(processed)
+            
+            # Total frame processing time
+            telemetry.record("total", (time.perf_counter() - frame_start) * 1000)
+            telemetry.maybe_report()
+
+            if not keep_going:
+                break
+
+    def __run_pipelined(self, container) -> None:
+        """
+        Decodes, converts, processes and displays on separate stages.
+        Stale frames are dropped so processing always works on the newest frame.
+        """
+        pipeline = FramePipeline(
+            frames=container.decode(video=0),
+            convert=self.__convert_frame,
+            process=self.__process_frame,
+            display=self.__show_frame,
+            queue_size=self.__queue_size,
+            telemetry=self.telemetry,
+        )
+        stats = pipeline.run()
+        print(f"Pipeline finished - Processed: {stats['processed']} | "
+              f"Dropped: {stats['dropped']} | "
+              f"Latency avg: {stats['latency_avg_ms']:.2f}ms max: {stats['latency_max_ms']:.2f}ms")
+
+    def play(self, pipelined: bool = False, telemetry_path: Optional[str] = None):
         """
         Presses play and activates screen recording
         Runs main image processing loop
+
+        Args:
+            pipelined: Run decode/convert/process/display as separate stages,
+                dropping stale frames instead of falling behind the stream
+            telemetry_path: If set, stage timings are exported here (.json or .csv) when the run ends
         """
         
         try:
             self.__connect_socket()
             if self.ready:
+                self.preview = Preview(self.__preview_mode, size=self.__video_size)
                 print("Created Socket File")
+                tune_socket(self.__video_socket, self.__decoder_config)
                 socket_file = self.__video_socket.makefile('rb', buffering=0)
+                if self.__recorder is not None:
+                    print(f"⏺️ Recording stream to {self.__record_path}")
+                    socket_file = RecordingReader(socket_file, self.__recorder)
+
+                if self.__analysis_tasks:
+                    self.analysis = AnalysisPool(self.__analysis_kwargs(), self.__video_size, telemetry=self.telemetry)
+                self.scheduler.start()
 
                 # Continuous Stream Loop
                 print("Reading raw video data (Ctrl+C to stop)...")
-                container = av.open(socket_file, format='h264')
-
-                frame_count = 0
-                for frame in container.decode(video=0):
-                    frame_start = time.perf_counter()
-                    
-                    # Step 1: Decode frame (already done in for loop, measure conversion)
-                    decode_start = time.perf_counter()
-                    img = frame.to_ndarray(format='bgr24')
-                    decode_time = (time.perf_counter() - decode_start) * 1000
-                    
-                    # Step 2: Process frame (highlight differences)
-                    process_start = time.perf_counter()
-                    new_img = img
-                    # new_img = self.__highlight_differences(img)
-                    process_time = (time.perf_counter() - process_start) * 1000
-                    
-                    # Step 3: Display frame
-                    display_start = time.perf_counter()
-                    cv2.imshow("Android Screen", new_img)
-                    display_time = (time.perf_counter() - display_start) * 1000
-                    
-                    # Total frame processing time
-                    total_time = (time.perf_counter() - frame_start) * 1000
-                    
-                    frame_count += 1
-                    print("--------------------------------")
-                    print(f"Frame {frame_count} - Decode: {decode_time:.2f}ms | "
-                          f"Process: {process_time:.2f}ms | "
-                          f"Display: {display_time:.2f}ms | "
-                          f"Total: {total_time:.2f}ms")
-
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
+                container = open_stream(socket_file, self.__decoder_config)
+
+                if pipelined:
+                    self.__run_pipelined(container)
+                else:
+                    self.__run_sequential(container)
             else:
                 print("Could not connect to video socket")
         except KeyboardInterrupt:
             print("\n👋 Stopping client...")
         except Exception as e:
             print(f"\n❗ Error: {e}")
+        finally:
+            self.scheduler.stop()
+            if self.controls is not None:
+                self.controls.stop()
+            if self.__recorder is not None:
+                self.__recorder.close()
+            if self.analysis is not None:
+                self.analysis.close()
+                self.analysis = None
+            if self.__timeline is not None:
+                self.__timeline.flush()
+            if self.preview is not None:
+                self.preview.close()
+            self.telemetry.report()
+            self.scheduler.report()
+            if telemetry_path is not None:
+                self.telemetry.export(telemetry_path)
+
+    async def __run_async(self, client: AsyncScrcpyClient) -> None:
+        telemetry = self.telemetry
+        # The sender writes through the client's control channel, which follows reconnects
+        self.controls = ControlSender(client.control, telemetry=telemetry, coords=self.coords,
+                                      survive_disconnects=True).start()
+        self.scheduler.start()
+        frames = client.frames()
+        try:
+            while True:
+                frame_start = time.perf_counter()
+                # The client times "receive" and "decode" itself
+                frame = await frames.__anext__()
+                view = FrameView(frame)
+                self.controls.video_size = (client.info.width, client.info.height)
+                self.__apply_geometry(client.info.width, client.info.height)
+
+                with telemetry.stage("process"):
+                    processed = self.__process_frame(view)
+                with telemetry.stage("display"):
+                    keep_going = self.__show_frame(processed)
+
+                telemetry.record("total", (time.perf_counter() - frame_start) * 1000)
+                telemetry.maybe_report()
+                if not keep_going:
+                    break
+        except StopAsyncIteration:
+            print("Video stream ended")
+        finally:
+            await frames.aclose()
+            await client.close()
+
+    def play_async(self, telemetry_path: Optional[str] = None, **client_options):
+        """
+        Runs the main image processing loop on the asyncio client, which reads the
+        handshake with exact-length reads and reconnects with backoff when the
+        device or adb forward drops.
+
+        Args:
+            telemetry_path: If set, stage timings are exported here when the run ends
+            client_options: Passed to AsyncScrcpyClient (timeouts, backoff, retries)
+        """
+        client = AsyncScrcpyClient(*self.__address, decoder_config=self.__decoder_config, telemetry=self.telemetry,
+                                   **client_options)
+        # The client decodes on the event loop, so the warm start has to be done first
+        self.__wait_for_setup()
+        self.preview = Preview(self.__preview_mode, size=self.__video_size)
+        try:
+            asyncio.run(self.__run_async(client))
+        except KeyboardInterrupt:
+            print("\n👋 Stopping client...")
+        finally:
+            self.scheduler.stop()
+            if self.controls is not None:
+                self.controls.stop()
+            if self.__timeline is not None:
+                self.__timeline.flush()
+            if self.preview is not None:
+                self.preview.close()
+            self.telemetry.report()
+            self.scheduler.report()
+            if telemetry_path is not None:
+                self.telemetry.export(telemetry_path)
 
     def start_game(self):
         pass
\ No newline at end of file
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import socket
+from typing import AsyncIterator, NamedTuple, Optional
+
+from agent.decoder import DecoderConfig, buffer_size_for, create_codec_context
+from agent.lazy import lazy_import
+from agent.replay import CODEC_H264, DEVICE_NAME_LENGTH, VIDEO_HEADER
+from agent.telemetry import Telemetry
+
+av = lazy_import("av")
+
+"""
+asyncio scrcpy client.
+
+Opens the video and control connections, reads the device name and codec header
+with exact-length reads, and feeds the H.264 stream straight into a decoder.
+When the device or the adb forward drops, or the stream stalls, the client
+reconnects with exponential backoff instead of ending the session.
+"""
+
+CODEC_NAMES = {
+    CODEC_H264: "h264",
+    0x68323635: "hevc",  # "h265"
+    0x00617631: "av1",   # "av1"
+}
+
+
+class StreamInfo(NamedTuple):
+    device_name: str
+    codec_id: int
+    width: int
+    height: int
+
+    @property
+    def codec_name(self) -> str:
+        return CODEC_NAMES.get(self.codec_id, "h264")
+
+
+def parse_handshake(device_name_raw: bytes, header: bytes) -> StreamInfo:
+    """
+    Parses the 64-byte device name and 12-byte codec header sent on the video socket.
+    """
+    if len(device_name_raw) != DEVICE_NAME_LENGTH or len(header) != VIDEO_HEADER.size:
+        raise ValueError("Incomplete scrcpy handshake")
+    codec_id, width, height = VIDEO_HEADER.unpack(header)
+    device_name = device_name_raw.decode('utf-8', errors='ignore').strip('\x00')
+    return StreamInfo(device_name, codec_id, width, height)
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    """
+    Blocking counterpart of StreamReader.readexactly(): keeps reading until size
+    bytes have arrived. Raises ConnectionError if the peer closes first.
+    """
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError(f"Connection closed after {len(data)} of {size} bytes")
+        data += chunk
+    return bytes(data)
+
+
+class _ControlChannel:
+    """
+    Thread-safe sendall() adapter over the asyncio control stream, so a
+    ControlSender's writer thread can be pointed at it. Survives reconnects:
+    while the client is reconnecting, sendall() raises ConnectionError, which a
+    ControlSender created with survive_disconnects=True drops and moves past.
+
+    Like socket.sendall(), it returns once the event loop has written the bytes to
+    the transport and drained it, so the sender's "control_write" timing covers
+    the actual write.
+    """
+
+    def __init__(self, write_timeout: float = 5.0):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.write_timeout = write_timeout
+
+    async def __write(self, data: bytes) -> None:
+        if self.writer is None:
+            raise ConnectionError("Control channel is not connected")
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def sendall(self, data: bytes) -> None:
+        if self.loop is None or self.writer is None:
+            raise ConnectionError("Control channel is not connected")
+        future = asyncio.run_coroutine_threadsafe(self.__write(data), self.loop)
+        try:
+            future.result(self.write_timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+
+class AsyncScrcpyClient:
+    """
+    Args:
+        host, port: Address of the adb forward (or a replay stand-in)
+        connect_delay: Pause between opening the video and control connections,
+            which helps the server tell the two apart
+        handshake_timeout: Seconds allowed for the device name and header to arrive
+        stall_timeout: Seconds without video data before the stream counts as stalled
+        backoff_initial, backoff_max: Reconnect delay bounds in seconds (doubles per failure)
+        max_retries: Give up after this many consecutive failed connections (None retries forever).
+            A connection that is lost before a frame was decoded counts as failed;
+            the count and delay only reset once frames come through
+        read_size: Maximum bytes per socket read (sized from the decoder config by default)
+        decoder_config: Decoder threading and low-delay settings
+        telemetry: Records time spent waiting for video data as "receive" and
+            parsing and decoding it as "decode"
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 27183, connect_delay: float = 0.1,
+                 handshake_timeout: float = 5.0, stall_timeout: float = 5.0, backoff_initial: float = 0.25,
+                 backoff_max: float = 8.0, max_retries: Optional[int] = None, read_size: Optional[int] = None,
+                 decoder_config: Optional[DecoderConfig] = None, telemetry: Optional[Telemetry] = None):
+        self.host = host
+        self.port = port
+        self.connect_delay = connect_delay
+        self.handshake_timeout = handshake_timeout
+        self.stall_timeout = stall_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.max_retries = max_retries
+        self.decoder_config = decoder_config if decoder_config is not None else DecoderConfig()
+        self.read_size = read_size if read_size is not None else buffer_size_for(self.decoder_config)
+        self.telemetry = telemetry if telemetry is not None else Telemetry(enabled=False)
+
+        self.info: Optional[StreamInfo] = None
+        self.control = _ControlChannel()
+        self.connections = 0
+        # Consecutive failures; kept across connections so a stream that keeps
+        # dropping right after the handshake still backs off and gives up
+        self.failures = 0
+        self.__delay = backoff_initial
+
+        self.__video_reader: Optional[asyncio.StreamReader] = None
+        self.__video_writer: Optional[asyncio.StreamWriter] = None
+        self.__closed = False
+
+    async def connect(self) -> StreamInfo:
+        """
+        Opens both connections and reads the handshake. Raises on any failure.
+        """
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        control_writer = None
+        try:
+            await asyncio.sleep(self.connect_delay)
+            _, control_writer = await asyncio.open_connection(self.host, self.port)
+
+            device_name_raw = await asyncio.wait_for(reader.readexactly(DEVICE_NAME_LENGTH), self.handshake_timeout)
+            header = await asyncio.wait_for(reader.readexactly(VIDEO_HEADER.size), self.handshake_timeout)
+        except BaseException:
+            writer.close()
+            if control_writer is not None:
+                control_writer.close()
+            raise
+
+        self.info = parse_handshake(device_name_raw, header)
+        self.__video_reader, self.__video_writer = reader, writer
+        self.control.loop = asyncio.get_running_loop()
+        self.control.writer = control_writer
+        self.connections += 1
+        print(f"📱 Device Name: {self.info.device_name} | "
+              f"{self.info.codec_name} {self.info.width}x{self.info.height}")
+        return self.info
+
+    async def disconnect(self) -> None:
+        for writer in (self.__video_writer, self.control.writer):
+            if writer is not None:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except (ConnectionError, OSError):
+                    pass
+        self.__video_reader = self.__video_writer = None
+        self.control.writer = None
+
+    async def close(self) -> None:
+        self.__closed = True
+        await self.disconnect()
+
+    async def __back_off(self, reason: str) -> bool:
+        """
+        Counts a failed connection and waits before the next one.
+        Returns False once max_retries is exceeded.
+        """
+        self.failures += 1
+        if self.max_retries is not None and self.failures > self.max_retries:
+            print(f"❗ Giving up after {self.failures} failed connections: {reason}")
+            return False
+        print(f"⚠️ {reason}, retrying in {self.__delay:.2f}s")
+        await asyncio.sleep(self.__delay)
+        self.__delay = min(self.__delay * 2, self.backoff_max)
+        return True
+
+    async def __connect_with_backoff(self) -> bool:
+        while not self.__closed:
+            try:
+                await self.connect()
+                return True
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+                if not await self.__back_off(f"Connection failed ({e!r})"):
+                    return False
+        return False
+
+    async def frames(self) -> AsyncIterator[av.VideoFrame]:
+        """
+        Yields decoded frames, reconnecting whenever the stream drops or stalls.
+        Ends when close() is called or max_retries is exceeded.
+        """
+        while not self.__closed:
+            if not await self.__connect_with_backoff():
+                return
+            codec = create_codec_context(self.decoder_config, self.info.codec_name)
+            decoded = 0
+            try:
+                while not self.__closed:
+                    with self.telemetry.stage("receive"):
+                        data = await asyncio.wait_for(self.__video_reader.read(self.read_size), self.stall_timeout)
+                    if not data:
+                        raise ConnectionError("Video stream closed")
+                    # Decoded up front so the timing doesn't include the consumer
+                    with self.telemetry.stage("decode"):
+                        frames = [frame for packet in codec.parse(data) for frame in codec.decode(packet)]
+                    for frame in frames:
+                        if decoded == 0:
+                            # The connection works; back off from scratch next time
+                            self.failures = 0
+                            self.__delay = self.backoff_initial
+                        decoded += 1
+                        yield frame
+            except (OSError, asyncio.TimeoutError, av.FFmpegError) as e:
+                # A corrupt packet can leave the decoder unusable; start over on a fresh connection
+                reason = "stalled" if isinstance(e, asyncio.TimeoutError) else repr(e)
+                print(f"⚠️ Video stream lost ({reason}), reconnecting...")
+            finally:
+                await self.disconnect()
+            if decoded == 0 and not self.__closed:
+                if not await self.__back_off("Connection lost before any frame was decoded"):
+                    return
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional, Sequence
+
+from agent.lazy import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+"""
+Background subtraction against a static reference image.
+
+The background for each region is resized and converted once, when the region
+is added. Every region owns preallocated diff/gray/mask buffers that are reused
+for every frame, and the output is filled in place with a masked cv2.copyTo
+instead of boolean fancy indexing.
+"""
+
+Box = Dict[str, int]
+
+COLOR_SPACES = ("bgr", "gray")
+
+
+class _Region:
+    def __init__(self, box: Box, background: np.ndarray, color_space: str):
+        self.x, self.y = box["x"], box["y"]
+        self.w, self.h = box["width"], box["height"]
+        self.background = np.ascontiguousarray(background)
+        if color_space == "bgr":
+            self.diff = np.empty((self.h, self.w, 3), dtype=np.uint8)
+            self.gray = np.empty((self.h, self.w), dtype=np.uint8)
+        else:
+            self.diff = np.empty((self.h, self.w), dtype=np.uint8)
+            self.gray = self.diff
+        self.mask = np.empty((self.h, self.w), dtype=np.uint8)
+        # Solid color images used as the copy source when filling, keyed by (channels, color)
+        self.fill_images: Dict[tuple, np.ndarray] = {}
+
+    def fill_image(self, channels: int, color: np.ndarray) -> np.ndarray:
+        key = (channels, color.tobytes())
+        image = self.fill_images.get(key)
+        if image is None:
+            shape = (self.h, self.w) if channels == 1 else (self.h, self.w, channels)
+            image = np.empty(shape, dtype=np.uint8)
+            image[:] = color[0] if channels == 1 else color
+            self.fill_images[key] = image
+        return image
+
+    def crop(self, image: np.ndarray) -> np.ndarray:
+        return image[self.y:self.y+self.h, self.x:self.x+self.w]
+
+
+class BackgroundSubtractor:
+    """
+    Marks pixels that differ from a reference background in one or more regions.
+
+    Args:
+        threshold: Grayscale difference above which a pixel counts as changed
+        color_space: "bgr" compares color frames (grayscale of the color difference),
+            "gray" compares single-channel frames such as FrameView.luma()
+        fill: Color written into changed pixels by apply()
+    """
+
+    def __init__(self, threshold: int = 40, color_space: str = "bgr", fill: Sequence[int] = (0, 0, 0)):
+        if color_space not in COLOR_SPACES:
+            raise ValueError(f"color_space must be one of {COLOR_SPACES}")
+        self.threshold = threshold
+        self.color_space = color_space
+        self.__fill = np.array(fill, dtype=np.uint8)
+        self.__regions: Dict[str, _Region] = {}
+
+    @property
+    def region_names(self) -> list:
+        return list(self.__regions)
+
+    def add_region(self, name: str, box: Box, background: np.ndarray) -> None:
+        """
+        Prepares a background for a region. The BGR background image is resized to
+        the box and converted to the subtractor's color space once, here.
+        """
+        w, h = box["width"], box["height"]
+        if background.shape[:2] != (h, w):
+            background = cv2.resize(background, (w, h), interpolation=cv2.INTER_AREA)
+        if self.color_space == "gray" and background.ndim == 3:
+            background = cv2.cvtColor(background, cv2.COLOR_BGR2GRAY)
+        self.__regions[name] = _Region(box, background, self.color_space)
+
+    def add_subregion(self, name: str, box: Box, parent: str) -> None:
+        """
+        Adds a region whose background is cropped from an already prepared region
+        (e.g. a tower box inside the battle field).
+        """
+        source = self.__regions[parent]
+        x, y = box["x"] - source.x, box["y"] - source.y
+        w, h = box["width"], box["height"]
+        if x < 0 or y < 0 or x + w > source.w or y + h > source.h:
+            raise ValueError(f"Region {name} is not inside {parent}")
+        self.__regions[name] = _Region(box, source.background[y:y+h, x:x+w], self.color_space)
+
+    def mask(self, image: np.ndarray, name: str) -> np.ndarray:
+        """
+        Computes the change mask of a region.
+
+        Args:
+            image: Full frame in the subtractor's color space
+            name: Region name
+
+        Returns:
+            (h, w) uint8 mask of 0/1 values. The buffer is reused on the next call.
+        """
+        region = self.__regions[name]
+        roi = region.crop(image)
+        cv2.absdiff(region.background, roi, dst=region.diff)
+        if self.color_space == "bgr":
+            cv2.cvtColor(region.diff, cv2.COLOR_BGR2GRAY, dst=region.gray)
+        cv2.threshold(region.gray, self.threshold, 1, cv2.THRESH_BINARY, dst=region.mask)
+        return region.mask
+
+    def fill(self, frame: np.ndarray, name: str, color: Optional[np.ndarray] = None) -> None:
+        """
+        Writes a color into the changed pixels of a region, using the last mask
+        computed for it. frame may be in any color space with the same geometry.
+        """
+        region = self.__regions[name]
+        color = self.__fill if color is None else np.asarray(color, dtype=np.uint8)
+        roi = region.crop(frame)
+        channels = 1 if roi.ndim == 2 else roi.shape[2]
+        cv2.copyTo(region.fill_image(channels, color), region.mask, roi)
+
+    def apply(self, frame: np.ndarray, names: Optional[Iterable[str]] = None) -> np.ndarray:
+        """
+        Sets the changed pixels of each region to the fill color, in place.
+
+        Args:
+            frame: Full frame in the subtractor's color space
+            names: Regions to process (all regions by default)
+
+        Returns:
+            The same frame
+        """
+        names = list(self.__regions) if names is None else list(names)
+        # Compute every mask before filling so overlapping regions (a tower inside
+        # the battle field) compare against the untouched frame
+        for name in names:
+            self.mask(frame, name)
+        for name in names:
+            self.fill(frame, name)
+        return frame
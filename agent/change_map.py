@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import zlib
+from typing import Dict, List, Optional, Tuple, Union
+
+from agent.frame_access import FrameView
+from agent.lazy import lazy_import
+from constants import VIDEO_HEIGHT_PX, VIDEO_WIDTH_PX
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+"""
+Tile-level change detection between consecutive frames.
+
+Each frame's luma is checksummed (crc32) first: an exact duplicate of the
+previous frame - common while the screen is idle, since the encoder repeats
+skipped frames - is reported as such and nothing else is computed. Otherwise
+the frame is downsampled into a preallocated buffer, diffed against the previous
+sample, and the diff is averaged per tile. Tiles whose mean change is above the
+threshold are dirty.
+
+Analysis stages then ask whether their region touches a dirty tile and skip the
+frame when it doesn't.
+"""
+
+Box = Dict[str, int]
+Frame = Union[FrameView, "np.ndarray"]
+
+
+class ChangeMap:
+    """
+    Args:
+        width, height: Frame size in video px
+        tile: Tile size in video px
+        scale: Downsampling factor applied before diffing (must divide tile)
+        threshold: Mean absolute gray-level change of a tile above which it is dirty
+    """
+
+    def __init__(self, width: int = VIDEO_WIDTH_PX, height: int = VIDEO_HEIGHT_PX, tile: int = 32, scale: int = 4,
+                 threshold: float = 2.0):
+        if tile % scale:
+            raise ValueError("scale must divide tile")
+        self.width, self.height = width, height
+        self.tile = tile
+        self.scale = scale
+        self.threshold = threshold
+        self.rows = -(-height // tile)
+        self.cols = -(-width // tile)
+
+        self.__sample_size = (max(width // scale, 1), max(height // scale, 1))
+        self.__sample = np.zeros(self.__sample_size[::-1], dtype=np.uint8)
+        self.__previous = np.zeros_like(self.__sample)
+        self.__diff = np.zeros_like(self.__sample)
+        self.__tile_means = np.zeros((self.rows, self.cols), dtype=np.uint8)
+        self.dirty = np.ones((self.rows, self.cols), dtype=np.bool_)
+        self.__tile_ranges: Dict[Tuple[int, int, int, int], Tuple[slice, slice]] = {}
+
+        self.__checksum: Optional[int] = None
+        self.duplicate = False
+        self.frames = 0
+        self.duplicates = 0
+
+    def __luma(self, frame: Frame) -> np.ndarray:
+        if isinstance(frame, FrameView):
+            return frame.luma()
+        return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def update(self, frame: Frame) -> bool:
+        """
+        Computes the change map of a frame against the previous one.
+
+        Args:
+            frame: FrameView of a decoded frame, or a BGR/grayscale frame in video px;
+                must be the size the map was built for
+
+        Returns:
+            False if the frame is an exact duplicate of the previous one (the dirty
+            map is then all clear), True otherwise
+        """
+        luma = self.__luma(frame)
+        if luma.shape != (self.height, self.width):
+            raise ValueError(f"Frame is {luma.shape[1]}x{luma.shape[0]}, change map was built for "
+                             f"{self.width}x{self.height}")
+        checksum = zlib.crc32(luma if luma.flags.c_contiguous else np.ascontiguousarray(luma))
+        first_frame = self.__checksum is None
+        self.frames += 1
+        self.duplicate = checksum == self.__checksum
+        self.__checksum = checksum
+        if self.duplicate:
+            self.duplicates += 1
+            self.dirty[:] = False
+            return False
+
+        cv2.resize(luma, self.__sample_size, dst=self.__sample, interpolation=cv2.INTER_AREA)
+        if first_frame:
+            self.dirty[:] = True
+        else:
+            cv2.absdiff(self.__sample, self.__previous, dst=self.__diff)
+            # INTER_AREA to the tile grid averages each tile
+            cv2.resize(self.__diff, (self.cols, self.rows), dst=self.__tile_means, interpolation=cv2.INTER_AREA)
+            np.greater(self.__tile_means, self.threshold, out=self.dirty)
+        self.__previous, self.__sample = self.__sample, self.__previous
+        return True
+
+    def __tiles(self, box: Box) -> Tuple[slice, slice]:
+        key = (box["x"], box["y"], box["width"], box["height"])
+        ranges = self.__tile_ranges.get(key)
+        if ranges is None:
+            x, y, w, h = key
+            t = self.tile
+            ranges = (slice(max(y // t, 0), -(-(y + h) // t)), slice(max(x // t, 0), -(-(x + w) // t)))
+            self.__tile_ranges[key] = ranges
+        return ranges
+
+    def is_dirty(self, box: Box) -> bool:
+        """
+        Whether any tile overlapping the box changed in the last frame.
+        """
+        rows, cols = self.__tiles(box)
+        return bool(self.dirty[rows, cols].any())
+
+    def dirty_regions(self, regions: Dict[str, Box]) -> List[str]:
+        """
+        Names of the regions that overlap at least one dirty tile.
+        """
+        return [name for name, box in regions.items() if self.is_dirty(box)]
+
+    def dirty_fraction(self) -> float:
+        return float(np.count_nonzero(self.dirty)) / self.dirty.size
+
+    def dirty_boxes(self) -> List[Box]:
+        """
+        Dirty tiles as boxes in video px, merged along each tile row.
+        """
+        boxes = []
+        t = self.tile
+        # Run starts and ends from the edges of each padded row
+        edges = np.diff(np.pad(self.dirty.view(np.int8), ((0, 0), (1, 1))), axis=1)
+        for row in range(self.rows):
+            starts, ends = np.flatnonzero(edges[row] == 1), np.flatnonzero(edges[row] == -1)
+            for start, end in zip(starts, ends):
+                boxes.append({"x": int(start) * t, "y": row * t, "width": int(end - start) * t, "height": t})
+        return boxes
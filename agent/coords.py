@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+from agent.lazy import lazy_import
+from constants import (
+    BATTLE_FIELD_BOX,
+    EMULATOR_HEIGHT_DP,
+    EMULATOR_HEIGHT_PX,
+    EMULATOR_LENGTH_DP,
+    EMULATOR_LENGTH_PX,
+    VIDEO_HEIGHT_PX,
+    VIDEO_WIDTH_PX,
+)
+
+np = lazy_import("numpy")
+
+"""
+Transforms between the coordinate spaces positions live in.
+
+    device - emulator screen px (constants.EMULATOR_*_PX); "px" is an alias
+    dp     - emulator density-independent px (constants.EMULATOR_*_DP)
+    layout - the 576x1024 video px every box in constants.py was measured in
+    video  - px of the stream the server is actually sending, which depends on
+             the negotiated max_size and crop
+    arena  - 0 to 1 across the battlefield box, as used by Troop and GameState
+
+Every space has a 3x3 affine matrix to device px. The matrix between any two
+spaces is composed once and cached, and points are converted as whole (N, 2)
+arrays with one matrix product.
+"""
+
+Box = Dict[str, int]
+Points = Union["np.ndarray", Sequence[Tuple[float, float]]]
+
+SPACE_NAMES = ("device", "dp", "layout", "video", "arena")
+ALIASES = {"px": "device"}
+
+
+def _affine(scale_x: float, scale_y: float, offset_x: float = 0.0, offset_y: float = 0.0) -> np.ndarray:
+    return np.array([[scale_x, 0.0, offset_x],
+                     [0.0, scale_y, offset_y],
+                     [0.0, 0.0, 1.0]])
+
+
+class CoordinateSpaces:
+    """
+    Args:
+        video_size: (width, height) of the stream
+        crop: Region of the device screen the stream shows, as a box in device px;
+            None when the stream shows the whole screen
+        device_size: Emulator screen size in px
+        dp_size: Emulator screen size in dp
+        layout_size: Size of the space constants.py boxes are measured in
+        arena_box: Battlefield box in layout px
+    """
+
+    def __init__(self, video_size: Tuple[int, int] = (VIDEO_WIDTH_PX, VIDEO_HEIGHT_PX), crop: Optional[Box] = None,
+                 device_size: Tuple[int, int] = (EMULATOR_LENGTH_PX, EMULATOR_HEIGHT_PX),
+                 dp_size: Tuple[int, int] = (EMULATOR_LENGTH_DP, EMULATOR_HEIGHT_DP),
+                 layout_size: Tuple[int, int] = (VIDEO_WIDTH_PX, VIDEO_HEIGHT_PX), arena_box: Box = BATTLE_FIELD_BOX):
+        self.video_size = tuple(video_size)
+        self.device_size = tuple(device_size)
+        self.crop = crop if crop is not None else {"x": 0, "y": 0, "width": device_size[0], "height": device_size[1]}
+
+        device_w, device_h = device_size
+        layout_w, layout_h = layout_size
+        layout = _affine(device_w / layout_w, device_h / layout_h)
+        self.__to_device = {
+            "device": np.eye(3),
+            "dp": _affine(device_w / dp_size[0], device_h / dp_size[1]),
+            "layout": layout,
+            "video": _affine(self.crop["width"] / video_size[0], self.crop["height"] / video_size[1],
+                             self.crop["x"], self.crop["y"]),
+            "arena": layout @ _affine(arena_box["width"], arena_box["height"], arena_box["x"], arena_box["y"]),
+        }
+        self.__matrices: Dict[Tuple[str, str], np.ndarray] = {}
+
+    @classmethod
+    def from_stream(cls, width: int, height: int, crop: Optional[Box] = None, **kwargs) -> "CoordinateSpaces":
+        """
+        Spaces for a stream of the given size, e.g. from the scrcpy video header.
+        """
+        return cls((width, height), crop=crop, **kwargs)
+
+    def matrix(self, source: str, target: str) -> np.ndarray:
+        """
+        3x3 affine matrix mapping source space to target space.
+        """
+        source, target = ALIASES.get(source, source), ALIASES.get(target, target)
+        key = (source, target)
+        matrix = self.__matrices.get(key)
+        if matrix is None:
+            if source not in self.__to_device or target not in self.__to_device:
+                raise ValueError(f"Unknown space; expected one of {SPACE_NAMES}")
+            matrix = np.linalg.inv(self.__to_device[target]) @ self.__to_device[source]
+            self.__matrices[key] = matrix
+        return matrix
+
+    def transform(self, points: Points, source: str, target: str) -> np.ndarray:
+        """
+        Converts an (N, 2) array of x, y points. Returns a new float64 array.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        matrix = self.matrix(source, target)
+        return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+    def point(self, x: float, y: float, source: str, target: str) -> Tuple[float, float]:
+        matrix = self.matrix(source, target)
+        return (float(matrix[0, 0] * x + matrix[0, 1] * y + matrix[0, 2]),
+                float(matrix[1, 0] * x + matrix[1, 1] * y + matrix[1, 2]))
+
+    def box(self, box: Box, source: str, target: str) -> Box:
+        """
+        Converts an axis-aligned box, rounding outwards to whole px.
+        """
+        corners = self.transform([(box["x"], box["y"]), (box["x"] + box["width"], box["y"] + box["height"])],
+                                 source, target)
+        (x0, y0), (x1, y1) = np.floor(corners.min(axis=0)), np.ceil(corners.max(axis=0))
+        return {"x": int(x0), "y": int(y0), "width": int(x1 - x0), "height": int(y1 - y0)}
+
+    def boxes(self, boxes: Dict[str, Box], source: str = "layout", target: str = "video") -> Dict[str, Box]:
+        """
+        Converts a dict of named boxes (by default constants.py regions into stream px).
+        """
+        return {name: self.box(box, source, target) for name, box in boxes.items()}
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import socket
+from typing import Iterator, NamedTuple, Optional
+
+from agent.lazy import lazy_import
+from agent.telemetry import Telemetry
+
+av = lazy_import("av")
+
+"""
+Decoder setup for the scrcpy H.264 stream.
+
+FFmpeg's defaults are tuned for files: it probes the input before decoding
+and buffers frames for reordering. For a live stream we want the first frame
+out as soon as its bytes arrive, so the container is opened with minimal
+probing and the codec runs in low-delay mode.
+
+fflags=nobuffer is deliberately not used: it discards the packets read while
+probing, which can include the stream's only keyframe for the next ~10 seconds.
+
+Threading modes trade latency for throughput:
+    "frame"  - frame threading; highest throughput, but holds back up to
+               thread_count - 1 frames before returning the first one
+    "slice"  - slice threading; no added delay, only helps if the encoder
+               emits several slices per frame
+    "single" - one decoding thread; no added delay, lowest CPU use
+Run python -m scripts.bench_decoder to pick the best one for a given machine.
+"""
+
+THREAD_MODES = ("frame", "slice", "single")
+
+# Keep av's I/O reads between these sizes regardless of the bitrate
+MIN_BUFFER_SIZE = 4096
+MAX_BUFFER_SIZE = 1 << 18
+
+
+class DecoderConfig(NamedTuple):
+    threading: str = "slice"
+    thread_count: int = 0  # 0 lets FFmpeg pick based on the core count
+    low_delay: bool = True
+    bit_rate: int = 2_000_000  # bits per second, as passed to the scrcpy server
+    max_fps: int = 60
+
+
+def buffer_size_for(config: DecoderConfig) -> int:
+    """
+    I/O buffer size for av's reads: about one average frame of the stream,
+    rounded up to a 4 KiB multiple. Big enough to avoid many tiny reads, small
+    enough that av never waits on more data than one frame needs.
+    """
+    frame_bytes = config.bit_rate // 8 // max(config.max_fps, 1)
+    size = -(-frame_bytes // 4096) * 4096
+    return max(MIN_BUFFER_SIZE, min(size, MAX_BUFFER_SIZE))
+
+
+def container_options(config: DecoderConfig) -> dict:
+    if not config.low_delay:
+        return {}
+    # low_delay is a codec flag (see configure_codec_context); the demuxer ignores it
+    return {
+        "probesize": "32",
+        "analyzeduration": "0",
+    }
+
+
+def configure_codec_context(codec_context, config: DecoderConfig) -> None:
+    """
+    Applies threading and low-delay flags. Must be called before the first decode.
+    """
+    if config.threading not in THREAD_MODES:
+        raise ValueError(f"threading must be one of {THREAD_MODES}")
+    if config.threading == "single":
+        codec_context.thread_count = 1
+    else:
+        codec_context.thread_type = config.threading.upper()
+        codec_context.thread_count = config.thread_count
+    if config.low_delay:
+        codec_context.options = {**codec_context.options, "flags": "+low_delay", "flags2": "+fast"}
+
+
+def create_codec_context(config: DecoderConfig, codec_name: str = "h264"):
+    """
+    Standalone decoder (for parsing raw bytes, as the asyncio client does).
+    """
+    codec_context = av.CodecContext.create(codec_name, "r")
+    configure_codec_context(codec_context, config)
+    return codec_context
+
+
+def tune_socket(sock: socket.socket, config: DecoderConfig) -> None:
+    """
+    Sizes the kernel receive buffer for about a quarter second of stream so a
+    brief decode hiccup doesn't stall the sender.
+    """
+    wanted = config.bit_rate // 8 // 4
+    current = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    if wanted > current:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, wanted)
+
+
+def open_stream(source, config: DecoderConfig):
+    """
+    Opens a raw H.264 stream from a file-like object for decoding.
+
+    Args:
+        source: Unbuffered file-like object (e.g. socket.makefile('rb', buffering=0))
+        config: Decoder configuration
+
+    Returns:
+        av container whose video stream is configured for the chosen mode
+    """
+    container = av.open(
+        source,
+        format='h264',
+        buffer_size=buffer_size_for(config),
+        container_options=container_options(config),
+    )
+    configure_codec_context(container.streams.video[0].codec_context, config)
+    return container
+
+
+def decode_frames(container, telemetry: Optional[Telemetry] = None) -> Iterator:
+    """
+    Decodes the container's video stream like container.decode(video=0), but
+    times waiting for each packet ("receive") apart from decoding it ("decode"),
+    so a slow socket doesn't show up as decode time.
+    """
+    telemetry = telemetry if telemetry is not None else Telemetry(enabled=False)
+    packets = container.demux(video=0)
+    while True:
+        with telemetry.stage("receive"):
+            packet = next(packets, None)
+        if packet is None:
+            return
+        with telemetry.stage("decode"):
+            frames = packet.decode()
+        yield from frames
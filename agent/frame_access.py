@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict, Optional, Sequence, Union
+
+from agent.lazy import lazy_import
+from constants import REGIONS
+
+av = lazy_import("av")
+np = lazy_import("numpy")
+
+"""
+Plane-level access to decoded frames.
+
+Reads the Y (luma) plane of a YUV420 av.VideoFrame directly as a NumPy view and
+crops named regions out of it without copying. Color conversion only happens
+for the regions that ask for it, instead of converting every full frame to bgr24.
+
+A region is converted by copying its planes into a reusable yuv420p frame of
+its size and running that through swscale, the converter behind av's own
+to_ndarray(). swscale converts faster per pixel than cv2.cvtColor does, and its
+output matches a full-frame conversion exactly.
+"""
+
+Box = Dict[str, int]
+
+YUV420_FORMATS = ("yuv420p", "yuvj420p")
+
+
+class FrameView:
+    """
+    Zero-copy view over the planes of a decoded YUV420 frame.
+
+    The view keeps a reference to the frame so the plane buffers stay valid for
+    as long as the view (or any array returned from it) is in use.
+    """
+
+    def __init__(self, frame, regions: Optional[Dict[str, Box]] = None):
+        if frame.format.name not in YUV420_FORMATS:
+            raise ValueError(f"Expected a YUV420 frame, got {frame.format.name}")
+        self.__frame = frame
+        self.__regions = REGIONS if regions is None else regions
+        self.width: int = frame.width
+        self.height: int = frame.height
+        self.__planes: Optional[tuple] = None
+        self.__converted: Dict[tuple, np.ndarray] = {}
+
+    @classmethod
+    def from_planes(cls, y_plane: np.ndarray, u_plane: np.ndarray, v_plane: np.ndarray,
+                    regions: Optional[Dict[str, Box]] = None) -> "FrameView":
+        """
+        View over planes that already live in memory (e.g. a shared frame ring slot)
+        instead of a decoded av.VideoFrame.
+        """
+        view = cls.__new__(cls)
+        view.__frame = None
+        view.__regions = REGIONS if regions is None else regions
+        view.height, view.width = y_plane.shape
+        view.__planes = (y_plane, u_plane, v_plane)
+        view.__converted = {}
+        return view
+
+    def __plane(self, index: int, width: int, height: int) -> np.ndarray:
+        plane = self.__frame.planes[index]
+        rows = np.frombuffer(plane, dtype=np.uint8).reshape(-1, plane.line_size)
+        return rows[:height, :width]
+
+    def planes(self) -> tuple:
+        """
+        Returns (Y, U, V) plane views. U and V are half resolution.
+        """
+        if self.__planes is None:
+            chroma_w, chroma_h = (self.width + 1) // 2, (self.height + 1) // 2
+            self.__planes = (
+                self.__plane(0, self.width, self.height),
+                self.__plane(1, chroma_w, chroma_h),
+                self.__plane(2, chroma_w, chroma_h),
+            )
+        return self.__planes
+
+    def luma(self) -> np.ndarray:
+        """
+        Full-frame grayscale (Y plane) view. No copy is made.
+        """
+        return self.planes()[0]
+
+    def box(self, region: Union[str, Box]) -> Box:
+        if isinstance(region, str):
+            return self.__regions[region]
+        return region
+
+    def gray(self, region: Union[str, Box]) -> np.ndarray:
+        """
+        Grayscale view of a named region or box. No copy is made.
+        """
+        box = self.box(region)
+        x, y, w, h = box["x"], box["y"], box["width"], box["height"]
+        return self.luma()[y:y+h, x:x+w]
+
+    def prefetch(self, regions: Sequence[Union[str, Box]]) -> "FrameView":
+        """
+        Converts the given regions to BGR now, so later bgr() calls for them return
+        the stored result. Lets the pipelined play loop do the conversion on its
+        convert stage instead of the process stage.
+
+        Returns:
+            This view
+        """
+        for region in regions:
+            box = self.box(region)
+            key = (box["x"], box["y"], box["width"], box["height"])
+            if key not in self.__converted:
+                self.__converted[key] = self.bgr(box)
+        return self
+
+    def bgr(self, region: Union[str, Box, None] = None, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Converts only the given region to BGR. Regions passed to prefetch() are
+        returned without converting again.
+
+        Chroma is subsampled 2x2, so the crop is widened to even coordinates
+        internally and trimmed back before returning.
+
+        Args:
+            region: Region name or box; None converts the whole frame
+            out: Optional preallocated (h, w, 3) uint8 destination
+
+        Returns:
+            BGR array of the region
+        """
+        if region is None:
+            if self.__frame is not None:
+                return self.__frame.to_ndarray(format='bgr24')
+            region = {"x": 0, "y": 0, "width": self.width, "height": self.height}
+
+        box = self.box(region)
+        x, y, w, h = box["x"], box["y"], box["width"], box["height"]
+        converted = self.__converted.get((x, y, w, h))
+        if converted is not None:
+            if out is None:
+                return converted
+            out[:] = converted
+            return out
+
+        # Align the crop to the chroma grid
+        x0, y0 = x & ~1, y & ~1
+        x1, y1 = min(x + w + (x + w) % 2, self.width), min(y + h + (y + h) % 2, self.height)
+        aw, ah = x1 - x0, y1 - y0
+
+        y_plane, u_plane, v_plane = self.planes()
+        frame, planes = _scratch_frame(aw, ah)
+        sources = (y_plane[y0:y1, x0:x1], u_plane[y0 // 2:y1 // 2, x0 // 2:x1 // 2],
+                   v_plane[y0 // 2:y1 // 2, x0 // 2:x1 // 2])
+        for plane, source in zip(planes, sources):
+            plane[:source.shape[0], :source.shape[1]] = source
+
+        bgr = frame.to_ndarray(format='bgr24')
+        bgr = bgr[y - y0:y - y0 + h, x - x0:x - x0 + w]
+        if out is None:
+            return bgr
+        out[:] = bgr
+        return out
+
+
+_scratch = threading.local()
+
+
+def _scratch_frame(width: int, height: int) -> tuple:
+    """
+    Reusable yuv420p frame for a crop size, with writable NumPy views of its
+    planes, so region conversion doesn't allocate a new frame each time. Frames
+    are per thread because the pipelined play loop converts regions on more than
+    one stage.
+    """
+    frames = getattr(_scratch, "frames", None)
+    if frames is None:
+        frames = _scratch.frames = {}
+    key = (width, height)
+    entry = frames.get(key)
+    if entry is None:
+        frame = av.VideoFrame(width, height, "yuv420p")
+        planes = tuple(np.frombuffer(plane, dtype=np.uint8).reshape(-1, plane.line_size) for plane in frame.planes)
+        entry = frames[key] = (frame, planes)
+    return entry
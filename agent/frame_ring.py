@@ -0,0 +1,380 @@
+from __future__ import annotations
+
+import inspect
+import multiprocessing as mp
+import queue
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from agent.frame_access import FrameView
+from agent.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+"""
+Shared-memory frame ring for analysis worker processes.
+
+The play loop copies each decoded frame's Y, U and V planes once into the next
+slot of a ring in multiprocessing.shared_memory. Worker processes (one per
+analysis task: towers, troops, HUD, ...) wrap the slot as a FrameView and run
+their task on it, so analysis spreads over several cores instead of sharing
+one GIL.
+
+Each slot is guarded by a seqlock. The single writer makes the slot's sequence
+number odd, copies the planes, then makes it even again and publishes the frame
+number as the newest frame. A reader takes the sequence number before it starts
+(skipping the slot if it is odd) and checks it again when done; if it changed,
+the writer lapped the ring mid-read and the result is discarded. Nothing ever
+blocks the writer.
+
+Stateful tasks (trackers, background models) would keep whatever a torn read
+showed them even though the result is discarded, so they read from a private
+copy of the slot that is validated before the task runs. Every built-in task
+is stateful, so in practice each worker copies one frame (about 0.9 MB at
+576x1024, well under a millisecond) per analyzed frame; that copy is the
+design, not an oversight. Only tasks registered with stateful=False read the
+slot in place.
+
+Workers always jump to the newest frame, and their results come back over a
+queue tagged with the frame number, where ResultMerger lines them up.
+"""
+
+# Per-slot metadata columns
+_SEQUENCE, _FRAME, _TIMESTAMP = range(3)
+
+# Analysis tasks: name -> factory building the per-frame function inside the worker.
+# Results must be picklable.
+TASKS: Dict[str, Callable[..., Callable[[FrameView], Any]]] = {}
+# Tasks that carry state from frame to frame
+STATEFUL_TASKS = set()
+
+
+def task(name: str, stateful: bool = False):
+    """
+    Registers an analysis task factory under a name. Stateful tasks only ever
+    see validated copies of frames.
+    """
+    def register(factory):
+        TASKS[name] = factory
+        if stateful:
+            STATEFUL_TASKS.add(name)
+        return factory
+    return register
+
+
+@task("towers", stateful=True)
+def _towers_task(**kwargs) -> Callable[[FrameView], Dict[str, np.ndarray]]:
+    from agent.tower_tracker import TowerTracker
+
+    tracker = TowerTracker(**kwargs)
+
+    def run(view: FrameView) -> Dict[str, np.ndarray]:
+        tracker.update(view)
+        return tracker.arrays()
+    return run
+
+
+@task("troops", stateful=True)
+def _troops_task(box: Optional[Dict[str, int]] = None, **kwargs) -> Callable[[FrameView], Any]:
+    from tokenizer.background_model import RunningBackground
+    from tokenizer.troop_detector import TroopDetector
+
+    # box: battlefield in stream px, when the stream is cropped or scaled
+    detector = TroopDetector(model=RunningBackground(box=box), **kwargs)
+
+    def run(view: FrameView):
+        # The background model works on grayscale, so the luma plane is enough
+        return detector.update(view.luma()).snapshot()
+    return run
+
+
+@task("hud", stateful=True)
+def _hud_task(cards_path: str, **kwargs) -> Callable[[FrameView], Any]:
+    from agent.hud_reader import CardBank, HudReader
+
+    reader = HudReader(CardBank.from_directory(cards_path), **kwargs)
+    return reader.read
+
+
+class FrameRing:
+    """
+    Ring of I420 frame slots in shared memory.
+
+    Args:
+        size: (width, height) of the frames
+        slots: Number of frames the ring holds
+        name: Shared memory name to attach to; None creates a new ring
+    """
+
+    def __init__(self, size: Tuple[int, int], slots: int = 8, name: Optional[str] = None):
+        width, height = size
+        if width % 2 or height % 2:
+            raise ValueError("frame size must be even")
+        self.size = (width, height)
+        self.slots = slots
+        self.__luma_size = width * height
+        self.__chroma_size = (width // 2) * (height // 2)
+        self.frame_bytes = self.__luma_size + 2 * self.__chroma_size
+
+        # [newest frame number] + per-slot (sequence, frame number, timestamp in ns), then the frames
+        meta_bytes = 8 * (1 + slots * 3)
+        self.owner = name is None
+        if self.owner:
+            self.__shm = shared_memory.SharedMemory(create=True, size=meta_bytes + slots * self.frame_bytes)
+        else:
+            self.__shm = shared_memory.SharedMemory(name=name)
+        self.name = self.__shm.name
+        buffer = self.__shm.buf
+        self.__newest = np.ndarray((1,), dtype=np.int64, buffer=buffer)
+        self.__meta = np.ndarray((slots, 3), dtype=np.int64, buffer=buffer, offset=8)
+        self.__frames = np.ndarray((slots, self.frame_bytes), dtype=np.uint8, buffer=buffer, offset=meta_bytes)
+        if self.owner:
+            self.__newest[0] = -1
+            self.__meta[:] = 0
+            self.__meta[:, _FRAME] = -1
+
+    def latest(self) -> int:
+        """
+        Frame number of the newest published frame (-1 before the first).
+        """
+        return int(self.__newest[0])
+
+    def publish(self, view: FrameView, frame_number: int, timestamp: Optional[float] = None) -> None:
+        """
+        Copies a frame's planes into its slot (frame_number % slots). Single writer only.
+        """
+        if (view.width, view.height) != self.size:
+            raise ValueError(f"Frame is {view.width}x{view.height}, ring holds {self.size[0]}x{self.size[1]}")
+        slot = frame_number % self.slots
+        meta = self.__meta[slot]
+        data = self.__frames[slot]
+        width, height = self.size
+        y_plane, u_plane, v_plane = view.planes()
+
+        meta[_SEQUENCE] += 1  # odd: being written
+        data[:self.__luma_size].reshape(height, width)[:] = y_plane
+        chroma = data[self.__luma_size:].reshape(2, height // 2, width // 2)
+        chroma[0] = u_plane
+        chroma[1] = v_plane
+        meta[_FRAME] = frame_number
+        meta[_TIMESTAMP] = int((time.perf_counter() if timestamp is None else timestamp) * 1e9)
+        meta[_SEQUENCE] += 1  # even: complete
+        self.__newest[0] = frame_number
+
+    def view(self, frame_number: int, out: Optional[np.ndarray] = None) -> Tuple[Optional[FrameView], int]:
+        """
+        Zero-copy view of a frame's slot and the slot's sequence number at the start
+        of the read. Returns (None, 0) if the slot is being written or already holds
+        a newer frame. Check valid() once done with the view.
+
+        With out (a frame_bytes uint8 buffer), the slot is copied into it and the
+        view is over the copy: once valid() passes, the copy is known to be whole.
+        """
+        slot = frame_number % self.slots
+        meta = self.__meta[slot]
+        sequence = int(meta[_SEQUENCE])
+        if sequence % 2 or meta[_FRAME] != frame_number:
+            return None, 0
+        width, height = self.size
+        data = self.__frames[slot]
+        if out is not None:
+            out[:] = data
+            data = out
+        chroma = data[self.__luma_size:].reshape(2, height // 2, width // 2)
+        view = FrameView.from_planes(data[:self.__luma_size].reshape(height, width), chroma[0], chroma[1])
+        return view, sequence
+
+    def valid(self, frame_number: int, sequence: int) -> bool:
+        """
+        Whether a slot read with view() was left untouched by the writer.
+        """
+        meta = self.__meta[frame_number % self.slots]
+        return int(meta[_SEQUENCE]) == sequence and meta[_FRAME] == frame_number
+
+    def timestamp(self, frame_number: int) -> Optional[float]:
+        """
+        time.perf_counter() value the frame was published with, or None once its slot was reused.
+        """
+        meta = self.__meta[frame_number % self.slots]
+        if meta[_FRAME] != frame_number:
+            return None
+        return meta[_TIMESTAMP] / 1e9
+
+    def close(self) -> None:
+        self.__newest = self.__meta = self.__frames = None
+        self.__shm.close()
+        if self.owner:
+            self.__shm.unlink()
+
+
+def _worker_main(ring_name: str, size: Tuple[int, int], slots: int, task_name: str, task_kwargs: dict,
+                 new_frame, stop, results) -> None:
+    ring = FrameRing(size, slots, name=ring_name)
+    try:
+        run = TASKS[task_name](**task_kwargs)
+        scratch = np.empty(ring.frame_bytes, dtype=np.uint8) if task_name in STATEFUL_TASKS else None
+        last = -1
+        while not stop.is_set():
+            if not new_frame.wait(0.1):
+                continue
+            new_frame.clear()
+            frame_number = ring.latest()
+            if frame_number <= last:
+                continue
+            view, sequence = ring.view(frame_number, out=scratch)
+            if view is None:
+                continue
+            if scratch is not None and not ring.valid(frame_number, sequence):
+                # Torn copy: the task never sees it
+                results.put((task_name, frame_number, None, 0.0))
+                continue
+            start = time.perf_counter()
+            result = run(view)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            del view
+            if scratch is None and not ring.valid(frame_number, sequence):
+                # The writer lapped the ring while we were reading
+                results.put((task_name, frame_number, None, elapsed_ms))
+                continue
+            results.put((task_name, frame_number, result, elapsed_ms))
+            last = frame_number
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+class ResultMerger:
+    """
+    Lines up task results by frame number.
+
+    Args:
+        tasks: Names of the tasks reporting results
+        history: Number of recent frames kept while waiting for all tasks
+    """
+
+    def __init__(self, tasks: Iterable[str], history: int = 64):
+        self.tasks = list(tasks)
+        self.history = history
+        self.frames: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.latest: Dict[str, Tuple[int, Any]] = {}
+        self.torn = 0
+
+    def add(self, task_name: str, frame_number: int, result: Any) -> None:
+        if result is None:
+            self.torn += 1
+            return
+        previous = self.latest.get(task_name)
+        if previous is None or previous[0] < frame_number:
+            self.latest[task_name] = (frame_number, result)
+        self.frames.setdefault(frame_number, {})[task_name] = result
+        while len(self.frames) > self.history:
+            self.frames.popitem(last=False)
+
+    def complete(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """
+        Newest frame every task has a result for, as (frame number, {task: result}).
+        """
+        for frame_number in reversed(self.frames):
+            results = self.frames[frame_number]
+            if len(results) == len(self.tasks):
+                return frame_number, results
+        return None
+
+    def merged(self) -> Dict[str, Tuple[int, Any]]:
+        """
+        Newest result of each task with its frame number, whether or not the frames match.
+        """
+        return dict(self.latest)
+
+
+class AnalysisPool:
+    """
+    Runs analysis tasks in worker processes on frames shared through a FrameRing.
+
+    Args:
+        tasks: Task names, or {name: factory kwargs} (see TASKS)
+        size: (width, height) of the stream
+        slots: Ring capacity; more slots make torn reads rarer for slow tasks
+        telemetry: Records each task's time in its worker as "worker_<task>"
+    """
+
+    def __init__(self, tasks: Union[Iterable[str], Dict[str, dict]], size: Tuple[int, int], slots: int = 8,
+                 telemetry=None):
+        tasks = tasks if isinstance(tasks, dict) else {name: {} for name in tasks}
+        unknown = set(tasks) - set(TASKS)
+        if unknown:
+            raise ValueError(f"Unknown analysis tasks {sorted(unknown)}; expected some of {sorted(TASKS)}")
+        for name, kwargs in tasks.items():
+            # Checked here: a worker failing to build its task would just die quietly
+            try:
+                inspect.signature(TASKS[name]).bind(**kwargs)
+            except TypeError as e:
+                raise ValueError(f"Bad arguments for analysis task {name!r}: {e}") from None
+        self.tasks = list(tasks)
+        self.ring = FrameRing(size, slots)
+        self.merger = ResultMerger(tasks)
+        self.telemetry = telemetry
+        # spawn: workers must not inherit the decoder and pipeline threads of a fork
+        context = mp.get_context("spawn")
+        self.__stop = context.Event()
+        self.__results = context.Queue()
+        self.__events = []
+        self.__workers: List[mp.Process] = []
+        for name, kwargs in tasks.items():
+            event = context.Event()
+            worker = context.Process(target=_worker_main, name=f"analysis-{name}", daemon=True,
+                                     args=(self.ring.name, size, slots, name, kwargs, event, self.__stop,
+                                           self.__results))
+            worker.start()
+            self.__events.append(event)
+            self.__workers.append(worker)
+
+    def submit(self, view: FrameView, frame_number: int) -> None:
+        """
+        Publishes a frame to the ring and wakes the workers. Never waits for them.
+        """
+        self.ring.publish(view, frame_number)
+        for event in self.__events:
+            event.set()
+
+    def poll(self) -> ResultMerger:
+        """
+        Collects the results that arrived since the last poll.
+        """
+        while True:
+            try:
+                task_name, frame_number, result, elapsed_ms = self.__results.get_nowait()
+            except queue.Empty:
+                return self.merger
+            self.merger.add(task_name, frame_number, result)
+            if self.telemetry is not None:
+                self.telemetry.record(f"worker_{task_name}", elapsed_ms)
+
+    def alive(self) -> bool:
+        return all(worker.is_alive() for worker in self.__workers)
+
+    def dead(self) -> List[str]:
+        """
+        Tasks whose worker process has exited.
+        """
+        return [name for name, worker in zip(self.tasks, self.__workers) if not worker.is_alive()]
+
+    def close(self) -> None:
+        self.__stop.set()
+        for worker in self.__workers:
+            worker.join(timeout=2.0)
+            if worker.is_alive():
+                worker.terminate()
+        self.__workers = []
+        self.__results.close()
+        self.ring.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import glob
+import os
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from agent.change_map import ChangeMap
+from agent.frame_access import FrameView
+from agent.lazy import lazy_import
+from constants import CARD_SLOT_BOXES, ELIXIR_BAR_BOX, NEXT_CARD_BOX
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+"""
+Card hand and elixir reader.
+
+Cards are recognized against a bank of card images that is prepared once: each
+image is shrunk to a small BGR descriptor, mean-centered and L2-normalized, and
+all descriptors are stacked in one contiguous (cards, dims) float32 matrix.
+Reading the hand builds the same descriptor for every slot and scores all
+slots against all cards with a single matrix product (cosine similarity).
+
+A slot's result is reused while its pixels don't change: either the change map
+says no tile under the slot is dirty, or the slot's descriptor sample is
+identical to the one last scored.
+
+Elixir is the filled fraction of the elixir bar (columns holding the bar's
+magenta), scaled to MAX_ELIXIR.
+"""
+
+Box = Dict[str, int]
+Frame = Union[FrameView, "np.ndarray"]
+
+MAX_ELIXIR = 10
+
+# Descriptor size (w, h) for card images and slots
+DESCRIPTOR_SIZE = (12, 15)
+
+# HSV range of the filled part of the elixir bar (OpenCV hue is 0-179)
+ELIXIR_HUES = (135, 170)
+ELIXIR_MIN_SATURATION = 100
+ELIXIR_MIN_VALUE = 120
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def _descriptor(image: np.ndarray, sample: np.ndarray, out: np.ndarray) -> None:
+    """
+    Shrinks a BGR image into `sample` and writes its normalized descriptor to `out`.
+    """
+    cv2.resize(image, DESCRIPTOR_SIZE, dst=sample, interpolation=cv2.INTER_AREA)
+    out[:] = sample.reshape(-1)
+    out -= out.mean()
+    norm = np.linalg.norm(out)
+    if norm > 0:
+        out /= norm
+
+
+class CardBank:
+    """
+    Precomputed descriptors for a set of card images.
+
+    Args:
+        names: Card names
+        images: BGR card images, in the same order as names
+    """
+
+    def __init__(self, names: Sequence[str], images: Sequence[np.ndarray]):
+        if len(names) != len(images):
+            raise ValueError("names and images must have the same length")
+        self.names: List[str] = list(names)
+        w, h = DESCRIPTOR_SIZE
+        self.descriptors = np.zeros((len(names), w * h * 3), dtype=np.float32)
+        sample = np.empty((h, w, 3), dtype=np.uint8)
+        for row, image in enumerate(images):
+            _descriptor(image, sample, self.descriptors[row])
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_directory(cls, path: str) -> "CardBank":
+        """
+        Loads every image in a directory; the file name (without extension) is the card name.
+        """
+        paths = sorted(p for p in glob.glob(os.path.join(path, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))
+        names, images = [], []
+        for image_path in paths:
+            image = cv2.imread(image_path)
+            if image is None:
+                print(f"⚠️ Could not read card image {image_path}")
+                continue
+            names.append(os.path.splitext(os.path.basename(image_path))[0])
+            images.append(image)
+        return cls(names, images)
+
+
+class HudState(NamedTuple):
+    cards: Tuple[Optional[str], ...]  # card in each slot, None when unrecognized
+    scores: Tuple[float, ...]  # best similarity per slot
+    next_card: Optional[str]
+    elixir: float  # 0 to MAX_ELIXIR
+
+
+class HudReader:
+    """
+    Args:
+        bank: Card bank to recognize cards with
+        slots: Card slot boxes in video px (constants.CARD_SLOT_BOXES by default)
+        next_card: Box of the upcoming card (constants.NEXT_CARD_BOX by default); None to skip it
+        elixir_bar: Box of the elixir bar (constants.ELIXIR_BAR_BOX by default)
+        min_score: Minimum similarity for a slot to count as recognized
+    """
+
+    def __init__(self, bank: CardBank, slots: Optional[Dict[str, Box]] = None,
+                 next_card: Optional[Box] = NEXT_CARD_BOX, elixir_bar: Optional[Box] = None,
+                 min_score: float = 0.6):
+        self.bank = bank
+        self.min_score = min_score
+        boxes = list((CARD_SLOT_BOXES if slots is None else slots).values())
+        if next_card is not None:
+            boxes.append(next_card)
+        self.__boxes = boxes
+        self.__has_next = next_card is not None
+        self.elixir_bar = ELIXIR_BAR_BOX if elixir_bar is None else elixir_bar
+
+        w, h = DESCRIPTOR_SIZE
+        count = len(boxes)
+        self.__samples = np.zeros((count, h, w, 3), dtype=np.uint8)
+        self.__scored = np.zeros_like(self.__samples)
+        self.__descriptors = np.zeros((count, w * h * 3), dtype=np.float32)
+        self.__cards: List[Optional[str]] = [None] * count
+        self.__scores = np.zeros(count, dtype=np.float32)
+        self.__valid = np.zeros(count, dtype=np.bool_)
+        self.__elixir = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def bgr_boxes(self) -> List[Box]:
+        """
+        Boxes read() may read in BGR (card slots and the elixir bar), so a caller
+        can convert them ahead of time with FrameView.prefetch().
+        """
+        return self.__boxes + [self.elixir_bar]
+
+    @staticmethod
+    def __bgr(frame: Frame, box: Box) -> np.ndarray:
+        if isinstance(frame, FrameView):
+            return frame.bgr(box)
+        x, y, w, h = box["x"], box["y"], box["width"], box["height"]
+        return frame[y:y+h, x:x+w]
+
+    def read(self, frame: Frame, changes: Optional[ChangeMap] = None) -> HudState:
+        """
+        Reads the hand and elixir from a frame.
+
+        Args:
+            frame: FrameView of a decoded frame, or a BGR frame in video px
+            changes: Change map already updated with this frame; slots and the
+                elixir bar under clean tiles keep their previous result
+
+        Returns:
+            HudState of the frame
+        """
+        stale = []
+        for slot, box in enumerate(self.__boxes):
+            if self.__valid[slot] and changes is not None and not changes.is_dirty(box):
+                self.hits += 1
+                continue
+            sample = self.__samples[slot]
+            _descriptor(self.__bgr(frame, box), sample, self.__descriptors[slot])
+            if self.__valid[slot] and np.array_equal(sample, self.__scored[slot]):
+                self.hits += 1
+                continue
+            stale.append(slot)
+
+        if stale and len(self.bank):
+            self.misses += len(stale)
+            # (stale slots, dims) @ (dims, cards): every slot against every card at once
+            scores = self.__descriptors[stale] @ self.bank.descriptors.T
+            best = scores.argmax(axis=1)
+            for row, slot in enumerate(stale):
+                score = float(scores[row, best[row]])
+                self.__scores[slot] = score
+                self.__cards[slot] = self.bank.names[best[row]] if score >= self.min_score else None
+                self.__scored[slot] = self.__samples[slot]
+                self.__valid[slot] = True
+
+        if changes is None or changes.is_dirty(self.elixir_bar):
+            self.__elixir = self.read_elixir(frame)
+
+        hand = len(self.__boxes) - 1 if self.__has_next else len(self.__boxes)
+        return HudState(
+            cards=tuple(self.__cards[:hand]),
+            scores=tuple(float(s) for s in self.__scores[:hand]),
+            next_card=self.__cards[hand] if self.__has_next else None,
+            elixir=self.__elixir,
+        )
+
+    def read_elixir(self, frame: Frame) -> float:
+        """
+        Elixir from the filled fraction of the elixir bar.
+        """
+        hsv = cv2.cvtColor(self.__bgr(frame, self.elixir_bar), cv2.COLOR_BGR2HSV)
+        low, high = ELIXIR_HUES
+        mask = cv2.inRange(hsv, (low, ELIXIR_MIN_SATURATION, ELIXIR_MIN_VALUE), (high, 255, 255))
+        # A column counts as filled when most of it is bar colored
+        filled = np.count_nonzero(cv2.reduce(mask, 0, cv2.REDUCE_AVG) > 127)
+        return float(MAX_ELIXIR * filled / mask.shape[1])
@@ -0,0 +1,75 @@
+import importlib.util
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Iterable, Optional
+
+"""
+Lazy imports for the heavy dependencies (cv2, av, numpy, pydantic).
+
+    cv2 = lazy_import("cv2")
+
+binds a module object right away, but the module only runs (and pulls in its
+shared libraries) on the first attribute access, e.g. the first cv2.cvtColor
+call. Importing agent or tokenizer modules therefore does no work, and
+commands that never touch a dependency never pay for it.
+
+Modules that are already imported are returned as they are, so a module that is
+still imported eagerly somewhere keeps working unchanged.
+
+preload() forces modules in a background thread, which is how the warm start
+overlaps library loading with connecting to the device.
+"""
+
+# Dependencies worth preloading before the first frame
+HEAVY_MODULES = ("numpy", "cv2", "av")
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Returns the module `name`, deferring its execution until first attribute access.
+
+    Raises:
+        ModuleNotFoundError: The module is not installed (checked without importing it)
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def load(*modules: ModuleType) -> None:
+    """
+    Forces lazily imported modules to execute now.
+    """
+    for module in modules:
+        getattr(module, "__dict__")
+
+
+def preload(names: Iterable[str] = HEAVY_MODULES, timings: Optional[Dict[str, float]] = None) -> threading.Thread:
+    """
+    Imports modules on a daemon thread and returns the (started) thread.
+
+    Args:
+        names: Modules to import, in order
+        timings: If given, filled with the import time of each module in ms
+    """
+    def run():
+        for name in names:
+            start = time.perf_counter()
+            load(lazy_import(name))
+            if timings is not None:
+                timings[name] = (time.perf_counter() - start) * 1000
+
+    thread = threading.Thread(target=run, name="preload", daemon=True)
+    thread.start()
+    return thread
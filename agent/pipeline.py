@@ -0,0 +1,240 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+
+from agent.telemetry import Telemetry
+
+"""
+Pipelined frame processing for the play loop.
+
+Decoding, BGR conversion, analysis and preview run as separate stages connected
+by bounded queues. Every queue keeps only the newest items: when a downstream
+stage falls behind, the oldest waiting frame is dropped instead of queued, so
+the policy always sees the latest frame and latency stays flat under load.
+"""
+
+_STOP = object()
+
+
+class StageItem(NamedTuple):
+    frame_number: int
+    decoded_at: float  # time.perf_counter() when the frame left the decoder
+    payload: Any
+
+
+class LatestQueue:
+    """
+    Bounded queue that drops its oldest item when a new one arrives while full.
+
+    close() marks the end of the stream without taking a slot, so the last real
+    item is still delivered; get() returns _STOP once the queue is closed and empty.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.name = name
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque(maxlen=maxsize)
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, item) -> None:
+        with self._cond:
+            if len(self._items) == self.maxsize:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def get(self, timeout: Optional[float] = None):
+        """
+        Returns the oldest waiting item, or _STOP once closed and drained, raising
+        queue.Empty on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                raise queue.Empty
+            return self._items.popleft() if self._items else _STOP
+
+    def depth(self) -> int:
+        return len(self._items)
+
+
+class FramePipeline:
+    """
+    Runs decode -> convert -> process -> display as concurrent stages.
+
+    Decode, convert and process each run on their own thread. Display runs on the
+    calling thread because OpenCV's GUI functions must stay on the main thread.
+
+    Args:
+        frames: Iterable of decoded frames (e.g. container.decode(video=0))
+        convert: Turns a decoded frame into the array the analysis stage needs
+        process: Analyses a converted frame and returns what should be displayed
+        display: Shows a processed frame; returning False stops the pipeline
+        queue_size: Capacity of each inter-stage queue
+        report_interval: Seconds between queue depth / drop count reports (0 disables)
+        telemetry: Records per-stage timings ("decode", "convert", "process", "display")
+            and decode-to-decision "latency"
+    """
+
+    def __init__(
+        self,
+        frames: Iterable,
+        convert: Callable[[Any], Any],
+        process: Callable[[Any], Any],
+        display: Optional[Callable[[Any], bool]] = None,
+        queue_size: int = 1,
+        report_interval: float = 1.0,
+        telemetry: Optional[Telemetry] = None,
+    ):
+        self.__frames = frames
+        self.__convert = convert
+        self.__process = process
+        self.__display = display
+        self.__report_interval = report_interval
+        self.__telemetry = telemetry if telemetry is not None else Telemetry(enabled=False)
+
+        self.decoded_queue = LatestQueue("decoded", queue_size)
+        self.converted_queue = LatestQueue("converted", queue_size)
+        self.processed_queue = LatestQueue("processed", queue_size)
+
+        self.frames_decoded = 0
+        self.frames_processed = 0
+        self.frames_displayed = 0
+        self.__latency_total_ms = 0.0
+        self.__latency_max_ms = 0.0
+
+        self.__stop_event = threading.Event()
+        self.__error: Optional[BaseException] = None
+        self.__threads: list = []
+
+    @property
+    def queues(self) -> tuple:
+        return (self.decoded_queue, self.converted_queue, self.processed_queue)
+
+    def stop(self) -> None:
+        self.__stop_event.set()
+
+    def stats(self) -> dict:
+        """
+        Snapshot of queue depths, drop counts and decode-to-decision latency.
+        """
+        processed = self.frames_processed
+        return {
+            "decoded": self.frames_decoded,
+            "processed": processed,
+            "displayed": self.frames_displayed,
+            "queue_depth": {q.name: q.depth() for q in self.queues},
+            "dropped": {q.name: q.dropped for q in self.queues},
+            "latency_avg_ms": self.__latency_total_ms / processed if processed else 0.0,
+            "latency_max_ms": self.__latency_max_ms,
+        }
+
+    def __decode_stage(self) -> None:
+        frames = iter(self.__frames)
+        while not self.__stop_event.is_set():
+            with self.__telemetry.stage("decode"):
+                frame = next(frames, None)
+            if frame is None:
+                break
+            self.frames_decoded += 1
+            self.decoded_queue.put(StageItem(self.frames_decoded, time.perf_counter(), frame))
+        self.decoded_queue.close()
+
+    def __convert_stage(self) -> None:
+        self.__run_stage("convert", self.decoded_queue, self.converted_queue, self.__convert)
+
+    def __process_stage(self) -> None:
+        self.__run_stage("process", self.converted_queue, self.processed_queue, self.__process, record_latency=True)
+
+    def __run_stage(self, name: str, source: LatestQueue, sink: LatestQueue, work: Callable,
+                    record_latency: bool = False) -> None:
+        while not self.__stop_event.is_set():
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                break
+            with self.__telemetry.stage(name):
+                result = work(item.payload)
+            if record_latency:
+                latency_ms = (time.perf_counter() - item.decoded_at) * 1000
+                self.__telemetry.record("latency", latency_ms)
+                self.frames_processed += 1
+                self.__latency_total_ms += latency_ms
+                self.__latency_max_ms = max(self.__latency_max_ms, latency_ms)
+            sink.put(item._replace(payload=result))
+        sink.close()
+
+    def __guard(self, target: Callable) -> Callable:
+        def run():
+            try:
+                target()
+            except BaseException as e:
+                self.__error = e
+                self.__stop_event.set()
+                self.processed_queue.close()
+
+        return run
+
+    def __report(self) -> None:
+        stats = self.stats()
+        depths = " ".join(f"{name}={depth}" for name, depth in stats["queue_depth"].items())
+        drops = " ".join(f"{name}={count}" for name, count in stats["dropped"].items())
+        print(f"Pipeline - Frames: {stats['processed']}/{stats['decoded']} | "
+              f"Depth: {depths} | Dropped: {drops} | "
+              f"Latency avg: {stats['latency_avg_ms']:.2f}ms max: {stats['latency_max_ms']:.2f}ms")
+
+    def run(self) -> dict:
+        """
+        Runs the pipeline until the stream ends, display returns False or stop() is called.
+
+        Returns:
+            Final stats (see stats())
+        """
+        for target in (self.__decode_stage, self.__convert_stage, self.__process_stage):
+            thread = threading.Thread(target=self.__guard(target), daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+        last_report = time.perf_counter()
+        try:
+            while not self.__stop_event.is_set():
+                try:
+                    item = self.processed_queue.get(timeout=0.1)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    break
+                if item is not None:
+                    self.frames_displayed += 1
+                    if self.__display is not None:
+                        with self.__telemetry.stage("display"):
+                            keep_going = self.__display(item.payload)
+                        if keep_going is False:
+                            break
+                    self.__telemetry.maybe_report()
+
+                now = time.perf_counter()
+                if self.__report_interval and now - last_report >= self.__report_interval:
+                    self.__report()
+                    last_report = now
+        finally:
+            self.__stop_event.set()
+            for thread in self.__threads:
+                thread.join(timeout=1.0)
+
+        if self.__error is not None:
+            raise self.__error
+        return self.stats()
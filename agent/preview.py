@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import queue
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from agent.frame_access import FrameView
+from agent.lazy import lazy_import
+from constants import VIDEO_HEIGHT_PX, VIDEO_WIDTH_PX
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+"""
+Preview output for the play loop, kept off the hot path.
+
+    headless - nothing is shown and nothing is converted for display
+    window   - a separate viewer process shows frames at up to `fps`; frames are
+               passed through a shared memory buffer and overlays through a queue,
+               tagged with the sequence number of the frame they belong to
+    snapshot - like headless, but the latest frame (with overlays) is written to
+               disk on demand: call snapshot() or send the process SIGUSR1
+
+publish() is cheap when no frame is due: a FrameView is only converted to BGR,
+and the optional render step only runs, when the viewer is about to get a new
+frame. Overlays (boxes and labels) are drawn by the viewer process, not by the
+caller.
+"""
+
+MODES = ("headless", "window", "snapshot")
+
+Box = Dict[str, int]
+Frame = Union[FrameView, "np.ndarray"]
+# {"box": {...}, "color": (b, g, r), "label": "..."}; color and label are optional
+Overlay = Dict[str, object]
+Overlays = Union[Sequence[Overlay], Callable[[], Sequence[Overlay]], None]
+
+OVERLAY_COLOR = (0, 255, 0)
+
+
+def draw_overlays(image: np.ndarray, overlays: Sequence[Overlay]) -> np.ndarray:
+    """
+    Draws overlay boxes and labels onto an image in place.
+    """
+    for overlay in overlays:
+        box = overlay["box"]
+        color = overlay.get("color", OVERLAY_COLOR)
+        x, y, w, h = box["x"], box["y"], box["width"], box["height"]
+        cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
+        label = overlay.get("label")
+        if label:
+            cv2.putText(image, str(label), (x, max(y - 6, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1)
+    return image
+
+
+def _viewer_main(shm_name: str, shape: Tuple[int, int, int], lock, sequence, closed, overlay_queue, fps: float,
+                 title: str) -> None:
+    """
+    Viewer process: shows the shared frame whenever its sequence number changes,
+    with the overlays published for that frame. The overlays travel separately and
+    may arrive after the frame; it is then shown bare and redrawn once they do.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        shared = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        image = np.empty(shape, dtype=np.uint8)
+        canvas = np.empty(shape, dtype=np.uint8)
+        # Overlay lists by the sequence number of their frame
+        pending: Dict[int, List[Overlay]] = {}
+        shown = 0
+        drawn = True
+        interval = 1.0 / fps
+        cv2.namedWindow(title, cv2.WINDOW_AUTOSIZE)
+        while not closed.is_set():
+            tick = time.perf_counter()
+            try:
+                while True:
+                    frame_sequence, overlays = overlay_queue.get_nowait()
+                    pending[frame_sequence] = overlays
+            except queue.Empty:
+                pass
+            if sequence.value != shown:
+                with lock:
+                    shown = sequence.value
+                    image[:] = shared
+                canvas[:] = image
+                cv2.imshow(title, draw_overlays(canvas, pending.get(shown, [])))
+                drawn = shown in pending
+            elif not drawn and shown in pending:
+                canvas[:] = image
+                cv2.imshow(title, draw_overlays(canvas, pending[shown]))
+                drawn = True
+            for frame_sequence in [s for s in pending if s < shown]:
+                del pending[frame_sequence]
+
+            remaining = interval - (time.perf_counter() - tick)
+            key = cv2.waitKey(max(int(remaining * 1000), 1)) & 0xFF
+            if key == ord('q') or cv2.getWindowProperty(title, cv2.WND_PROP_VISIBLE) < 1:
+                closed.set()
+        cv2.destroyAllWindows()
+    finally:
+        shm.close()
+
+
+class Preview:
+    """
+    Args:
+        mode: "headless", "window" or "snapshot"
+        fps: Maximum frame rate sent to the viewer
+        size: (width, height) of the viewer image; frames of another size are resized
+        title: Viewer window title
+        snapshot_dir: Directory snapshots are written to
+    """
+
+    def __init__(self, mode: str = "headless", fps: float = 10.0,
+                 size: Tuple[int, int] = (VIDEO_WIDTH_PX, VIDEO_HEIGHT_PX), title: str = "Android Screen",
+                 snapshot_dir: str = "snapshots"):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.mode = mode
+        self.interval = 1.0 / fps
+        self.size = size
+        self.title = title
+        self.snapshot_dir = snapshot_dir
+        self.frames_sent = 0
+        self.snapshots_written = 0
+
+        self.__last_sent = 0.0
+        self.__latest: Optional[Frame] = None
+        self.__latest_overlays: Overlays = None
+        self.__latest_render: Optional[Callable[[np.ndarray], np.ndarray]] = None
+        self.__snapshot_requested = threading.Event()
+
+        self.__process: Optional[mp.Process] = None
+        self.__shm: Optional[shared_memory.SharedMemory] = None
+        if mode == "window":
+            self.__start_viewer()
+        elif mode == "snapshot" and hasattr(signal, "SIGUSR1") \
+                and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda *_: self.__snapshot_requested.set())
+            print(f"📷 Send SIGUSR1 to {os.getpid()} for a snapshot")
+
+    def __start_viewer(self) -> None:
+        width, height = self.size
+        shape = (height, width, 3)
+        # spawn: the viewer gets a fresh OpenCV GUI state instead of a forked copy
+        context = mp.get_context("spawn")
+        self.__shm = shared_memory.SharedMemory(create=True, size=height * width * 3)
+        self.__shared = np.ndarray(shape, dtype=np.uint8, buffer=self.__shm.buf)
+        self.__lock = context.Lock()
+        self.__sequence = context.Value("Q", 0, lock=False)
+        self.__closed = context.Event()
+        self.__overlay_queue = context.Queue(maxsize=4)
+        self.__process = context.Process(
+            target=_viewer_main,
+            args=(self.__shm.name, shape, self.__lock, self.__sequence, self.__closed, self.__overlay_queue,
+                  1.0 / self.interval, self.title),
+            daemon=True,
+        )
+        self.__process.start()
+
+    @property
+    def closed(self) -> bool:
+        """
+        True once the viewer window was closed (or 'q' pressed in it).
+        """
+        return self.__process is not None and self.__closed.is_set()
+
+    def due(self) -> bool:
+        """
+        Whether the next publish() would send a frame to the viewer.
+        """
+        return self.mode == "window" and time.perf_counter() - self.__last_sent >= self.interval
+
+    @staticmethod
+    def __image(frame: Frame, render: Optional[Callable[[np.ndarray], np.ndarray]]) -> np.ndarray:
+        image = frame.bgr() if isinstance(frame, FrameView) else frame
+        return render(image) if render is not None else image
+
+    @staticmethod
+    def __overlay_list(overlays: Overlays) -> List[Overlay]:
+        if overlays is None:
+            return []
+        return list(overlays() if callable(overlays) else overlays)
+
+    def publish(self, frame: Frame, overlays: Overlays = None,
+                render: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> bool:
+        """
+        Offers a frame to the preview.
+
+        Args:
+            frame: FrameView or BGR frame
+            overlays: Overlay list, or a callable returning one (only called when
+                the overlays are actually needed)
+            render: Optional BGR -> BGR step (e.g. background highlighting) run
+                only for frames that get shown or saved
+
+        Returns:
+            False once the viewer was closed, True otherwise
+        """
+        self.__latest, self.__latest_overlays, self.__latest_render = frame, overlays, render
+        if self.__snapshot_requested.is_set():
+            self.__snapshot_requested.clear()
+            self.snapshot()
+
+        if not self.due():
+            return not self.closed
+        if self.__process is None or self.closed:
+            return False
+        if not self.__process.is_alive():
+            print(f"⚠️ Preview viewer exited (code {self.__process.exitcode})")
+            self.__closed.set()
+            return False
+        # Never wait on the viewer: if it is copying the last frame, skip this one
+        if not self.__lock.acquire(block=False):
+            return True
+        try:
+            self.__last_sent = time.perf_counter()
+            image = self.__image(frame, render)
+            if image.shape == self.__shared.shape:
+                self.__shared[:] = image
+            else:
+                cv2.resize(image, self.size, dst=self.__shared)
+            self.__sequence.value += 1
+            sent = self.__sequence.value
+        finally:
+            self.__lock.release()
+
+        overlay_list = self.__overlay_list(overlays)
+        if overlay_list and image.shape != self.__shared.shape:
+            overlay_list = self.__scale_overlays(overlay_list, image.shape)
+        try:
+            self.__overlay_queue.put_nowait((sent, overlay_list))
+        except queue.Full:
+            pass
+        self.frames_sent += 1
+        return True
+
+    def __scale_overlays(self, overlays: List[Overlay], shape: Tuple[int, ...]) -> List[Overlay]:
+        sx, sy = self.size[0] / shape[1], self.size[1] / shape[0]
+        scaled = []
+        for overlay in overlays:
+            b = overlay["box"]
+            box = {"x": int(b["x"] * sx), "y": int(b["y"] * sy),
+                   "width": int(b["width"] * sx), "height": int(b["height"] * sy)}
+            scaled.append({**overlay, "box": box})
+        return scaled
+
+    def snapshot(self, path: Optional[str] = None) -> Optional[str]:
+        """
+        Writes the latest published frame, rendered and with overlays, to disk.
+
+        Returns:
+            Path written, or None if no frame was published yet
+        """
+        if self.__latest is None:
+            return None
+        image = self.__image(self.__latest, self.__latest_render)
+        image = draw_overlays(image.copy(), self.__overlay_list(self.__latest_overlays))
+        if path is None:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            path = os.path.join(self.snapshot_dir, f"snapshot_{time.strftime('%Y%m%d_%H%M%S')}_"
+                                                   f"{self.snapshots_written:04d}.png")
+        cv2.imwrite(path, image)
+        self.snapshots_written += 1
+        print(f"📷 Snapshot saved to {path}")
+        return path
+
+    def close(self) -> None:
+        if self.__process is not None:
+            self.__closed.set()
+            self.__process.join(timeout=2.0)
+            if self.__process.is_alive():
+                self.__process.terminate()
+            self.__process = None
+            self.__overlay_queue.close()
+        if self.__shm is not None:
+            self.__shared = None
+            self.__shm.close()
+            self.__shm.unlink()
+            self.__shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
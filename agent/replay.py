@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import argparse
+import io
+import socket
+import struct
+import threading
+import time
+from fractions import Fraction
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from agent.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+"""
+Recording and replay of the scrcpy video socket.
+
+StreamRecorder stores every byte read from the video socket (device name,
+codec header and raw H.264) in chunks tagged with their arrival time.
+ReplayServer stands in for the scrcpy server on 127.0.0.1:27183: it accepts the
+video and control connections in the same order the agent opens them and sends
+a recorded or generated stream back, either at recorded speed or as fast as
+the client reads. Together they let the agent pipeline be benchmarked without
+an emulator.
+
+Usage:
+    python -m agent.replay generate videos/vid_2.mp4 recordings/vid_2.bin
+    python -m agent.replay serve recordings/vid_2.bin [--fast] [--loop]
+"""
+
+MAGIC = b"CLASHREC"
+VERSION = 1
+_FILE_HEADER = struct.Struct(">8sH")
+_CHUNK_HEADER = struct.Struct(">QI")  # microseconds since start, length
+
+DEVICE_NAME_LENGTH = 64
+CODEC_H264 = 0x68323634  # "h264"
+VIDEO_HEADER = struct.Struct(">III")  # codec id, width, height
+HANDSHAKE_LENGTH = DEVICE_NAME_LENGTH + VIDEO_HEADER.size
+
+
+def handshake_bytes(device_name: str, width: int, height: int, codec: int = CODEC_H264) -> bytes:
+    """
+    Device name (NUL-padded to 64 bytes) followed by the 12-byte codec header,
+    as read by ClashAgent.__connect_socket.
+    """
+    name = device_name.encode("utf-8")[:DEVICE_NAME_LENGTH - 1]
+    return name.ljust(DEVICE_NAME_LENGTH, b"\x00") + VIDEO_HEADER.pack(codec, width, height)
+
+
+class StreamRecorder:
+    """
+    Appends timestamped chunks of socket data to a recording file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__file = open(path, "wb")
+        self.__file.write(_FILE_HEADER.pack(MAGIC, VERSION))
+        self.__start = time.perf_counter()
+        self.bytes_written = 0
+
+    def write(self, data: bytes, timestamp: Optional[float] = None) -> None:
+        """
+        Args:
+            data: Bytes as they came off the socket
+            timestamp: Seconds since the start of the recording (defaults to now)
+        """
+        if not data:
+            return
+        if timestamp is None:
+            timestamp = time.perf_counter() - self.__start
+        self.__file.write(_CHUNK_HEADER.pack(int(timestamp * 1_000_000), len(data)))
+        self.__file.write(data)
+        self.bytes_written += len(data)
+
+    def close(self) -> None:
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class RecordingReader(io.RawIOBase):
+    """
+    Raw stream wrapper that copies everything read from the socket into a recorder.
+    Pass it to av.open in place of the socket file.
+    """
+
+    def __init__(self, raw, recorder: StreamRecorder):
+        self.__raw = raw
+        self.__recorder = recorder
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self.__raw.readinto(buffer)
+        if n:
+            self.__recorder.write(bytes(memoryview(buffer)[:n]))
+        return n
+
+    def close(self) -> None:
+        self.__recorder.close()
+        super().close()
+
+
+def read_recording(path: str) -> Iterator[Tuple[float, bytes]]:
+    """
+    Yields (seconds since start, data) chunks from a recording file.
+    """
+    with open(path, "rb") as f:
+        magic, version = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a stream recording")
+        if version != VERSION:
+            raise ValueError(f"Unsupported recording version {version}")
+        while True:
+            header = f.read(_CHUNK_HEADER.size)
+            if len(header) < _CHUNK_HEADER.size:
+                return
+            timestamp_us, length = _CHUNK_HEADER.unpack(header)
+            yield timestamp_us / 1_000_000, f.read(length)
+
+
+def encode_stream(frames: Iterable[np.ndarray], path: str, fps: float = 30.0,
+                  bit_rate: int = 2_000_000, device_name: str = "replay") -> int:
+    """
+    Encodes BGR frames to raw H.264 and writes them as a recording, handshake
+    included, with one chunk per encoded packet timed at the frame rate.
+
+    Returns:
+        Number of frames encoded
+    """
+    import av
+
+    codec = None
+    count = 0
+    with StreamRecorder(path) as recorder:
+        for frame in frames:
+            if codec is None:
+                height, width = frame.shape[:2]
+                codec = av.CodecContext.create("libx264", "w")
+                codec.width, codec.height = width, height
+                codec.pix_fmt = "yuv420p"
+                codec.bit_rate = bit_rate
+                codec.options = {"preset": "ultrafast", "tune": "zerolatency"}
+                # Without a time base and frame pts every frame after the first is encoded as a repeat
+                codec.time_base = Fraction(1, 1) / Fraction(fps).limit_denominator(1001)
+                recorder.write(handshake_bytes(device_name, width, height), timestamp=0.0)
+            video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+            video_frame.pts = count
+            for packet in codec.encode(video_frame):
+                recorder.write(bytes(packet), timestamp=count / fps)
+            count += 1
+        if codec is not None:
+            for packet in codec.encode(None):
+                recorder.write(bytes(packet), timestamp=count / fps)
+    return count
+
+
+def generate_from_video(video_path: str, path: str, fps: Optional[float] = None, **kwargs) -> int:
+    """
+    Re-encodes a recorded match video (e.g. videos/vid_2.mp4) into a replayable stream.
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Could not open video file at {video_path}")
+    fps = fps or cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    def frames():
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+
+    try:
+        return encode_stream(frames(), path, fps=fps, **kwargs)
+    finally:
+        cap.release()
+
+
+class ReplayServer:
+    """
+    Local stand-in for the scrcpy server.
+
+    Accepts a video connection followed by a control connection, then sends the
+    recording over the video socket. Control messages are read and passed to
+    on_control (or discarded).
+
+    Args:
+        path: Recording file (from StreamRecorder or encode_stream)
+        host, port: Address to listen on (scrcpy's forward port by default)
+        realtime: Send chunks at their recorded times; otherwise as fast as possible
+        loop: Restart the recording when it ends, instead of closing the connection
+        on_control: Called with each chunk of bytes received on the control socket
+    """
+
+    def __init__(self, path: str, host: str = "127.0.0.1", port: int = 27183, realtime: bool = True,
+                 loop: bool = False, on_control: Optional[Callable[[bytes], None]] = None):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.realtime = realtime
+        self.loop = loop
+        self.on_control = on_control
+        self.bytes_sent = 0
+        self.sessions = 0
+
+        self.__chunks: List[Tuple[float, bytes]] = list(read_recording(path))
+        self.__server: Optional[socket.socket] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__stop_event = threading.Event()
+
+    def start(self) -> "ReplayServer":
+        """
+        Starts listening and serving clients on a background thread.
+        """
+        self.__server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__server.bind((self.host, self.port))
+        self.__server.listen(2)
+        self.__server.settimeout(0.2)
+        self.port = self.__server.getsockname()[1]
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__stop_event.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout=2.0)
+        if self.__server is not None:
+            self.__server.close()
+
+    def __accept(self) -> Optional[socket.socket]:
+        while not self.__stop_event.is_set():
+            try:
+                connection, _ = self.__server.accept()
+                connection.settimeout(None)
+                return connection
+            except socket.timeout:
+                continue
+        return None
+
+    def serve_forever(self) -> None:
+        while not self.__stop_event.is_set():
+            video = self.__accept()
+            if video is None:
+                return
+            control = self.__accept()
+            if control is None:
+                video.close()
+                return
+            self.sessions += 1
+            threading.Thread(target=self.__drain_control, args=(control,), daemon=True).start()
+            try:
+                self.__send(video)
+            except (BrokenPipeError, ConnectionResetError):
+                print("Replay client disconnected")
+            finally:
+                video.close()
+                control.close()
+
+    def __drain_control(self, control: socket.socket) -> None:
+        try:
+            while True:
+                data = control.recv(4096)
+                if not data:
+                    return
+                if self.on_control is not None:
+                    self.on_control(data)
+        except OSError:
+            return
+
+    def __send(self, video: socket.socket) -> None:
+        first_pass = True
+        while first_pass or self.loop:
+            start = time.perf_counter()
+            # The handshake is only sent once per connection when looping
+            skip = 0 if first_pass else HANDSHAKE_LENGTH
+            for timestamp, data in self.__chunks:
+                if self.__stop_event.is_set():
+                    return
+                if skip:
+                    trimmed = min(skip, len(data))
+                    data, skip = data[trimmed:], skip - trimmed
+                    if not data:
+                        continue
+                if self.realtime:
+                    delay = timestamp - (time.perf_counter() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+                video.sendall(data)
+                self.bytes_sent += len(data)
+            first_pass = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay scrcpy video streams")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="Encode a video file into a replayable stream")
+    generate.add_argument("video")
+    generate.add_argument("output")
+    generate.add_argument("--fps", type=float, default=None)
+    generate.add_argument("--bit-rate", type=int, default=2_000_000)
+
+    serve = subparsers.add_parser("serve", help="Serve a recording as a scrcpy stand-in")
+    serve.add_argument("recording")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=27183)
+    serve.add_argument("--fast", action="store_true", help="Send as fast as possible instead of in real time")
+    serve.add_argument("--loop", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        count = generate_from_video(args.video, args.output, fps=args.fps, bit_rate=args.bit_rate)
+        print(f"✅ Encoded {count} frames to {args.output}")
+    else:
+        server = ReplayServer(args.recording, host=args.host, port=args.port,
+                              realtime=not args.fast, loop=args.loop).start()
+        print(f"📡 Replaying {args.recording} on {args.host}:{server.port} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\n👋 Stopping replay server...")
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from agent.telemetry import Telemetry
+
+"""
+Deadline-aware scheduling of perception and decision-making.
+
+Perception tasks (towers, troops, HUD) run on the frame thread, each at its own
+rate and within its own time budget per frame. The policy runs on a separate
+thread at a fixed tick against a snapshot of the latest task results, so a slow
+frame delays perception, never actions.
+
+A task is skipped for a frame when its recent cost (an exponential average of
+its run times) does not fit its budget or what is left of the frame budget.
+A task that overruns its budget keeps its result but is skipped for as many
+frames as it overran by, so its average cost stays within budget. Whenever a
+due task is skipped, its previous result is marked stale; the policy sees that
+in the snapshot and can decide whether to act on old information. Results also
+go stale on their own once older than the task's max_age.
+
+Results computed elsewhere (e.g. by the worker processes in agent/frame_ring.py)
+are handed in with deliver() and treated the same way.
+"""
+
+# Weight of the newest run time in a task's cost estimate
+COST_SMOOTHING = 0.2
+
+
+class TaskResult(NamedTuple):
+    value: Any
+    frame_number: int
+    timestamp: float  # clock() when the task's frame was handed to the scheduler
+    elapsed_ms: float
+    stale: bool
+
+
+class WorldState(NamedTuple):
+    """
+    What the policy sees on a tick.
+    """
+    tick: int
+    time: float  # clock() at the start of the tick
+    results: Dict[str, TaskResult]
+
+    def value(self, name: str, default: Any = None, fresh_only: bool = False) -> Any:
+        """
+        Latest value of a task, or `default` if there is none (or it is stale and fresh_only is set).
+        """
+        result = self.results.get(name)
+        if result is None or (fresh_only and result.stale):
+            return default
+        return result.value
+
+
+class PerceptionTask:
+    """
+    Args:
+        name: Key of the task's results in WorldState.results
+        run: Called with the frame; returns the task's result
+        rate: Maximum runs per second; None runs on every frame
+        budget_ms: Time the task may take on one frame
+        max_age: Seconds after which a result is stale even if nothing was
+            skipped; defaults to three periods of `rate`, or one second
+        probe_every: Consecutive budget skips after which the task runs anyway,
+            so its cost estimate can recover once frames get cheaper
+    """
+
+    def __init__(self, name: str, run: Callable[[Any], Any], rate: Optional[float] = None, budget_ms: float = 5.0,
+                 max_age: Optional[float] = None, probe_every: int = 10):
+        self.name = name
+        self.run = run
+        self.period = 1.0 / rate if rate else 0.0
+        self.budget_ms = budget_ms
+        self.max_age = max_age if max_age is not None else (3 * self.period if rate else 1.0)
+        self.probe_every = probe_every
+
+        self.cost_ms = 0.0
+        self.next_due = 0.0
+        self.backoff = 0  # frames left to skip after an overrun
+        self.skipped_in_row = 0
+        self.runs = 0
+        self.skipped = 0
+        self.overruns = 0
+
+    def due(self, now: float) -> bool:
+        return now >= self.next_due
+
+    def fits(self, remaining_ms: float) -> bool:
+        """
+        Whether the task's expected cost fits its budget and the time left in the frame.
+        """
+        if self.backoff > 0:
+            return False
+        if self.skipped_in_row >= self.probe_every:
+            return True
+        return self.cost_ms <= min(self.budget_ms, remaining_ms)
+
+    def record(self, elapsed_ms: float) -> None:
+        self.runs += 1
+        self.skipped_in_row = 0
+        self.cost_ms = elapsed_ms if self.runs == 1 else \
+            self.cost_ms + COST_SMOOTHING * (elapsed_ms - self.cost_ms)
+        if elapsed_ms > self.budget_ms:
+            self.overruns += 1
+            self.backoff = int(elapsed_ms // self.budget_ms)
+
+    def skip(self) -> None:
+        self.skipped += 1
+        self.skipped_in_row += 1
+        if self.backoff > 0:
+            self.backoff -= 1
+
+
+class SchedulerConfig(NamedTuple):
+    """
+    Scheduling options handed through to TickScheduler.
+    """
+    tick_hz: float = 10.0  # policy ticks per second
+    frame_budget_ms: Optional[float] = None  # all tasks together, per frame; None only applies task budgets
+
+
+class TickScheduler:
+    """
+    Args:
+        policy: Called with a WorldState on every tick; None runs perception only
+        tick_hz: Policy ticks per second
+        frame_budget_ms: Time all tasks together may take per frame; None only
+            applies the per-task budgets
+        telemetry: Records "task_<name>" run times, "policy" run times and
+            "tick_lag" (how late each tick started)
+        clock: Time source in seconds
+    """
+
+    def __init__(self, policy: Optional[Callable[[WorldState], None]] = None, tick_hz: float = 10.0,
+                 frame_budget_ms: Optional[float] = None, telemetry: Optional[Telemetry] = None,
+                 clock: Callable[[], float] = time.perf_counter):
+        self.policy = policy
+        self.tick_interval = 1.0 / tick_hz
+        self.frame_budget_ms = frame_budget_ms
+        self.telemetry = telemetry if telemetry is not None else Telemetry(enabled=False)
+        self.clock = clock
+        self.tasks: Dict[str, PerceptionTask] = {}
+        self.ticks = 0
+        self.late_ticks = 0
+
+        self.__results: Dict[str, TaskResult] = {}
+        self.__stale: Dict[str, bool] = {}
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def add_task(self, name: str, run: Callable[[Any], Any], **kwargs) -> PerceptionTask:
+        """
+        Adds a perception task (see PerceptionTask for the options). Tasks run in
+        the order they were added, so earlier tasks get first claim on the frame budget.
+        """
+        task = PerceptionTask(name, run, **kwargs)
+        self.tasks[name] = task
+        return task
+
+    def on_frame(self, frame: Any, frame_number: int) -> List[str]:
+        """
+        Runs the tasks that are due on a frame, within their budgets.
+
+        Returns:
+            Names of the tasks that ran
+        """
+        start = self.clock()
+        ran = []
+        for task in self.tasks.values():
+            now = self.clock()
+            if not task.due(now):
+                continue
+            remaining_ms = float("inf") if self.frame_budget_ms is None else \
+                self.frame_budget_ms - (now - start) * 1000
+            if not task.fits(remaining_ms):
+                task.skip()
+                with self.__lock:
+                    self.__stale[task.name] = True
+                continue
+
+            value = task.run(frame)
+            elapsed_ms = (self.clock() - now) * 1000
+            task.record(elapsed_ms)
+            task.next_due = now + task.period
+            self.telemetry.record(f"task_{task.name}", elapsed_ms)
+            self.__store(task.name, TaskResult(value, frame_number, start, elapsed_ms, False))
+            ran.append(task.name)
+        return ran
+
+    def deliver(self, name: str, frame_number: int, value: Any, timestamp: Optional[float] = None,
+                elapsed_ms: float = 0.0) -> bool:
+        """
+        Hands in a result computed outside on_frame(). Results for frames older
+        than the one already held are ignored.
+
+        Returns:
+            True if the result replaced the previous one
+        """
+        previous = self.__results.get(name)
+        if previous is not None and previous.frame_number >= frame_number:
+            return False
+        timestamp = self.clock() if timestamp is None else timestamp
+        self.__store(name, TaskResult(value, frame_number, timestamp, elapsed_ms, False))
+        return True
+
+    def __store(self, name: str, result: TaskResult) -> None:
+        with self.__lock:
+            self.__results[name] = result
+            self.__stale[name] = False
+
+    def snapshot(self, tick: int = -1) -> WorldState:
+        """
+        Latest result of every task, with stale flags as of now.
+        """
+        now = self.clock()
+        with self.__lock:
+            results = dict(self.__results)
+            stale = dict(self.__stale)
+        for name, result in results.items():
+            task = self.tasks.get(name)
+            max_age = task.max_age if task is not None else 1.0
+            if stale.get(name) or now - result.timestamp > max_age:
+                results[name] = result._replace(stale=True)
+        return WorldState(tick, now, results)
+
+    def start(self) -> "TickScheduler":
+        """
+        Starts the policy thread (no-op without a policy).
+        """
+        if self.policy is not None and self.__thread is None:
+            self.__stop.clear()
+            self.__thread = threading.Thread(target=self.__policy_loop, name="policy", daemon=True)
+            self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout=2.0)
+            self.__thread = None
+
+    def __policy_loop(self) -> None:
+        next_tick = self.clock()
+        while not self.__stop.is_set():
+            delay = next_tick - self.clock()
+            if delay > 0 and self.__stop.wait(delay):
+                return
+            start = self.clock()
+            self.telemetry.record("tick_lag", (start - next_tick) * 1000)
+            state = self.snapshot(self.ticks)
+            try:
+                self.policy(state)
+            except Exception as e:
+                print(f"❗ Policy error on tick {self.ticks}: {e}")
+            self.telemetry.record("policy", (self.clock() - start) * 1000)
+            self.ticks += 1
+
+            next_tick += self.tick_interval
+            if self.clock() > next_tick:
+                # Fell a whole tick behind: drop the missed ticks instead of bursting to catch up
+                self.late_ticks += 1
+                next_tick = self.clock() + self.tick_interval
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Per-task run, skip and overrun counts and the current cost estimate (ms).
+        """
+        return {name: {"runs": task.runs, "skipped": task.skipped, "overruns": task.overruns,
+                       "cost_ms": task.cost_ms, "budget_ms": task.budget_ms}
+                for name, task in self.tasks.items()}
+
+    def report(self) -> None:
+        for name, stats in self.summary().items():
+            print(f"{name}: {stats['runs']} runs | {stats['skipped']} skipped | {stats['overruns']} over budget | "
+                  f"cost {stats['cost_ms']:.2f}ms of {stats['budget_ms']:.2f}ms")
+        if self.policy is not None:
+            print(f"policy: {self.ticks} ticks | {self.late_ticks} late")
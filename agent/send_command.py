@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import concurrent.futures
+import queue
+import socket
+import struct
+import threading
+import time
+from typing import Iterable, Optional, Sequence, Tuple
+
+from agent.coords import CoordinateSpaces
+from agent.lazy import lazy_import
+from agent.telemetry import Telemetry
+from constants import VIDEO_HEIGHT_PX, VIDEO_WIDTH_PX
+
+np = lazy_import("numpy")
+
+"""
+Sends scrcpy control messages over the control socket.
+
+Messages are packed with prebuilt struct templates. Writes go through a queue
+drained by a background thread, so injecting a tap or a card drag never blocks
+frame processing. A multi-step drag is packed into one buffer and written with a
+single sendall.
+
+scrcpy expects touch positions in the coordinate space of the video stream it
+is currently sending, together with that stream's size, so positions given in
+any other space (see agent/coords.py) are converted to stream px first, all
+points of a drag in one call.
+"""
+
+# Control message types
+TYPE_INJECT_KEYCODE = 0
+TYPE_INJECT_TOUCH_EVENT = 2
+TYPE_BACK_OR_SCREEN_ON = 4
+
+# Android MotionEvent / KeyEvent actions
+ACTION_DOWN = 0
+ACTION_UP = 1
+ACTION_MOVE = 2
+
+POINTER_ID_GENERIC_FINGER = -2
+PRESSURE_MAX = 0xFFFF
+
+# type, action, pointer id, x, y, screen width, screen height, pressure, action button, buttons
+TOUCH_EVENT = struct.Struct(">BBqiiHHHII")
+# type, action, keycode, repeat, meta state
+KEYCODE_EVENT = struct.Struct(">BBiII")
+# type, action
+BACK_OR_SCREEN_ON_EVENT = struct.Struct(">BB")
+
+Point = Tuple[float, float]
+
+
+class ControlSender:
+    """
+    Asynchronous writer for scrcpy control messages.
+
+    Args:
+        sock: Connected scrcpy control socket
+        video_size: (width, height) of the video stream the server is sending
+        telemetry: Records enqueue-to-socket-write latency as "control_write"
+        coords: Coordinate spaces of the stream (e.g. with its crop); built from
+            video_size when not given
+        survive_disconnects: For channels that reconnect (the asyncio client's):
+            messages that fail because the channel is down or the write timed out
+            are dropped and counted, and later ones are still sent. Otherwise the
+            first failed write stops the sender
+    """
+
+    def __init__(self, sock: socket.socket, video_size: Tuple[int, int] = (VIDEO_WIDTH_PX, VIDEO_HEIGHT_PX),
+                 telemetry: Optional[Telemetry] = None, coords: Optional[CoordinateSpaces] = None,
+                 survive_disconnects: bool = False):
+        self.__socket = sock
+        self.coords = coords if coords is not None else CoordinateSpaces.from_stream(*video_size)
+        self.__telemetry = telemetry if telemetry is not None else Telemetry(enabled=False)
+        self.__queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self.__thread: Optional[threading.Thread] = None
+        self.survive_disconnects = survive_disconnects
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.error: Optional[Exception] = None
+
+    def start(self) -> "ControlSender":
+        self.__thread = threading.Thread(target=self.__write_loop, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join(timeout=1.0)
+            self.__thread = None
+
+    def __write_loop(self) -> None:
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            enqueued_at, data = item
+            try:
+                self.__socket.sendall(data)
+            except (ConnectionError, TimeoutError, concurrent.futures.TimeoutError) as e:
+                if not self.survive_disconnects:
+                    self.error = e
+                    print(f"❗ Control socket write failed: {e}")
+                    return
+                # The channel is reconnecting; this message is lost, the next ones are not
+                self.messages_dropped += 1
+                continue
+            except OSError as e:
+                self.error = e
+                print(f"❗ Control socket write failed: {e}")
+                return
+            self.messages_sent += 1
+            self.__telemetry.record("control_write", (time.perf_counter() - enqueued_at) * 1000)
+
+    def send(self, data: bytes) -> None:
+        """
+        Queues already encoded control message bytes. Never blocks.
+        """
+        self.__queue.put((time.perf_counter(), data))
+
+    @property
+    def video_size(self) -> Tuple[int, int]:
+        return self.coords.video_size
+
+    @video_size.setter
+    def video_size(self, size: Tuple[int, int]) -> None:
+        # Called every frame by the async loop; only rebuild when the stream changed
+        if tuple(size) != self.coords.video_size:
+            self.coords = CoordinateSpaces.from_stream(*size, crop=self.coords.crop)
+
+    def to_video(self, x: float, y: float, space: str = "px") -> Tuple[int, int]:
+        """
+        Maps a point in any coordinate space (emulator "px", "dp", "arena", ...) to stream px.
+        """
+        vx, vy = self.coords.point(x, y, space, "video")
+        # Rounded: the composed matrices are not exact, so 200 can come back as 199.99999
+        return round(vx), round(vy)
+
+    def __pack_touch(self, buffer: bytearray, offset: int, action: int, x: int, y: int) -> None:
+        video_w, video_h = self.video_size
+        pressure = 0 if action == ACTION_UP else PRESSURE_MAX
+        TOUCH_EVENT.pack_into(buffer, offset, TYPE_INJECT_TOUCH_EVENT, action, POINTER_ID_GENERIC_FINGER,
+                              x, y, video_w, video_h, pressure, 0, 0)
+
+    def touch(self, action: int, x: float, y: float, space: str = "px") -> None:
+        buffer = bytearray(TOUCH_EVENT.size)
+        self.__pack_touch(buffer, 0, action, *self.to_video(x, y, space))
+        self.send(bytes(buffer))
+
+    def tap(self, x: float, y: float, space: str = "px") -> None:
+        """
+        Touch down and up at one point, sent as a single write.
+        """
+        self.drag([(x, y)], space=space)
+
+    def drag(self, points: Sequence[Point], space: str = "px") -> None:
+        """
+        Touch down on the first point, move through the rest and lift on the last,
+        all packed into one buffer and sent as a single write (e.g. a card from the
+        hand onto the arena).
+        """
+        if not points:
+            return
+        video_points = np.rint(self.coords.transform(points, space, "video")).astype(np.int32).tolist()
+        actions = [ACTION_DOWN] + [ACTION_MOVE] * (len(video_points) - 1) + [ACTION_UP]
+        video_points.append(video_points[-1])
+
+        buffer = bytearray(TOUCH_EVENT.size * len(actions))
+        for i, (action, (x, y)) in enumerate(zip(actions, video_points)):
+            self.__pack_touch(buffer, i * TOUCH_EVENT.size, action, x, y)
+        self.send(bytes(buffer))
+
+    def key(self, keycode: int, action: int, repeat: int = 0, meta_state: int = 0) -> None:
+        self.send(KEYCODE_EVENT.pack(TYPE_INJECT_KEYCODE, action, keycode, repeat, meta_state))
+
+    def press_key(self, keycode: int) -> None:
+        """
+        Key down and up (Android KEYCODE_*), sent as a single write.
+        """
+        self.send(KEYCODE_EVENT.pack(TYPE_INJECT_KEYCODE, ACTION_DOWN, keycode, 0, 0)
+                  + KEYCODE_EVENT.pack(TYPE_INJECT_KEYCODE, ACTION_UP, keycode, 0, 0))
+
+    def back(self) -> None:
+        self.send(BACK_OR_SCREEN_ON_EVENT.pack(TYPE_BACK_OR_SCREEN_ON, ACTION_DOWN)
+                  + BACK_OR_SCREEN_ON_EVENT.pack(TYPE_BACK_OR_SCREEN_ON, ACTION_UP))
+
+
+def interpolate(start: Point, end: Point, steps: int) -> Iterable[Point]:
+    """
+    Evenly spaced points from start to end (inclusive), for smooth drags.
+    """
+    (x0, y0), (x1, y1) = start, end
+    for i in range(steps + 1):
+        t = i / steps if steps else 1.0
+        yield x0 + (x1 - x0) * t, y0 + (y1 - y0) * t
@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import time
+from fractions import Fraction
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from agent import adb
+from agent.coords import Box, CoordinateSpaces
+from agent.decoder import DecoderConfig, create_codec_context
+from agent.lazy import lazy_import
+from constants import (
+    BATTLE_FIELD_BOX,
+    CARD_SLOT_BOXES,
+    ELIXIR_BAR_BOX,
+    NEXT_CARD_BOX,
+    TOWER_BOXES,
+    VIDEO_HEIGHT_PX,
+    VIDEO_WIDTH_PX,
+)
+
+av = lazy_import("av")
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+"""
+Negotiates what the scrcpy server streams, instead of the fixed full-screen
+max_size=1024 bit_rate=2000000 of start_server.sh.
+
+The analyzers only read a few regions: the battlefield (troops), the towers and
+the HUD strip (cards, elixir). negotiate() crops the stream to the union of the
+regions the active analyzers need and keeps it at the px density constants.py
+was measured at. If decoding that much would not fit its share of the frame
+interval (measured with measure_decode(), or taken from an earlier run), the
+size comes down first and the frame rate after that. The bitrate follows the
+pixel rate, at the bits per pixel of the old fixed settings.
+
+The agent rescales the constants.py regions to the stream it actually gets with
+regions(), so analyzers keep working on any crop and size. Only the analyzers
+the crop was negotiated for get regions; the agent does not build the others.
+
+Usage:
+    python -m agent.stream [--analyzers towers,hud] [--measure] [--save stream.json] [--command]
+"""
+
+# Regions each analyzer reads, in layout px (constants.py)
+ANALYZER_REGIONS: Dict[str, Dict[str, Box]] = {
+    "towers": TOWER_BOXES,
+    "troops": {"battle_field": BATTLE_FIELD_BOX},
+    "hud": {**CARD_SLOT_BOXES, "next_card": NEXT_CARD_BOX, "elixir_bar": ELIXIR_BAR_BOX},
+}
+
+DEFAULT_FPS = 30
+MIN_FPS = 10
+# Smallest size relative to the layout density; below this the boxes get too coarse to read
+MIN_SCALE = 0.5
+# Share of the frame interval decoding may take
+DECODE_SHARE = 0.5
+# The old fixed settings: 2 Mbps for 576x1024 at 30 fps
+BITS_PER_PIXEL = 2_000_000 / (VIDEO_WIDTH_PX * VIDEO_HEIGHT_PX * DEFAULT_FPS)
+# scrcpy rounds video dimensions down to multiples of 8
+ALIGN = 8
+# How far a rescaled box may stick out of the frame and still count as inside
+# (CoordinateSpaces.box rounds outwards)
+OVERHANG_PX = 1
+
+
+def _align(value: float, step: int = ALIGN) -> int:
+    return max(int(value) // step * step, step)
+
+
+def _union(boxes: Iterable[Box]) -> Box:
+    boxes = list(boxes)
+    x0 = min(box["x"] for box in boxes)
+    y0 = min(box["y"] for box in boxes)
+    x1 = max(box["x"] + box["width"] for box in boxes)
+    y1 = max(box["y"] + box["height"] for box in boxes)
+    return {"x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0}
+
+
+def _clip(box: Box, width: int, height: int) -> Optional[Box]:
+    """
+    Box clipped to a width x height frame, or None if it sticks out by more than OVERHANG_PX.
+    """
+    x0, y0 = box["x"], box["y"]
+    x1, y1 = x0 + box["width"], y0 + box["height"]
+    if x0 < -OVERHANG_PX or y0 < -OVERHANG_PX or x1 > width + OVERHANG_PX or y1 > height + OVERHANG_PX:
+        return None
+    x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return {"x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0}
+
+
+def required_region(analyzers: Iterable[str], margin: int = 8) -> Box:
+    """
+    Union of the regions the analyzers read, in layout px, padded by margin and
+    clipped to the screen.
+    """
+    analyzers = list(analyzers)
+    unknown = set(analyzers) - set(ANALYZER_REGIONS)
+    if unknown:
+        raise ValueError(f"Unknown analyzers {sorted(unknown)}; expected some of {sorted(ANALYZER_REGIONS)}")
+    if not analyzers:
+        return {"x": 0, "y": 0, "width": VIDEO_WIDTH_PX, "height": VIDEO_HEIGHT_PX}
+    region = _union(box for name in analyzers for box in ANALYZER_REGIONS[name].values())
+    x0, y0 = max(region["x"] - margin, 0), max(region["y"] - margin, 0)
+    x1 = min(region["x"] + region["width"] + margin, VIDEO_WIDTH_PX)
+    y1 = min(region["y"] + region["height"] + margin, VIDEO_HEIGHT_PX)
+    return {"x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0}
+
+
+class StreamSettings(NamedTuple):
+    crop: Box  # device px
+    max_size: int
+    bit_rate: int
+    max_fps: int
+    # Analyzers whose regions the crop covers
+    analyzers: Tuple[str, ...] = tuple(ANALYZER_REGIONS)
+
+    def server_options(self) -> Dict[str, str]:
+        """
+        Options for adb.server_command() / adb.start_server().
+        """
+        crop = self.crop
+        return {
+            "crop": f"{crop['width']}:{crop['height']}:{crop['x']}:{crop['y']}",
+            "max_size": str(self.max_size),
+            "video_bit_rate": str(self.bit_rate),
+            "max_fps": str(self.max_fps),
+        }
+
+    def decoder_config(self, base: Optional[DecoderConfig] = None) -> DecoderConfig:
+        """
+        Decoder configuration sized for this stream's bitrate and frame rate.
+        """
+        base = base if base is not None else DecoderConfig()
+        return base._replace(bit_rate=self.bit_rate, max_fps=self.max_fps)
+
+    @property
+    def video_size(self) -> Tuple[int, int]:
+        """
+        Expected stream size, computed the way the scrcpy server does. The
+        video header has the actual size.
+        """
+        width, height = self.crop["width"], self.crop["height"]
+        major, minor = max(width, height), min(width, height)
+        if major > self.max_size:
+            minor = (minor * self.max_size // major + ALIGN // 2) & ~(ALIGN - 1)
+            major = self.max_size
+        major, minor = _align(major), _align(minor)
+        return (major, minor) if width > height else (minor, major)
+
+    def coords(self, video_size: Optional[Tuple[int, int]] = None) -> CoordinateSpaces:
+        return CoordinateSpaces(video_size or self.video_size, crop=self.crop)
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self._asdict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "StreamSettings":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(**{**data, "analyzers": tuple(data.get("analyzers", ANALYZER_REGIONS))})
+
+
+def regions(coords: CoordinateSpaces, analyzers: Iterable[str] = ANALYZER_REGIONS) -> Dict[str, Dict[str, Box]]:
+    """
+    The analyzers' regions rescaled to a stream's px, e.g. for coords built
+    from the video header and the negotiated crop, and clipped to the frame.
+
+    Returns:
+        Boxes per analyzer. An analyzer is left out if any of its boxes falls
+        outside the frame, i.e. the crop was not negotiated for it.
+    """
+    width, height = coords.video_size
+    result = {}
+    for name in analyzers:
+        boxes = {key: _clip(box, width, height) for key, box in coords.boxes(ANALYZER_REGIONS[name]).items()}
+        if all(box is not None for box in boxes.values()):
+            result[name] = boxes
+    return result
+
+
+def negotiate(analyzers: Iterable[str] = ("towers", "hud"), decode_ms_per_mpx: Optional[float] = None,
+              fps: int = DEFAULT_FPS, margin: int = 8,
+              spaces: Optional[CoordinateSpaces] = None) -> StreamSettings:
+    """
+    Picks crop, size, bitrate and frame rate for the analyzers.
+
+    Args:
+        analyzers: Keys of ANALYZER_REGIONS that will run
+        decode_ms_per_mpx: Measured decode cost (see measure_decode); None
+            assumes decoding at full density fits
+        fps: Wanted frame rate
+        margin: Layout px kept around the regions
+        spaces: Device and layout geometry (constants.py by default)
+    """
+    spaces = spaces if spaces is not None else CoordinateSpaces()
+    analyzers = tuple(analyzers) or tuple(ANALYZER_REGIONS)
+    region = required_region(analyzers, margin)
+    crop = spaces.box(region, "layout", "device")
+    # Even crop rectangles, so chroma planes stay aligned
+    crop = {key: value // 2 * 2 for key, value in crop.items()}
+
+    # Same px density as the layout the analyzers were tuned on
+    max_size = _align(max(region["width"], region["height"]))
+    width, height = StreamSettings(crop, max_size, 0, fps).video_size
+    pixels = width * height
+    scale = 1.0
+    if decode_ms_per_mpx:
+        budget_ms = 1000 / fps * DECODE_SHARE
+        decode_ms = decode_ms_per_mpx * pixels / 1e6
+        if decode_ms > budget_ms:
+            scale = max(MIN_SCALE, math.sqrt(budget_ms / decode_ms))
+            if scale == MIN_SCALE:
+                # Still too slow at the smallest size: lower the frame rate instead
+                fps = max(MIN_FPS, int(1000 * DECODE_SHARE // (decode_ms * scale * scale)))
+
+    max_size = _align(max_size * scale)
+    bit_rate = int(round(BITS_PER_PIXEL * pixels * scale * scale * fps, -3))
+    return StreamSettings(crop, max_size, bit_rate, fps, analyzers)
+
+
+def measure_decode(size: Tuple[int, int] = (288, 512), frames: int = 30,
+                   config: Optional[DecoderConfig] = None) -> float:
+    """
+    Times this machine's H.264 decoder on a short synthetic clip.
+
+    Returns:
+        Decode cost in ms per frame per megapixel
+    """
+    width, height = size
+    encoder = av.CodecContext.create("libx264", "w")
+    encoder.width, encoder.height = width, height
+    encoder.pix_fmt = "yuv420p"
+    encoder.bit_rate = int(BITS_PER_PIXEL * width * height * DEFAULT_FPS)
+    encoder.options = {"preset": "ultrafast", "tune": "zerolatency"}
+    encoder.time_base = Fraction(1, DEFAULT_FPS)
+
+    # Smooth texture scrolling under a few moving blocks, roughly like the arena
+    rng = np.random.default_rng(0)
+    texture = cv2.resize(rng.integers(0, 256, (height // 16, width // 8, 3), dtype=np.uint8),
+                         (width * 2, height), interpolation=cv2.INTER_CUBIC)
+    packets = []
+    for index in range(frames):
+        image = np.ascontiguousarray(texture[:, index * 4 % width:index * 4 % width + width])
+        for block in range(6):
+            x = (block * 47 + index * 5) % (width - 24)
+            y = (block * 83 + index * 3) % (height - 24)
+            image[y:y + 24, x:x + 24] = (40 * block, 255 - 40 * block, 128)
+        frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+        frame.pts = index
+        packets.extend(bytes(packet) for packet in encoder.encode(frame))
+    packets.extend(bytes(packet) for packet in encoder.encode(None))
+
+    decoder = create_codec_context(config if config is not None else DecoderConfig())
+    decoded = 0
+    start = time.perf_counter()
+    for data in packets:
+        decoded += len(decoder.decode(av.Packet(data)))
+    decoded += len(decoder.decode(None))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return elapsed_ms / max(decoded, 1) / (width * height / 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Negotiate scrcpy stream settings for the analyzers")
+    parser.add_argument("--analyzers", default="towers,hud", help=f"Comma-separated, of {sorted(ANALYZER_REGIONS)}")
+    parser.add_argument("--fps", type=int, default=DEFAULT_FPS)
+    parser.add_argument("--measure", action="store_true", help="Measure decode speed and fit the stream to it")
+    parser.add_argument("--decode-ms-per-mpx", type=float, default=None, help="Known decode cost instead of --measure")
+    parser.add_argument("--save", default=None, help="Write the settings here, for play_game.py --stream")
+    parser.add_argument("--command", action="store_true", help="Print only the server command")
+    args = parser.parse_args()
+
+    decode_ms_per_mpx = args.decode_ms_per_mpx
+    if args.measure and decode_ms_per_mpx is None:
+        decode_ms_per_mpx = measure_decode()
+    settings = negotiate([name for name in args.analyzers.split(",") if name], decode_ms_per_mpx, fps=args.fps)
+    if args.save:
+        settings.save(args.save)
+    if args.command:
+        print(adb.server_command(settings.server_options()))
+        return
+
+    if decode_ms_per_mpx is not None:
+        print(f"⏱️ Decode: {decode_ms_per_mpx:.2f}ms per frame per megapixel")
+    width, height = settings.video_size
+    print(f"crop {settings.crop} | max_size {settings.max_size} | ~{width}x{height} | "
+          f"{settings.bit_rate / 1e6:.2f} Mbps | {settings.max_fps} fps | for {', '.join(settings.analyzers)}")
+    print(adb.server_command(settings.server_options()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from agent import adb
+from agent.replay import ReplayServer
+
+"""
+Runs one ClashAgent process per emulator, for collecting self-play data at scale.
+
+For every device the supervisor forwards its own local port (base_port + i),
+pushes and starts the scrcpy server, then starts an agent process pinned to its
+own core(s) with os.sched_setaffinity. Agents report how many frames they have
+processed through shared memory; the supervisor restarts an agent when its
+process dies, when it processes nothing within startup_timeout, or when it
+stops making progress for stall_timeout. Repeated failures back off
+exponentially, and a device is given up on after max_restarts failures in a row.
+An agent that ends after processing frames finished a match: its result is
+recorded and the next match starts.
+
+Each match writes its timeline, telemetry and log to
+<results>/<device>/match_NNNN/, and a line per match (or failure) is appended to
+<results>/results.jsonl.
+
+With --replay, local ReplayServer stand-ins replace the emulators, so the whole
+thing can be exercised without adb.
+
+Usage:
+    python -m agent.supervisor [--adb PATH] [--serials emulator-5554,emulator-5556] [--results results]
+    python -m agent.supervisor --replay recordings/vid_2.bin --count 3 --matches 2
+"""
+
+# Seconds between health checks
+HEALTH_INTERVAL = 1.0
+MAX_BACKOFF = 30.0
+
+
+class _AdbServer:
+    def __init__(self, process: subprocess.Popen):
+        self.process = process
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def stop(self) -> None:
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class AdbBackend:
+    """
+    Real devices: adb forward, server push and start per serial.
+
+    Args:
+        adb_path: adb executable (found on PATH if None)
+        serials: Devices to use; None uses every device in the "device" state
+        server_options: scrcpy server options overriding adb.SERVER_OPTIONS
+        jar: Server jar to push
+    """
+
+    server_delay = 1.0  # seconds for the server to start listening before the agent connects
+
+    def __init__(self, adb_path: Optional[str] = None, serials: Optional[Sequence[str]] = None,
+                 server_options: Optional[Dict[str, str]] = None, jar: str = adb.SERVER_JAR):
+        self.adb_path = adb.find_adb(adb_path)
+        self.serials = list(serials) if serials else None
+        self.server_options = server_options
+        self.jar = jar
+
+    def devices(self) -> List[str]:
+        devices = adb.list_devices(self.adb_path)
+        for device in devices:
+            if not device.ready:
+                print(f"⚠️ Skipping {device.serial} ({device.state})")
+        ready = [device.serial for device in devices if device.ready]
+        if self.serials is None:
+            return ready
+        missing = set(self.serials) - set(ready)
+        if missing:
+            print(f"⚠️ Not available: {', '.join(sorted(missing))}")
+        return [serial for serial in self.serials if serial in ready]
+
+    def prepare(self, serial: str, port: int) -> None:
+        adb.push_server(self.adb_path, serial, self.jar)
+        adb.forward(self.adb_path, serial, port)
+
+    def start_server(self, serial: str, port: int, log_path: Optional[str] = None) -> _AdbServer:
+        return _AdbServer(adb.start_server(self.adb_path, serial, self.server_options, log_path))
+
+    def release(self, serial: str, port: int) -> None:
+        adb.remove_forward(self.adb_path, serial, port)
+
+
+class _ReplayStandIn:
+    def __init__(self, server: ReplayServer):
+        self.server = server
+
+    def alive(self) -> bool:
+        return True
+
+    def stop(self) -> None:
+        self.server.stop()
+
+
+class ReplayBackend:
+    """
+    Local stand-ins: each "device" is a ReplayServer serving the same recording.
+
+    Args:
+        recording: Recording to serve (see agent/replay.py)
+        count: Number of stand-in devices
+        realtime: Serve at the recorded pace rather than as fast as possible
+    """
+
+    server_delay = 0.0
+
+    def __init__(self, recording: str, count: int = 2, realtime: bool = True):
+        self.recording = recording
+        self.count = count
+        self.realtime = realtime
+
+    def devices(self) -> List[str]:
+        return [f"replay-{index}" for index in range(self.count)]
+
+    def prepare(self, serial: str, port: int) -> None:
+        pass
+
+    def start_server(self, serial: str, port: int, log_path: Optional[str] = None) -> _ReplayStandIn:
+        return _ReplayStandIn(ReplayServer(self.recording, port=port, realtime=self.realtime).start())
+
+    def release(self, serial: str, port: int) -> None:
+        pass
+
+
+def _agent_main(serial: str, port: int, cpus: Optional[List[int]], match_dir: str, frames, results,
+                agent_args: tuple, agent_kwargs: dict) -> None:
+    """
+    Agent process: plays one match and reports the outcome.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    # At the descriptor level, so native library output (OpenCV, FFmpeg) lands in the log too
+    log = open(os.path.join(match_dir, "agent.log"), "a", buffering=1)
+    os.dup2(log.fileno(), 1)
+    os.dup2(log.fileno(), 2)
+    sys.stdout = sys.stderr = log
+
+    from agent.agent import AgentOutputs, ClashAgent
+    from agent.telemetry import Telemetry
+
+    telemetry = Telemetry(report_interval=0)
+    agent_kwargs = dict(agent_kwargs)
+    # Unattended agents have no one to show a window to
+    agent_kwargs.setdefault("preview", "headless")
+    outputs = agent_kwargs.pop("outputs", AgentOutputs())._replace(timeline_path=os.path.join(match_dir, "timeline"))
+    agent = ClashAgent(*agent_args, port=port, telemetry=telemetry, outputs=outputs, **agent_kwargs)
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(0.5):
+            frames.value = agent.frames_processed
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    start = time.perf_counter()
+    try:
+        agent.play(telemetry_path=os.path.join(match_dir, "telemetry.json"))
+    finally:
+        stop.set()
+        frames.value = agent.frames_processed
+        results.put({"device": serial, "match_dir": match_dir, "frames": agent.frames_processed,
+                     "seconds": time.perf_counter() - start,
+                     "p50_ms": {name: stats["p50"] for name, stats in telemetry.summary().items()}})
+        log.close()
+
+
+class Station:
+    """
+    One device and the agent process playing on it.
+    """
+
+    def __init__(self, serial: str, port: int, cpus: Optional[List[int]]):
+        self.serial = serial
+        self.port = port
+        self.cpus = cpus
+        self.status = "idle"  # idle, waiting, running, done, failed
+        self.process: Optional[mp.Process] = None
+        self.server = None
+        self.frames = None
+        self.match_dir: Optional[str] = None
+        self.matches = 0
+        self.restarts = 0
+        self.failures_in_row = 0
+        self.launch_at = 0.0
+        self.started_at = 0.0
+        self.last_frames = 0
+        self.last_progress = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.serial.replace(":", "_").replace("/", "_")
+
+
+def assign_cpus(count: int, per_agent: int) -> List[Optional[List[int]]]:
+    """
+    Splits the cores this process may use into per-agent sets, wrapping around
+    (and sharing cores) when there are more agents than cores.
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return [None] * count
+    cpus = sorted(os.sched_getaffinity(0))
+    if count * per_agent > len(cpus):
+        print(f"⚠️ {count} agents x {per_agent} cores on {len(cpus)} cores: cores will be shared")
+    return [[cpus[(index * per_agent + offset) % len(cpus)] for offset in range(per_agent)]
+            for index in range(count)]
+
+
+class Supervisor:
+    """
+    Args:
+        backend: AdbBackend or ReplayBackend
+        base_port: Local port of the first device; the others follow
+        results_dir: Where match outputs and results.jsonl go
+        cores_per_agent: Cores each agent process is pinned to
+        matches: Matches per device before it is done; None plays until stopped
+        max_restarts: Failures in a row before a device is given up on
+        startup_timeout: Seconds an agent may take to process its first frame
+        stall_timeout: Seconds an agent may go without processing a frame
+        agent_args: Positional ClashAgent arguments (adb path, background image path)
+        agent_kwargs: Further ClashAgent keyword arguments
+    """
+
+    def __init__(self, backend, base_port: int = 27183, results_dir: str = "results", cores_per_agent: int = 1,
+                 matches: Optional[int] = None, max_restarts: int = 5, startup_timeout: float = 30.0,
+                 stall_timeout: float = 15.0, agent_args: tuple = (), agent_kwargs: Optional[dict] = None):
+        self.backend = backend
+        self.base_port = base_port
+        self.results_dir = results_dir
+        self.cores_per_agent = cores_per_agent
+        self.matches = matches
+        self.max_restarts = max_restarts
+        self.startup_timeout = startup_timeout
+        self.stall_timeout = stall_timeout
+        self.agent_args = agent_args
+        self.agent_kwargs = agent_kwargs or {}
+        self.stations: List[Station] = []
+        self.records: List[dict] = []
+
+        # spawn: agents must not inherit the supervisor's threads and sockets
+        self.__context = mp.get_context("spawn")
+        self.__results = self.__context.Queue()
+
+    def start(self) -> List[Station]:
+        serials = self.backend.devices()
+        if not serials:
+            print("❗ No devices available")
+            return []
+        os.makedirs(self.results_dir, exist_ok=True)
+        cpus = assign_cpus(len(serials), self.cores_per_agent)
+        for index, serial in enumerate(serials):
+            station = Station(serial, self.base_port + index, cpus[index])
+            try:
+                self.backend.prepare(serial, station.port)
+            except (subprocess.CalledProcessError, OSError) as e:
+                print(f"❗ {serial}: setup failed: {e}")
+                station.status = "failed"
+            else:
+                print(f"📱 {serial} on port {station.port}, cores {station.cpus}")
+                self.__schedule(station, 0.0)
+            self.stations.append(station)
+        return self.stations
+
+    def __schedule(self, station: Station, delay: float) -> None:
+        station.status = "waiting"
+        station.launch_at = time.perf_counter() + delay
+
+    def __launch(self, station: Station) -> None:
+        station.match_dir = os.path.join(self.results_dir, station.name, f"match_{station.matches:04d}")
+        os.makedirs(station.match_dir, exist_ok=True)
+        if station.server is None or not station.server.alive():
+            station.server = self.backend.start_server(station.serial, station.port,
+                                                       os.path.join(station.match_dir, "server.log"))
+            time.sleep(self.backend.server_delay)
+        station.frames = self.__context.Value("q", 0, lock=False)
+        station.process = self.__context.Process(
+            target=_agent_main, name=f"agent-{station.name}", daemon=True,
+            args=(station.serial, station.port, station.cpus, station.match_dir, station.frames, self.__results,
+                  self.agent_args, self.agent_kwargs))
+        station.process.start()
+        station.status = "running"
+        station.started_at = station.last_progress = time.perf_counter()
+        station.last_frames = 0
+
+    def __record(self, record: dict) -> None:
+        record = {"time": time.time(), **record}
+        self.records.append(record)
+        with open(os.path.join(self.results_dir, "results.jsonl"), "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def __stop_agent(self, station: Station) -> None:
+        if station.process is not None:
+            if station.process.is_alive():
+                station.process.terminate()
+            station.process.join(timeout=5)
+            station.process = None
+
+    def __stop_server(self, station: Station) -> None:
+        if station.server is not None:
+            station.server.stop()
+            station.server = None
+
+    def __fail(self, station: Station, reason: str) -> None:
+        self.__stop_agent(station)
+        # A fresh server too: the old one may be what is stuck
+        self.__stop_server(station)
+        station.failures_in_row += 1
+        station.restarts += 1
+        self.__record({"device": station.serial, "match_dir": station.match_dir, "failure": reason})
+        if station.failures_in_row > self.max_restarts:
+            print(f"❗ {station.serial}: {reason}; giving up after {station.failures_in_row} failures")
+            station.status = "failed"
+            return
+        delay = min(2.0 ** (station.failures_in_row - 1), MAX_BACKOFF)
+        print(f"⚠️ {station.serial}: {reason}; restarting in {delay:.0f}s")
+        self.__schedule(station, delay)
+
+    def __finish(self, station: Station) -> None:
+        self.__stop_agent(station)
+        station.matches += 1
+        station.failures_in_row = 0
+        print(f"✅ {station.serial}: match {station.matches} done ({station.last_frames} frames)")
+        if self.matches is not None and station.matches >= self.matches:
+            station.status = "done"
+            self.__stop_server(station)
+        else:
+            self.__schedule(station, 0.0)
+
+    def __collect(self) -> None:
+        while True:
+            try:
+                result = self.__results.get_nowait()
+            except queue.Empty:
+                return
+            self.__record(result)
+
+    def poll(self) -> bool:
+        """
+        Collects results and checks every station once.
+
+        Returns:
+            False once no station has anything left to do
+        """
+        self.__collect()
+        now = time.perf_counter()
+        for station in self.stations:
+            if station.status == "waiting" and now >= station.launch_at:
+                self.__launch(station)
+            if station.status != "running":
+                continue
+            frames = station.frames.value
+            if frames > station.last_frames:
+                station.last_frames, station.last_progress = frames, now
+            if not station.process.is_alive():
+                station.process.join()
+                self.__collect()
+                if station.last_frames > 0:
+                    self.__finish(station)
+                else:
+                    self.__fail(station, f"agent exited (code {station.process.exitcode}) without a frame")
+            elif frames == 0 and now - station.started_at > self.startup_timeout:
+                self.__fail(station, f"no frame within {self.startup_timeout:.0f}s")
+            elif frames > 0 and now - station.last_progress > self.stall_timeout:
+                self.__fail(station, f"stalled for {self.stall_timeout:.0f}s at frame {frames}")
+        return any(station.status in ("waiting", "running") for station in self.stations)
+
+    def run(self, duration: Optional[float] = None) -> List[dict]:
+        """
+        Starts every device and supervises until all are done or failed, or
+        until `duration` seconds have passed.
+
+        Returns:
+            The records written to results.jsonl
+        """
+        deadline = None if duration is None else time.perf_counter() + duration
+        try:
+            self.start()
+            while self.poll():
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                time.sleep(HEALTH_INTERVAL)
+        except KeyboardInterrupt:
+            print("\n👋 Stopping agents...")
+        finally:
+            self.stop()
+        return self.records
+
+    def stop(self) -> None:
+        for station in self.stations:
+            self.__stop_agent(station)
+            self.__stop_server(station)
+            self.backend.release(station.serial, station.port)
+        self.__collect()
+        for station in self.stations:
+            print(f"{station.serial}: {station.matches} matches | {station.restarts} restarts | {station.status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one agent per emulator")
+    parser.add_argument("--adb", default=None, help="adb executable (default: from PATH)")
+    parser.add_argument("--serials", default=None, help="Comma-separated devices (default: all ready devices)")
+    parser.add_argument("--replay", default=None, help="Serve this recording from local stand-ins instead of adb")
+    parser.add_argument("--count", type=int, default=2, help="Number of replay stand-ins")
+    parser.add_argument("--base-port", type=int, default=27183)
+    parser.add_argument("--results", default="results")
+    parser.add_argument("--cores-per-agent", type=int, default=1)
+    parser.add_argument("--matches", type=int, default=None, help="Matches per device (default: until stopped)")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--max-restarts", type=int, default=5)
+    parser.add_argument("--background", default=None, help="Arena background image for highlighting")
+    parser.add_argument("--analysis", default=None, help="Comma-separated worker tasks per agent, e.g. towers")
+    parser.add_argument("--full-screen", action="store_true",
+                        help="Stream the whole screen instead of negotiating a crop for the analyzers")
+    args = parser.parse_args()
+
+    analysis = args.analysis.split(",") if args.analysis else []
+    agent_kwargs = {"analysis_tasks": analysis} if analysis else {}
+    if args.replay:
+        # Recordings are full-screen: there is no server to negotiate with
+        backend = ReplayBackend(args.replay, args.count)
+        adb_path = args.adb or "adb"
+    else:
+        server_options = None
+        if not args.full_screen:
+            from agent.stream import measure_decode, negotiate
+
+            # Exactly what the agents will build: towers in process, the background
+            # highlight on the battlefield, and the offloaded tasks
+            analyzers = {"towers", *analysis}
+            if args.background:
+                analyzers.add("troops")
+            stream = negotiate(sorted(analyzers), measure_decode())
+            print(f"📺 Stream: crop {stream.crop} | max_size {stream.max_size} | "
+                  f"{stream.bit_rate / 1e6:.2f} Mbps | {stream.max_fps} fps")
+            server_options = stream.server_options()
+            agent_kwargs["stream"] = stream
+        backend = AdbBackend(args.adb, args.serials.split(",") if args.serials else None, server_options)
+        adb_path = backend.adb_path
+    supervisor = Supervisor(backend, base_port=args.base_port, results_dir=args.results,
+                            cores_per_agent=args.cores_per_agent, matches=args.matches,
+                            max_restarts=args.max_restarts, agent_args=(adb_path, args.background or ""),
+                            agent_kwargs=agent_kwargs)
+    supervisor.run(args.duration)
+
+
+if __name__ == "__main__":
+    main()
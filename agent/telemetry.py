@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import csv
+import json
+import threading
+import time
+from typing import Dict
+
+from agent.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+"""
+Per-stage latency telemetry.
+
+Each named stage keeps its most recent samples (in milliseconds) in a fixed-size
+ring buffer. Summaries (p50/p95/p99) are printed on a timer instead of once per
+frame, and everything can be exported to JSON or CSV when a run ends. A disabled
+Telemetry hands out a shared no-op timer, so instrumented code costs next to
+nothing when telemetry is off.
+
+Stages may be timed from different threads (e.g. the policy loop and the control
+writer). New stages are registered under a lock and summaries work on a snapshot
+of the registered stages, so one thread can report while the others record.
+"""
+
+PERCENTILES = (50, 95, 99)
+
+
+class _RingBuffer:
+    __slots__ = ("samples", "index", "count")
+
+    def __init__(self, capacity: int):
+        self.samples = np.zeros(capacity, dtype=np.float64)
+        self.index = 0
+        self.count = 0
+
+    def append(self, value: float) -> None:
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % len(self.samples)
+        self.count += 1
+
+    def values(self) -> np.ndarray:
+        if self.count < len(self.samples):
+            return self.samples[:self.count]
+        return self.samples
+
+
+class _StageTimer:
+    # One per timed run, so overlapping runs of a stage don't share a start time
+    __slots__ = ("_buffer", "_start")
+
+    def __init__(self, buffer: _RingBuffer):
+        self._buffer = buffer
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._buffer.append((time.perf_counter() - self._start) * 1000)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Telemetry:
+    """
+    Named stage timers backed by ring buffers.
+
+    Args:
+        enabled: When False, stage() and record() do nothing
+        capacity: Number of most recent samples kept per stage
+        report_interval: Seconds between printed summaries in maybe_report() (0 disables)
+    """
+
+    def __init__(self, enabled: bool = True, capacity: int = 4096, report_interval: float = 5.0):
+        self.enabled = enabled
+        self.capacity = capacity
+        self.report_interval = report_interval
+        self.__buffers: Dict[str, _RingBuffer] = {}
+        self.__lock = threading.Lock()
+        self.__last_report = time.perf_counter()
+
+    def __buffer(self, name: str) -> _RingBuffer:
+        buffer = self.__buffers.get(name)
+        if buffer is None:
+            with self.__lock:
+                buffer = self.__buffers.get(name)
+                if buffer is None:
+                    buffer = self.__buffers[name] = _RingBuffer(self.capacity)
+        return buffer
+
+    def stage(self, name: str):
+        """
+        Context manager timing one run of a stage:
+
+            with telemetry.stage("decode"):
+                ...
+
+        Each call returns a new timer, so a stage can be timed from several threads
+        (or overlapping coroutines) at once.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self.__buffer(name))
+
+    def record(self, name: str, milliseconds: float) -> None:
+        """
+        Records a sample measured elsewhere (e.g. end-to-end latency).
+        """
+        if self.enabled:
+            self.__buffer(name).append(milliseconds)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Count, mean, max and p50/p95/p99 (ms) over the samples still in each buffer.
+        """
+        with self.__lock:
+            buffers = list(self.__buffers.items())
+        summary = {}
+        for name, buffer in buffers:
+            values = buffer.values()
+            if len(values) == 0:
+                continue
+            stats = {"count": buffer.count, "mean": float(values.mean()), "max": float(values.max())}
+            for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                stats[f"p{percentile}"] = float(value)
+            summary[name] = stats
+        return summary
+
+    def report(self) -> None:
+        print("--------------------------------")
+        for name, stats in self.summary().items():
+            print(f"{name}: p50 {stats['p50']:.2f}ms | p95 {stats['p95']:.2f}ms | "
+                  f"p99 {stats['p99']:.2f}ms | max {stats['max']:.2f}ms | n={stats['count']}")
+
+    def maybe_report(self) -> None:
+        """
+        Prints a summary if report_interval seconds have passed since the last one.
+        Cheap enough to call once per frame.
+        """
+        if not self.enabled or not self.report_interval:
+            return
+        now = time.perf_counter()
+        if now - self.__last_report >= self.report_interval:
+            self.__last_report = now
+            self.report()
+
+    def export(self, path: str) -> None:
+        """
+        Writes the summary to a .json or .csv file. JSON output also includes the
+        raw samples still in each buffer.
+        """
+        summary = self.summary()
+        if path.endswith(".csv"):
+            columns = ["count", "mean", *(f"p{p}" for p in PERCENTILES), "max"]
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["stage", *columns])
+                for name, stats in summary.items():
+                    writer.writerow([name, *(stats[column] for column in columns)])
+        else:
+            data = {
+                name: {**stats, "samples": self.__buffers[name].values().tolist()}
+                for name, stats in summary.items()
+            }
+            with open(path, "w") as f:
+                json.dump(data, f, indent=2)
+
+
+def load_summary(path: str) -> Dict[str, dict]:
+    """
+    Reads a summary written by Telemetry.export(), for comparing runs.
+    """
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            return {
+                row.pop("stage"): {key: float(value) for key, value in row.items()}
+                for row in csv.DictReader(f)
+            }
+    with open(path) as f:
+        data = json.load(f)
+    return {name: {k: v for k, v in stats.items() if k != "samples"} for name, stats in data.items()}
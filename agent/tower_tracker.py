@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Union
+
+from agent.frame_access import FrameView
+from agent.lazy import lazy_import
+from constants import TOWER_BOXES
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+"""
+Incremental tower state tracking.
+
+Every frame, each tower box gets a cheap change check: the grayscale ROI is
+downsampled into a preallocated buffer and compared with the sample from the
+tower's last evaluation, so slow change adds up until it crosses the threshold.
+Only towers that changed get the expensive analysis:
+
+    alive/destroyed - normalized correlation against the tower as it looked in
+                      the first frame; a tower is destroyed once it stays below
+                      the threshold for several evaluations in a row (troops
+                      walking past only drop it briefly). Destroyed is final.
+                      A tower with unconfirmed low correlations is evaluated
+                      on every frame, changed or not, until it is confirmed
+                      destroyed or matches again: rubble stops changing.
+    health          - fraction of the health bar strip filled with the side's
+                      bar color (red for enemy towers, blue for ours), relative
+                      to how full the bar was in the first frame.
+"""
+
+Box = Dict[str, int]
+Frame = Union[FrameView, "np.ndarray"]
+
+# Downsampling factor for the change check and the appearance comparison
+SAMPLE_SCALE = 8
+
+# HSV ranges for health bar colors (OpenCV hue is 0-179)
+ENEMY_BAR_HUES = ((0, 10), (170, 179))
+USER_BAR_HUES = ((100, 130),)
+BAR_MIN_SATURATION = 120
+BAR_MIN_VALUE = 120
+
+
+class TowerState:
+    __slots__ = ("name", "alive", "health", "last_changed", "evaluations")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.alive: bool = True
+        self.health: float = 1.0  # 0 to 1, relative to the first frame
+        self.last_changed: int = -1  # frame number of the last detected change
+        self.evaluations: int = 0
+
+    def __repr__(self):
+        return f"TowerState({self.name}, alive={self.alive}, health={self.health:.2f})"
+
+
+class _Tower:
+    def __init__(self, name: str, box: Box):
+        self.name = name
+        self.box = box
+        self.enemy = name.startswith("enemy")
+        self.state = TowerState(name)
+        w, h = box["width"], box["height"]
+        self.sample_size = (max(w // SAMPLE_SCALE, 1), max(h // SAMPLE_SCALE, 1))
+        self.sample = np.zeros(self.sample_size[::-1], dtype=np.uint8)
+        self.previous = np.zeros_like(self.sample)
+        self.diff = np.zeros_like(self.sample)
+        self.reference: Optional[np.ndarray] = None
+        self.reference_bar: Optional[float] = None
+        self.low_matches = 0
+
+
+class TowerTracker:
+    """
+    Args:
+        boxes: Tower boxes in video px (constants.TOWER_BOXES by default)
+        change_threshold: Mean absolute gray-level change of the downsampled ROI
+            above which a tower is re-evaluated
+        destroyed_threshold: Correlation with the reference below which a tower
+            looks destroyed
+        destroyed_frames: Consecutive low-correlation evaluations before a tower
+            is marked destroyed
+        bar_height: Fraction of the box height, from the top, holding the health bar
+        recheck_interval: Every this many frames the change check runs for every
+            tower even when a dirty list is given. The change map only compares
+            consecutive frames, so it misses slow change that the check (against
+            the sample of the last evaluation) still accumulates
+    """
+
+    def __init__(self, boxes: Optional[Dict[str, Box]] = None, change_threshold: float = 4.0,
+                 destroyed_threshold: float = 0.35, destroyed_frames: int = 15, bar_height: float = 0.15,
+                 recheck_interval: int = 30):
+        boxes = TOWER_BOXES if boxes is None else boxes
+        self.__towers = [_Tower(name, box) for name, box in boxes.items()]
+        self.change_threshold = change_threshold
+        self.destroyed_threshold = destroyed_threshold
+        self.destroyed_frames = destroyed_frames
+        self.bar_height = bar_height
+        self.recheck_interval = recheck_interval
+        self.frame_number = 0
+
+    @property
+    def states(self) -> Dict[str, TowerState]:
+        return {tower.name: tower.state for tower in self.__towers}
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Copy of the states as {"alive", "health"} arrays in box order, safe to
+        hand to another thread or process.
+        """
+        return {"alive": np.array([tower.state.alive for tower in self.__towers], dtype=np.uint8),
+                "health": np.array([tower.state.health for tower in self.__towers], dtype=np.float32)}
+
+    def bgr_boxes(self) -> List[Box]:
+        """
+        Boxes update() may read in BGR (the health bars), so a caller can convert
+        them ahead of time with FrameView.prefetch().
+        """
+        return [self.__bar_box(tower) for tower in self.__towers]
+
+    def __bar_box(self, tower: _Tower) -> Box:
+        box = tower.box
+        return {"x": box["x"], "y": box["y"], "width": box["width"],
+                "height": max(int(box["height"] * self.bar_height), 2)}
+
+    def __gray(self, frame: Frame, box: Box) -> np.ndarray:
+        if isinstance(frame, FrameView):
+            return frame.gray(box)
+        x, y, w, h = box["x"], box["y"], box["width"], box["height"]
+        roi = frame[y:y+h, x:x+w]
+        return roi if roi.ndim == 2 else cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+
+    def __bgr(self, frame: Frame, box: Box) -> np.ndarray:
+        if isinstance(frame, FrameView):
+            return frame.bgr(box)
+        x, y, w, h = box["x"], box["y"], box["width"], box["height"]
+        return frame[y:y+h, x:x+w]
+
+    def update(self, frame: Frame, dirty: Optional[List[str]] = None) -> List[str]:
+        """
+        Updates tower states from a frame.
+
+        Args:
+            frame: FrameView of a decoded frame, or a BGR frame in video px
+            dirty: Optional list of tower names known to have changed (e.g. from a
+                change map); when given, the per-tower change check is skipped for
+                every other tower, except every recheck_interval frames
+
+        Returns:
+            Names of the towers that were re-evaluated this frame
+        """
+        evaluated = []
+        first_frame = self.frame_number == 0
+        if self.recheck_interval and self.frame_number % self.recheck_interval == 0:
+            dirty = None
+        for tower in self.__towers:
+            if not tower.state.alive:
+                continue
+            pending = tower.low_matches > 0
+            if dirty is not None and tower.name not in dirty and not first_frame and not pending:
+                continue
+
+            cv2.resize(self.__gray(frame, tower.box), tower.sample_size, dst=tower.sample,
+                       interpolation=cv2.INTER_AREA)
+            if first_frame:
+                tower.reference = tower.sample.copy()
+            else:
+                cv2.absdiff(tower.sample, tower.previous, dst=tower.diff)
+                if cv2.mean(tower.diff)[0] < self.change_threshold and not pending:
+                    continue
+            tower.previous[:] = tower.sample
+
+            self.__evaluate(frame, tower)
+            evaluated.append(tower.name)
+
+        self.frame_number += 1
+        return evaluated
+
+    def __evaluate(self, frame: Frame, tower: _Tower) -> None:
+        state = tower.state
+        state.last_changed = self.frame_number
+        state.evaluations += 1
+
+        similarity = cv2.matchTemplate(tower.sample, tower.reference, cv2.TM_CCOEFF_NORMED)[0, 0]
+        if similarity < self.destroyed_threshold:
+            tower.low_matches += 1
+            if tower.low_matches >= self.destroyed_frames:
+                state.alive = False
+                state.health = 0.0
+                return
+        else:
+            tower.low_matches = 0
+
+        fill = self.__bar_fill(frame, tower)
+        if tower.reference_bar is None:
+            tower.reference_bar = fill
+        if tower.reference_bar > 0:
+            state.health = float(min(fill / tower.reference_bar, 1.0))
+
+    def __bar_fill(self, frame: Frame, tower: _Tower) -> float:
+        """
+        Fraction of health bar columns containing the side's bar color.
+        """
+        hsv = cv2.cvtColor(self.__bgr(frame, self.__bar_box(tower)), cv2.COLOR_BGR2HSV)
+        mask = None
+        for low, high in (ENEMY_BAR_HUES if tower.enemy else USER_BAR_HUES):
+            in_range = cv2.inRange(hsv, (low, BAR_MIN_SATURATION, BAR_MIN_VALUE), (high, 255, 255))
+            mask = in_range if mask is None else cv2.bitwise_or(mask, in_range)
+        return float(np.count_nonzero(mask.max(axis=0))) / mask.shape[1]
@@ -0,0 +1,318 @@
+import argparse
+import io
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import av
+import cv2
+import numpy as np
+
+from agent.agent import ClashAgent
+from agent.change_map import ChangeMap
+from agent.decoder import DecoderConfig, open_stream
+from agent.frame_access import FrameView
+from agent.telemetry import Telemetry, load_summary
+from agent.tower_tracker import TowerTracker
+from benchmarks.synthetic import SyntheticMatch
+from constants import TOWER_BOXES
+from scripts.bench_decoder import stream_bytes
+from tokenizer.background_model import RunningBackground
+from tokenizer.template_matcher import TemplateMatcher
+from tokenizer.troop_detector import TroopDetector
+
+"""
+Benchmarks for the agent and tokenizer hot paths on synthetic frames.
+
+Every run generates the same seeded 576x1024 arena clip (benchmarks/synthetic.py),
+encodes it to an H.264 stream recording, and times each hot path on its own:
+
+    convert_bgr24       full-frame av.VideoFrame -> BGR (what play() did before FrameView)
+    convert_frame_view  FrameView grayscale tower crops + battlefield BGR
+    highlight           ClashAgent.__highlight_differences on a BGR frame
+    match_full          cv2.matchTemplate over the whole frame (the original analyze loop)
+    match_tracked       TemplateMatcher.match (pyramid search, then tracking window)
+    background_contours RunningBackground.apply + contour boxes (run_background_extraction)
+    troop_detector      TroopDetector.update (components + tracking)
+    change_map          ChangeMap.update
+    tower_tracker       TowerTracker.update on a FrameView
+    decode_clip         open_stream + decode of the whole clip (ms per clip)
+
+Results are written with Telemetry.export() (.json or .csv) and compared against
+benchmarks/baseline.csv (or --baseline); the run exits with status 1 if any
+benchmark got slower than the tolerance allows, so
+
+    python -m benchmarks.run
+
+is the regression check to run before and after a hot-path change.
+
+Absolute timings only mean something on the machine that recorded them, so by
+default only the fast paths with a slow counterpart doing the same work are
+checked (see REFERENCES, e.g. convert_frame_view against convert_bgr24): the
+fast path's p50 is divided by its counterpart's from the same run, and that
+ratio is compared with the same ratio in the baseline. A faster or slower
+machine shifts both timings and leaves the ratio alone; the other benchmarks
+are reported next to their baseline p50 but not checked. With --absolute every
+raw p50 is checked instead, which is only meaningful against a baseline
+recorded on the same machine with --save-baseline (which writes
+benchmarks/baseline.csv unless given a path). The committed baseline was
+recorded with the default options (Python 3.11, numpy 2.4, cv2 5.0, av 18.1,
+one x86_64 core).
+
+Usage:
+    python -m benchmarks.run [--frames 120] [--repeat 3] [--only match_full,match_tracked]
+                             [--output results.json] [--baseline baseline.csv | --no-baseline]
+                             [--absolute] [--tolerance 0.3] [--save-baseline [baseline.csv]]
+"""
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.csv")
+
+# Fast path -> the slow path doing the same work, whose p50 from the same run
+# it is divided by before comparing with the baseline
+REFERENCES = {
+    "convert_frame_view": "convert_bgr24",
+    "match_tracked": "match_full",
+}
+
+# Each factory gets the fixtures and returns a function of the frame index; the runner times each call
+BENCHMARKS: Dict[str, Callable[["Fixtures"], Callable[[int], object]]] = {}
+
+
+def benchmark(name: str):
+    """
+    Registers a benchmark factory under a name.
+    """
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+class Fixtures:
+    """
+    Synthetic inputs shared by all benchmarks.
+
+    Args:
+        frames: Clip length in frames
+        sprites: Moving sprites in the clip
+        directory: Where the clip recording and background image are written
+    """
+
+    def __init__(self, frames: int, sprites: int, directory: str):
+        self.match = SyntheticMatch(sprites=sprites)
+        self.bgr = self.match.frame_list(frames)
+        self.gray = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in self.bgr]
+
+        self.recording_path = self.match.write_clip(os.path.join(directory, "synthetic.rec"), count=frames)
+        self.stream = stream_bytes(self.recording_path)
+        container = open_stream(io.BytesIO(self.stream), DecoderConfig())
+        self.av_frames = list(container.decode(video=0))
+        container.close()
+
+        self.background_path = os.path.join(directory, "background.png")
+        cv2.imwrite(self.background_path, self.match.background)
+        box = TOWER_BOXES["enemy_left_tower"]
+        self.template = self.gray[0][box["y"]:box["y"] + box["height"], box["x"]:box["x"] + box["width"]].copy()
+
+    def __len__(self):
+        return len(self.bgr)
+
+
+@benchmark("convert_bgr24")
+def _convert_bgr24(fixtures: Fixtures):
+    return lambda i: fixtures.av_frames[i].to_ndarray(format="bgr24")
+
+
+@benchmark("convert_frame_view")
+def _convert_frame_view(fixtures: Fixtures):
+    def run(i):
+        view = FrameView(fixtures.av_frames[i])
+        for name in TOWER_BOXES:
+            view.gray(name)
+        return view.bgr("battle_field")
+    return run
+
+
+@benchmark("highlight")
+def _highlight(fixtures: Fixtures):
+    agent = ClashAgent("adb", fixtures.background_path)
+    highlight = agent._ClashAgent__highlight_differences
+    scratch = np.empty_like(fixtures.bgr[0])
+
+    def run(i):
+        # apply() works in place, so give it a copy of the frame
+        scratch[:] = fixtures.bgr[i]
+        return highlight(scratch)
+    return run
+
+
+@benchmark("match_full")
+def _match_full(fixtures: Fixtures):
+    return lambda i: cv2.minMaxLoc(cv2.matchTemplate(fixtures.gray[i], fixtures.template, cv2.TM_CCOEFF_NORMED))
+
+
+@benchmark("match_tracked")
+def _match_tracked(fixtures: Fixtures):
+    matcher = TemplateMatcher(fixtures.template, threshold=0.3)
+    return lambda i: matcher.match(fixtures.gray[i])
+
+
+@benchmark("background_contours")
+def _background_contours(fixtures: Fixtures):
+    model = RunningBackground(warmup=5)
+
+    def run(i):
+        return model.boxes(model.apply(fixtures.gray[i]))
+    return run
+
+
+@benchmark("troop_detector")
+def _troop_detector(fixtures: Fixtures):
+    detector = TroopDetector(RunningBackground(warmup=5))
+    return lambda i: detector.update(fixtures.gray[i])
+
+
+@benchmark("change_map")
+def _change_map(fixtures: Fixtures):
+    changes = ChangeMap()
+    return lambda i: changes.update(fixtures.gray[i])
+
+
+@benchmark("tower_tracker")
+def _tower_tracker(fixtures: Fixtures):
+    tracker = TowerTracker()
+    return lambda i: tracker.update(FrameView(fixtures.av_frames[i]))
+
+
+@benchmark("decode_clip")
+def _decode_clip(fixtures: Fixtures):
+    def run(i):
+        container = open_stream(io.BytesIO(fixtures.stream), DecoderConfig())
+        try:
+            for _ in container.decode(video=0):
+                pass
+        finally:
+            container.close()
+    return run
+
+
+def run_benchmarks(fixtures: Fixtures, names: List[str], repeat: int, telemetry: Telemetry) -> None:
+    for name in names:
+        step = BENCHMARKS[name](fixtures)
+        # The whole-clip benchmark runs once per pass, the rest once per frame
+        count = 1 if name == "decode_clip" else len(fixtures)
+        step(0)  # warm up caches and lazy initialization
+        for _ in range(repeat):
+            for i in range(count):
+                start = time.perf_counter()
+                step(i)
+                telemetry.record(name, (time.perf_counter() - start) * 1000)
+
+
+def compare(summary: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Names of the benchmarks whose p50 exceeds the baseline p50 by more than `tolerance`.
+    """
+    regressions = []
+    for name, stats in summary.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"{name:>20}: {stats['p50']:8.3f}ms (no baseline)")
+            continue
+        ratio = stats["p50"] / reference["p50"] if reference["p50"] else float("inf")
+        regressed = ratio > 1 + tolerance
+        mark = "❗" if regressed else "✅"
+        print(f"{mark} {name:>20}: {stats['p50']:8.3f}ms vs {reference['p50']:8.3f}ms ({ratio - 1:+.1%})")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def compare_relative(summary: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Names of the benchmarks whose p50, relative to their REFERENCES benchmark,
+    exceeds the same ratio in the baseline by more than `tolerance`. Benchmarks
+    without a reference are only reported.
+    """
+    regressions = []
+    for name, stats in summary.items():
+        reference = REFERENCES.get(name)
+        if reference is None or reference not in summary or name not in baseline or reference not in baseline:
+            recorded = f"{baseline[name]['p50']:8.3f}ms" if name in baseline else "no baseline"
+            print(f"   {name:>20}: {stats['p50']:8.3f}ms vs {recorded} (not checked)")
+            continue
+        current = stats["p50"] / summary[reference]["p50"]
+        recorded = baseline[name]["p50"] / baseline[reference]["p50"]
+        change = current / recorded if recorded else float("inf")
+        regressed = change > 1 + tolerance
+        mark = "❗" if regressed else "✅"
+        print(f"{mark} {name:>20}: {current:8.3f}x {reference} vs {recorded:8.3f}x ({change - 1:+.1%})")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def environment() -> str:
+    return (f"Python {platform.python_version()} | numpy {np.__version__} | cv2 {cv2.__version__} | "
+            f"av {av.__version__} | {platform.machine()} {os.cpu_count()} cores")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark agent and tokenizer hot paths on synthetic frames")
+    parser.add_argument("--frames", type=int, default=120, help="Synthetic clip length")
+    parser.add_argument("--sprites", type=int, default=12, help="Moving sprites in the clip")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the clip per benchmark")
+    parser.add_argument("--only", default=None, help=f"Comma-separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument("--output", default=None, help="Export the summary to .json/.csv")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Summary to compare p50 latencies against")
+    parser.add_argument("--no-baseline", action="store_true", help="Only report, without comparing")
+    parser.add_argument("--absolute", action="store_true",
+                        help="Compare raw p50 values (same machine only) instead of ratios to reference benchmarks")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed p50 slowdown vs baseline")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_PATH, default=None,
+                        help=f"Export the summary as the new baseline instead of comparing (default {BASELINE_PATH})")
+    args = parser.parse_args(argv)
+    if args.no_baseline or args.save_baseline:
+        args.baseline = None
+    elif not os.path.exists(args.baseline):
+        parser.error(f"No baseline at {args.baseline}; record one with --save-baseline or pass --no-baseline")
+
+    names = list(BENCHMARKS) if args.only is None else args.only.split(",")
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks {sorted(unknown)}; expected some of {list(BENCHMARKS)}")
+    if args.baseline is not None and not args.absolute:
+        # Ratios need the reference benchmarks from the same run
+        missing = [REFERENCES[name] for name in names if name in REFERENCES and REFERENCES[name] not in names]
+        names = list(dict.fromkeys([*missing, *names]))
+
+    print(environment())
+    telemetry = Telemetry(report_interval=0, capacity=max(args.frames * args.repeat, 1))
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = Fixtures(args.frames, args.sprites, directory)
+        print(f"{len(fixtures)} synthetic frames, {len(fixtures.stream)} bytes of H.264, {args.repeat} passes")
+        run_benchmarks(fixtures, names, args.repeat, telemetry)
+
+    summary = telemetry.summary()
+    if args.baseline is None:
+        telemetry.report()
+    if args.output:
+        telemetry.export(args.output)
+    if args.save_baseline:
+        telemetry.export(args.save_baseline)
+        print(f"✅ Baseline saved to {args.save_baseline}")
+
+    if args.baseline is not None:
+        check = compare if args.absolute else compare_relative
+        regressions = check(summary, load_summary(args.baseline), args.tolerance)
+        if regressions:
+            print(f"❗ Slower than baseline (+{args.tolerance:.0%} allowed): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
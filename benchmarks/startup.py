@@ -0,0 +1,89 @@
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from agent.telemetry import Telemetry
+from benchmarks.synthetic import SyntheticMatch
+
+"""
+Time from launch to the first processed frame, with and without warm start.
+
+Each run starts play_game.py the way play_game.sh does (CLASH_LAUNCH_TIME set
+before Python starts) against a replay server playing a synthetic clip. The
+server only starts listening after --adb-delay seconds, standing in for the adb
+forward and scrcpy server coming up, which is the time a warm start gets to
+load libraries and build models. Also times a bare `import agent.agent`.
+
+Usage:
+    python -m benchmarks.startup [--runs 5] [--adb-delay 0.5] [--output startup.json]
+"""
+
+FIRST_FRAME = re.compile(r"First frame reached processing (\d+)ms")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_import(module: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def time_first_frame(recording: str, warm_start: bool, adb_delay: float) -> Optional[float]:
+    port = free_port()
+    env = {**os.environ, "CLASH_LAUNCH_TIME": repr(time.time())}
+    command = [sys.executable, "play_game.py", "--port", str(port)] + (["--warm-start"] if warm_start else [])
+    agent = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    time.sleep(adb_delay)
+    server = subprocess.Popen([sys.executable, "-m", "agent.replay", "serve", recording, "--port", str(port),
+                               "--fast"], stdout=subprocess.DEVNULL)
+    try:
+        output, _ = agent.communicate(timeout=60)
+    finally:
+        server.terminate()
+        server.wait()
+    match = FIRST_FRAME.search(output)
+    if match is None:
+        print(output)
+        return None
+    return float(match.group(1))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure time to first processed frame")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--adb-delay", type=float, default=0.5, help="Seconds before the stream server listens")
+    parser.add_argument("--frames", type=int, default=30, help="Synthetic clip length")
+    parser.add_argument("--output", default=None, help="Export the summary to .json/.csv")
+    args = parser.parse_args(argv)
+
+    telemetry = Telemetry(report_interval=0)
+    with tempfile.TemporaryDirectory() as directory:
+        recording = SyntheticMatch().write_clip(os.path.join(directory, "startup.rec"), count=args.frames)
+        for _ in range(args.runs):
+            telemetry.record("import_agent", time_import("agent.agent"))
+            for warm_start in (False, True):
+                elapsed = time_first_frame(recording, warm_start, args.adb_delay)
+                if elapsed is None:
+                    print("❗ No frame was processed")
+                    return 1
+                telemetry.record("first_frame_warm" if warm_start else "first_frame_cold", elapsed)
+
+    telemetry.report()
+    if args.output:
+        telemetry.export(args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import os
+from typing import Iterator, List, Optional
+
+import cv2
+import numpy as np
+
+from agent.replay import encode_stream
+from constants import BATTLE_FIELD_BOX, TOWER_BOXES, VIDEO_HEIGHT_PX, VIDEO_WIDTH_PX
+
+"""
+Synthetic Clash Royale-like frames for benchmarks.
+
+A fixed arena background (textured grass inside the battlefield box, a river
+across the middle, tower sprites at the constants.py boxes) with small colored
+sprites walking over it. Everything is generated from a seed, so runs on
+different machines time the same pixels.
+"""
+
+GRASS = (60, 150, 70)
+RIVER = (200, 140, 40)
+HUD = (70, 45, 35)
+ENEMY_TOWER = (60, 60, 200)
+USER_TOWER = (200, 110, 50)
+
+
+def arena_background(seed: int = 0) -> np.ndarray:
+    """
+    576x1024 BGR arena background.
+    """
+    rng = np.random.default_rng(seed)
+    image = np.empty((VIDEO_HEIGHT_PX, VIDEO_WIDTH_PX, 3), dtype=np.uint8)
+    image[:] = HUD
+
+    b = BATTLE_FIELD_BOX
+    noise = rng.integers(-18, 18, size=(b["height"], b["width"], 1), dtype=np.int16)
+    field = np.clip(np.array(GRASS, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    image[b["y"]:b["y"] + b["height"], b["x"]:b["x"] + b["width"]] = cv2.GaussianBlur(field, (5, 5), 0)
+
+    river_y = b["y"] + b["height"] // 2 - 14
+    image[river_y:river_y + 28, b["x"]:b["x"] + b["width"]] = RIVER
+
+    for name, box in TOWER_BOXES.items():
+        color = ENEMY_TOWER if name.startswith("enemy") else USER_TOWER
+        x, y, w, h = box["x"], box["y"], box["width"], box["height"]
+        cv2.rectangle(image, (x + 6, y + 18), (x + w - 6, y + h - 4), color, -1)
+        cv2.rectangle(image, (x + 6, y + 18), (x + w - 6, y + h - 4), (30, 30, 30), 2)
+        # Health bar strip along the top of the box
+        bar = (40, 40, 230) if name.startswith("enemy") else (230, 120, 40)
+        cv2.rectangle(image, (x + 4, y + 2), (x + w - 4, y + 10), bar, -1)
+    return image
+
+
+class SyntheticMatch:
+    """
+    Sprites moving over the arena background.
+
+    Args:
+        sprites: Number of moving sprites
+        seed: Seed for the background and the sprite paths
+    """
+
+    def __init__(self, sprites: int = 12, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.background = arena_background(seed)
+        b = BATTLE_FIELD_BOX
+        self.low = np.array([b["x"], b["y"]], dtype=np.float64)
+        self.high = np.array([b["x"] + b["width"] - 20, b["y"] + b["height"] - 24], dtype=np.float64)
+        self.start = rng.uniform(self.low, self.high, size=(sprites, 2))
+        self.velocity = rng.uniform(-2.5, 2.5, size=(sprites, 2))
+        self.colors = [tuple(int(c) for c in color) for color in rng.integers(0, 255, size=(sprites, 3))]
+
+    def positions(self, index: int) -> np.ndarray:
+        """
+        Sprite top-left corners at frame `index`, bouncing off the battlefield edges.
+        """
+        span = self.high - self.low
+        travelled = np.abs(self.start - self.low + self.velocity * index) % (2 * span)
+        return self.low + np.where(travelled > span, 2 * span - travelled, travelled)
+
+    def frame(self, index: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        image = self.background.copy() if out is None else out
+        if out is not None:
+            image[:] = self.background
+        for (x, y), color in zip(self.positions(index).astype(int), self.colors):
+            cv2.rectangle(image, (x, y), (x + 18, y + 22), color, -1)
+        return image
+
+    def frames(self, count: int) -> Iterator[np.ndarray]:
+        for index in range(count):
+            yield self.frame(index)
+
+    def frame_list(self, count: int) -> List[np.ndarray]:
+        return list(self.frames(count))
+
+    def write_clip(self, path: str, count: int = 120, fps: float = 30.0, bit_rate: int = 2_000_000) -> str:
+        """
+        Encodes the match as an H.264 stream recording (see agent/replay.py).
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        encode_stream(self.frames(count), path, fps=fps, bit_rate=bit_rate, device_name="benchmark")
+        return path
@@ -29,4 +29,33 @@ Bounding Box - Top Left: (225, 627), Width: 121, Height: 165
 
 Battle Field:
 Bounding Box - Top Left: (45, 105), Width: 488, Height: 664
-"""
\ No newline at end of file
+"""
+
+VIDEO_WIDTH_PX = 576
+VIDEO_HEIGHT_PX = 1024
+
+# Regions in video px, as listed above
+BATTLE_FIELD_BOX = {"x": 45, "y": 105, "width": 488, "height": 664}
+
+TOWER_BOXES = {
+    "enemy_left_tower": {"x": 92, "y": 124, "width": 87, "height": 125},
+    "enemy_right_tower": {"x": 390, "y": 126, "width": 98, "height": 130},
+    "enemy_king_tower": {"x": 229, "y": 23, "width": 113, "height": 158},
+    "user_left_tower": {"x": 96, "y": 568, "width": 85, "height": 105},
+    "user_right_tower": {"x": 387, "y": 577, "width": 94, "height": 94},
+    "user_king_tower": {"x": 225, "y": 627, "width": 121, "height": 165},
+}
+
+# HUD regions in video px. Approximate: measured by eye on a single match,
+# re-measure with scripts/get_locations_for_towers.py if reads look off
+CARD_SLOT_BOXES = {
+    "card_0": {"x": 130, "y": 830, "width": 100, "height": 124},
+    "card_1": {"x": 238, "y": 830, "width": 100, "height": 124},
+    "card_2": {"x": 346, "y": 830, "width": 100, "height": 124},
+    "card_3": {"x": 454, "y": 830, "width": 100, "height": 124},
+}
+NEXT_CARD_BOX = {"x": 28, "y": 900, "width": 60, "height": 74}
+ELIXIR_BAR_BOX = {"x": 150, "y": 972, "width": 404, "height": 30}
+
+REGIONS = {"battle_field": BATTLE_FIELD_BOX, **TOWER_BOXES, **CARD_SLOT_BOXES,
+           "next_card": NEXT_CARD_BOX, "elixir_bar": ELIXIR_BAR_BOX}
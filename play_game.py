@@ -1,10 +1,33 @@
-from agent.agent import ClashAgent
+import argparse
+import os
+from typing import Optional
+
+from agent.preview import MODES
+
+def play_game(preview: str = "window", warm_start: bool = False, port: int = 27183, stream_path: Optional[str] = None):
+    # Imported here so that argument errors and --help return without loading the agent
+    from agent.agent import ClashAgent
+    from agent.stream import StreamSettings
 
-def play_game():
     print("Playing Game")
-    agent = ClashAgent()
+    # Set by play_game.sh, so startup is measured from the launch rather than from here
+    launch_time = os.environ.get("CLASH_LAUNCH_TIME")
+    # Settings the server was started with (start_server.sh writes them), so regions match its crop
+    stream = StreamSettings.load(stream_path) if stream_path else None
+    agent = ClashAgent(preview=preview, port=port, warm_start=warm_start,
+                       launch_time=float(launch_time) if launch_time else None, stream=stream)
     agent.play()
     print("Game Finished")
 
 if __name__ == "__main__":
-    play_game()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Play Clash Royale")
+    parser.add_argument("--preview", choices=MODES, default="window",
+                        help="window (viewer process at 10 fps, default), headless (no GUI; troop highlighting "
+                             "and overlays are skipped) or snapshot (SIGUSR1)")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="Load libraries, decoder and models while connecting to the device")
+    parser.add_argument("--port", type=int, default=27183, help="Local port forwarded to the scrcpy server")
+    parser.add_argument("--stream", default=None,
+                        help="Stream settings from python -m agent.stream --save (default: full screen)")
+    args = parser.parse_args()
+    play_game(preview=args.preview, warm_start=args.warm_start, port=args.port, stream_path=args.stream)
\ No newline at end of file
@@ -1,4 +1,10 @@
 #!/bin/bash
-adb forward tcp:27183 localabstract:scrcpy 
+# Startup is measured from here to the first processed frame (EPOCHREALTIME needs bash 5)
+export CLASH_LAUNCH_TIME=${EPOCHREALTIME:-$(date +%s)}
 source ./venv/bin/activate
-python ./play_game.py
\ No newline at end of file
+# The forward comes up while Python warms up; the agent retries until it can connect
+adb forward tcp:27183 localabstract:scrcpy &
+# Written by start_server.sh; without it the agent expects the full screen
+STREAM_ARGS=()
+[ -f stream.json ] && STREAM_ARGS=(--stream stream.json)
+python ./play_game.py --warm-start "${STREAM_ARGS[@]}" "$@"
\ No newline at end of file
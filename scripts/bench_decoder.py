@@ -0,0 +1,75 @@
+import argparse
+import os
+import time
+
+from agent.decoder import THREAD_MODES, DecoderConfig, create_codec_context
+from agent.replay import HANDSHAKE_LENGTH, read_recording
+from agent.telemetry import Telemetry
+
+"""
+Decode latency per threading mode.
+
+Feeds a recorded stream (see agent/replay.py) into a decoder for each mode and
+measures, for every frame, the time from handing its packet to the decoder to
+getting the frame back. Frame threading shows up here as a few frames of
+added latency in exchange for higher throughput.
+
+Usage:
+    python -m scripts.bench_decoder recordings/vid_2.bin [--threads 4] [--repeat 3]
+"""
+
+
+def stream_bytes(path):
+    data = b"".join(chunk for _, chunk in read_recording(path))
+    return data[HANDSHAKE_LENGTH:]
+
+
+def bench_mode(data: bytes, config: DecoderConfig, telemetry: Telemetry) -> dict:
+    codec = create_codec_context(config)
+    packets = codec.parse(data) + codec.parse(None)
+    sent_at = []
+    frames = 0
+    start = time.perf_counter()
+
+    def receive(decoded):
+        nonlocal frames
+        now = time.perf_counter()
+        for _ in decoded:
+            # No B-frames in the scrcpy stream, so frames come out in packet order
+            telemetry.record(config.threading, (now - sent_at[frames]) * 1000)
+            frames += 1
+
+    for packet in packets:
+        sent_at.append(time.perf_counter())
+        receive(codec.decode(packet))
+    receive(codec.decode(None))
+
+    elapsed = time.perf_counter() - start
+    return {"frames": frames, "fps": frames / elapsed if elapsed else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decoder threading modes")
+    parser.add_argument("recording")
+    parser.add_argument("--threads", type=int, default=0, help="Decoder threads (0 = FFmpeg default)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Export latency summary to .json/.csv")
+    args = parser.parse_args()
+
+    data = stream_bytes(args.recording)
+    telemetry = Telemetry(report_interval=0)
+    print(f"Decoding {len(data)} bytes, {args.repeat} runs per mode, {os.cpu_count()} cores")
+
+    for mode in THREAD_MODES:
+        config = DecoderConfig(threading=mode, thread_count=args.threads)
+        fps = max(bench_mode(data, config, telemetry)["fps"] for _ in range(args.repeat))
+        stats = telemetry.summary()[mode]
+        print(f"{mode:>6}: {fps:8.1f} fps | latency p50 {stats['p50']:.2f}ms | "
+              f"p95 {stats['p95']:.2f}ms | p99 {stats['p99']:.2f}ms")
+
+    if args.output:
+        telemetry.export(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,13 @@
 adb --version
 adb push scrcpy-server.jar /data/local/tmp/scrcpy-server.jar
 adb shell "chmod 755 /data/local/tmp/scrcpy-server.jar"
-adb shell "CLASSPATH=/data/local/tmp/scrcpy-server.jar app_process / com.genymobile.scrcpy.Server 3.3.4 tunnel_forward=true control=true audio=false max_size=1024 bit_rate=2000000 shell=true"
\ No newline at end of file
+# Crop, size, bitrate and fps are negotiated for the analyzers (see agent/stream.py);
+# play_game.sh hands the same settings to the agent through stream.json
+[ -f ./venv/bin/activate ] && source ./venv/bin/activate
+rm -f stream.json
+if ! SERVER_COMMAND=$(python -m agent.stream --analyzers towers,hud --measure --save stream.json --command); then
+    echo "Stream negotiation failed; streaming the full screen"
+    rm -f stream.json
+    SERVER_COMMAND="CLASSPATH=/data/local/tmp/scrcpy-server.jar app_process / com.genymobile.scrcpy.Server 3.3.4 tunnel_forward=true control=true audio=false max_size=1024 video_bit_rate=2000000"
+fi
+adb shell "$SERVER_COMMAND"
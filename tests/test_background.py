@@ -0,0 +1,36 @@
+import cv2
+import numpy as np
+
+from agent.background import BackgroundSubtractor
+from benchmarks.synthetic import SyntheticMatch
+from constants import BATTLE_FIELD_BOX
+
+
+def highlight_differences(frame, background, box):
+    """
+    The original ClashAgent.__highlight_differences.
+    """
+    x, y, w, h = box["x"], box["y"], box["width"], box["height"]
+    roi = frame[y:y+h, x:x+w]
+    if background.shape[:2] != roi.shape[:2]:
+        background = cv2.resize(background, (w, h), interpolation=cv2.INTER_AREA)
+    diff = cv2.absdiff(background, roi)
+    gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+    _, mask = cv2.threshold(gray_diff, 40, 255, cv2.THRESH_BINARY)
+    roi[mask == 255] = (0, 0, 0)
+    frame[y:y+h, x:x+w] = roi
+    return frame
+
+
+def test_apply_matches_the_original_highlighting():
+    match = SyntheticMatch(sprites=12, seed=3)
+    b = BATTLE_FIELD_BOX
+    # A full-size screenshot of the empty arena, as the agent loads it
+    background = cv2.resize(match.background[b["y"]:b["y"] + b["height"], b["x"]:b["x"] + b["width"]], (976, 1328))
+    subtractor = BackgroundSubtractor(threshold=40)
+    subtractor.add_region("battle_field", b, background)
+
+    for frame in match.frames(5):
+        expected = highlight_differences(frame.copy(), background, b)
+        assert (expected != frame).any()
+        np.testing.assert_array_equal(subtractor.apply(frame), expected)
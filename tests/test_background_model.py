@@ -0,0 +1,59 @@
+import tracemalloc
+
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import SyntheticMatch
+from tokenizer.background_model import RunningBackground
+
+
+@pytest.fixture(scope="module")
+def match():
+    return SyntheticMatch(seed=5)
+
+
+@pytest.mark.parametrize("method", ["ema", "median"])
+def test_background_converges_to_the_empty_arena(match, method):
+    model = RunningBackground(method=method, warmup=5)
+    for frame in match.frames(200):
+        mask = model.apply(frame)
+
+    b = model.box
+    arena = cv2.cvtColor(match.background, cv2.COLOR_BGR2GRAY)[b["y"]:b["y"] + b["height"], b["x"]:b["x"] + b["width"]]
+    arena = cv2.resize(arena, model.size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    error = np.abs(model.background - arena)
+    assert error.mean() < 1.5
+    # No sprite left burned into the background
+    assert (error > model.threshold).mean() < 0.001
+    # Only the sprites are foreground
+    assert 0 < mask.mean() < 0.05
+
+
+def test_running_median_matches_numpy_median():
+    rng = np.random.default_rng(0)
+    model = RunningBackground(method="median", history=6, median_every=1, warmup=0)
+    samples = []
+    # Odd and even fill counts, then the history wrapping around
+    for _ in range(9):
+        frame = rng.integers(0, 256, (1024, 576), dtype=np.uint8)
+        model.apply(frame)
+        b = model.box
+        roi = frame[b["y"]:b["y"] + b["height"], b["x"]:b["x"] + b["width"]]
+        samples.append(cv2.resize(roi, model.size, interpolation=cv2.INTER_AREA))
+        expected = np.median(np.array(samples[-6:]), axis=0).astype(np.float32)
+        np.testing.assert_array_equal(model.background, expected)
+
+
+def test_median_update_does_not_copy_the_history(match):
+    model = RunningBackground(method="median", median_every=1, warmup=0)
+    frames = match.frame_list(20)
+    for frame in frames[:-1]:
+        model.apply(frame)
+    history_bytes = 15 * model.size[0] * model.size[1]
+
+    tracemalloc.start()
+    model.apply(frames[-1])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < history_bytes / 4
@@ -0,0 +1,37 @@
+import av
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import SyntheticMatch
+from tokenizer.batch_tokenize import TOWER_NAMES, find_videos, plan_shards, run, tokenize_shard
+
+
+def write_video(path: str, size=(720, 1280), count: int = 10, format=None) -> str:
+    with av.open(path, "w", format=format) as container:
+        stream = container.add_stream("libx264", rate=30)
+        stream.width, stream.height, stream.pix_fmt = *size, "yuv420p"
+        for frame in SyntheticMatch().frames(count):
+            frame = cv2.resize(frame, size)
+            for packet in stream.encode(av.VideoFrame.from_ndarray(frame, format="bgr24")):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return path
+
+
+def test_tokenize_follows_the_video_size(tmp_path):
+    path = write_video(str(tmp_path / "match.mp4"))
+    shards = plan_shards(path, shard_frames=900)
+    tokens = np.load(tokenize_shard(shards[0], str(tmp_path / "tokens")))
+    assert tokens["tower_alive"].shape == (10, len(TOWER_NAMES))
+    assert tokens["tower_alive"].all()
+    # Seconds from the stream's start, whatever its first pts
+    np.testing.assert_allclose(tokens["timestamp"], np.arange(10) / 30, atol=1e-6)
+
+
+def test_raw_h264_is_not_picked_up_and_is_reported_when_named(tmp_path, capsys):
+    raw = write_video(str(tmp_path / "raw.h264"), format="h264")
+    assert find_videos([str(tmp_path)]) == []
+    # Named explicitly it is tried, but has no pts to cut shards at
+    assert run([raw], str(tmp_path / "tokens"), workers=1) == []
+    assert "raw.h264: no timestamped video packets" in capsys.readouterr().out
@@ -0,0 +1,15 @@
+from benchmarks.run import compare_relative
+
+BASELINE = {"convert_bgr24": {"p50": 0.4}, "convert_frame_view": {"p50": 0.35}, "highlight": {"p50": 0.75}}
+
+
+def test_slower_machine_is_not_a_regression():
+    # Everything twice as slow as where the baseline was recorded
+    summary = {name: {"p50": stats["p50"] * 2} for name, stats in BASELINE.items()}
+    assert compare_relative(summary, BASELINE, tolerance=0.3) == []
+
+
+def test_fast_path_losing_its_lead_is_a_regression():
+    summary = {"convert_bgr24": {"p50": 0.4}, "convert_frame_view": {"p50": 0.5}, "highlight": {"p50": 5.0}}
+    # highlight has no counterpart in the same run, so it is only reported
+    assert compare_relative(summary, BASELINE, tolerance=0.3) == ["convert_frame_view"]
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from agent.change_map import ChangeMap
+
+BOX = {"x": 900, "y": 1500, "width": 64, "height": 64}
+UNTOUCHED = {"x": 480, "y": 840, "width": 64, "height": 64}
+
+
+def test_change_lands_on_its_own_tiles_at_full_resolution():
+    changes = ChangeMap(1080, 1920)
+    frame = np.full((1920, 1080), 100, dtype=np.uint8)
+    changes.update(frame)
+    frame[BOX["y"]:BOX["y"] + BOX["height"], BOX["x"]:BOX["x"] + BOX["width"]] = 200
+    assert changes.update(frame)
+    assert changes.is_dirty(BOX)
+    assert not changes.is_dirty(UNTOUCHED)
+
+
+def test_frame_of_another_size_is_refused():
+    with pytest.raises(ValueError):
+        ChangeMap().update(np.zeros((1920, 1080), dtype=np.uint8))
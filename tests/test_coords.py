@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from agent.coords import SPACE_NAMES, CoordinateSpaces
+from constants import BATTLE_FIELD_BOX, EMULATOR_HEIGHT_PX, EMULATOR_LENGTH_PX
+
+CROP = {"x": 40, "y": 200, "width": 1000, "height": 1600}
+POINTS = np.random.default_rng(0).uniform(0, 1, (32, 2))
+
+
+@pytest.mark.parametrize("crop", [None, CROP], ids=["full", "cropped"])
+def test_round_trip_through_every_space(crop):
+    spaces = CoordinateSpaces.from_stream(480, 864, crop=crop)
+    points = POINTS
+    chain = ("arena", "video", "device", "dp", "layout", "arena")
+    for source, target in zip(chain, chain[1:]):
+        points = spaces.transform(points, source, target)
+    np.testing.assert_allclose(points, POINTS, atol=1e-9)
+    for source in SPACE_NAMES:
+        for target in SPACE_NAMES:
+            back = spaces.transform(spaces.transform(POINTS, source, target), target, source)
+            np.testing.assert_allclose(back, POINTS, atol=1e-9)
+
+
+def test_known_points():
+    spaces = CoordinateSpaces.from_stream(480, 864, crop=CROP)
+    # Stream corners are the crop's corners on the device
+    np.testing.assert_allclose(spaces.transform([(0, 0), (480, 864)], "video", "px"),
+                               [(CROP["x"], CROP["y"]), (CROP["x"] + CROP["width"], CROP["y"] + CROP["height"])])
+    # Arena corners are the battlefield box in layout px
+    np.testing.assert_allclose(spaces.transform([(0, 0), (1, 1)], "arena", "layout"),
+                               [(BATTLE_FIELD_BOX["x"], BATTLE_FIELD_BOX["y"]),
+                                (BATTLE_FIELD_BOX["x"] + BATTLE_FIELD_BOX["width"],
+                                 BATTLE_FIELD_BOX["y"] + BATTLE_FIELD_BOX["height"])])
+    assert spaces.point(EMULATOR_LENGTH_PX, EMULATOR_HEIGHT_PX, "device", "layout") == pytest.approx((576, 1024))
+    assert spaces.point(10, 20, "dp", "video") == pytest.approx(
+        spaces.transform([(10, 20)], "dp", "video")[0])
+
+
+def test_unknown_space_is_refused():
+    with pytest.raises(ValueError):
+        CoordinateSpaces().transform(POINTS, "screen", "arena")
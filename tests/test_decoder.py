@@ -0,0 +1,65 @@
+import socket
+
+from agent.async_client import recv_exact
+from agent.decoder import DecoderConfig, container_options, decode_frames, open_stream
+from agent.replay import HANDSHAKE_LENGTH, ReplayServer, encode_stream, read_recording
+from agent.telemetry import Telemetry
+from benchmarks.synthetic import SyntheticMatch
+
+FRAMES = 20
+
+
+def test_low_delay_options_decode_a_recorded_stream_as_it_arrives(tmp_path):
+    path = str(tmp_path / "match.bin")
+    encode_stream(SyntheticMatch(seed=1).frames(FRAMES), path, fps=30.0)
+    server = ReplayServer(path, port=0, realtime=True).start()
+    total = sum(len(data) for _, data in read_recording(path))
+
+    config = DecoderConfig()
+    assert "flags" not in container_options(config)
+    video = socket.create_connection(("127.0.0.1", server.port))
+    control = socket.create_connection(("127.0.0.1", server.port))
+    try:
+        recv_exact(video, HANDSHAKE_LENGTH)
+        container = open_stream(video.makefile("rb", buffering=0), config)
+        sent_at_first_frame = None
+        decoded = 0
+        for frame in container.decode(video=0):
+            if sent_at_first_frame is None:
+                sent_at_first_frame = server.bytes_sent
+            assert (frame.width, frame.height) == (576, 1024)
+            decoded += 1
+        container.close()
+    finally:
+        video.close()
+        control.close()
+        server.stop()
+
+    assert decoded == FRAMES
+    # With a 32-byte probe the first frame comes out while the rest is still being sent
+    assert sent_at_first_frame < total
+
+
+def test_waiting_for_packets_is_timed_apart_from_decoding(tmp_path):
+    path = str(tmp_path / "match.bin")
+    encode_stream(SyntheticMatch(seed=2).frames(FRAMES), path, fps=30.0)
+    server = ReplayServer(path, port=0, realtime=True).start()
+    telemetry = Telemetry(report_interval=0)
+
+    video = socket.create_connection(("127.0.0.1", server.port))
+    control = socket.create_connection(("127.0.0.1", server.port))
+    try:
+        recv_exact(video, HANDSHAKE_LENGTH)
+        container = open_stream(video.makefile("rb", buffering=0), DecoderConfig())
+        decoded = sum(1 for _ in decode_frames(container, telemetry))
+        container.close()
+    finally:
+        video.close()
+        control.close()
+        server.stop()
+
+    assert decoded == FRAMES
+    summary = telemetry.summary()
+    # The stream arrives over about FRAMES / 30 seconds; that wait is not decode time
+    assert summary["receive"]["mean"] * summary["receive"]["count"] > 300
+    assert summary["decode"]["mean"] * summary["decode"]["count"] < 300
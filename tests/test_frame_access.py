@@ -0,0 +1,47 @@
+import av
+import numpy as np
+import pytest
+
+from agent.frame_access import FrameView
+
+BOXES = [
+    {"x": 45, "y": 105, "width": 488, "height": 664},
+    # Odd edges, widened to the chroma grid and trimmed back
+    {"x": 7, "y": 13, "width": 31, "height": 17},
+    {"x": 0, "y": 0, "width": 576, "height": 1024},
+]
+
+
+@pytest.mark.parametrize("box", BOXES, ids=lambda box: f"{box['width']}x{box['height']}")
+def test_region_matches_the_full_frame_conversion(box):
+    image = np.random.default_rng(0).integers(0, 256, (1024, 576, 3), dtype=np.uint8)
+    frame = av.VideoFrame.from_ndarray(image, format="bgr24").reformat(format="yuv420p")
+    full = frame.to_ndarray(format="bgr24")
+    x, y, w, h = box["x"], box["y"], box["width"], box["height"]
+
+    view = FrameView(frame)
+    np.testing.assert_array_equal(view.bgr(box), full[y:y + h, x:x + w])
+    out = np.empty((h, w, 3), dtype=np.uint8)
+    assert view.bgr(box, out=out) is out
+    np.testing.assert_array_equal(out, full[y:y + h, x:x + w])
+    luma = np.frombuffer(frame.planes[0], dtype=np.uint8).reshape(-1, frame.planes[0].line_size)
+    np.testing.assert_array_equal(view.gray(box), luma[y:y + h, x:x + w])
+
+
+def test_prefetched_regions_are_not_converted_again(monkeypatch):
+    image = np.random.default_rng(1).integers(0, 256, (1024, 576, 3), dtype=np.uint8)
+    frame = av.VideoFrame.from_ndarray(image, format="bgr24").reformat(format="yuv420p")
+    full = frame.to_ndarray(format="bgr24")
+    box = BOXES[1]
+    x, y, w, h = box["x"], box["y"], box["width"], box["height"]
+
+    view = FrameView(frame).prefetch([box])
+
+    def fail(width, height):
+        raise AssertionError("prefetched region converted again")
+
+    monkeypatch.setattr("agent.frame_access._scratch_frame", fail)
+    np.testing.assert_array_equal(view.bgr(dict(box)), full[y:y + h, x:x + w])
+    out = np.empty((h, w, 3), dtype=np.uint8)
+    assert view.bgr(box, out=out) is out
+    np.testing.assert_array_equal(out, full[y:y + h, x:x + w])
@@ -0,0 +1,83 @@
+import queue
+import threading
+
+import numpy as np
+import pytest
+
+from agent import frame_ring
+from agent.frame_access import FrameView
+from agent.frame_ring import FrameRing
+
+SIZE = (64, 32)
+SLOTS = 4
+
+
+def planes(value):
+    width, height = SIZE
+    luma = np.full((height, width), value, dtype=np.uint8)
+    chroma = np.full((height // 2, width // 2), 128, dtype=np.uint8)
+    return FrameView.from_planes(luma, chroma, chroma.copy())
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(SIZE, SLOTS)
+    yield ring
+    ring.close()
+
+
+def test_read_overwritten_by_the_writer_is_rejected(ring):
+    ring.publish(planes(1), 0)
+    view, sequence = ring.view(0)
+    copy = np.empty(ring.frame_bytes, dtype=np.uint8)
+    copied, copied_sequence = ring.view(0, out=copy)
+    assert ring.valid(0, sequence)
+
+    # The writer laps the ring onto the slot being read
+    ring.publish(planes(2), SLOTS)
+    assert not ring.valid(0, sequence)
+    assert not ring.valid(0, copied_sequence)
+    assert view.luma()[0, 0] == 2
+    assert copied.luma()[0, 0] == 1
+    # The slot now holds a newer frame
+    assert ring.view(0) == (None, 0)
+
+
+def test_slot_being_written_is_skipped(ring):
+    ring.publish(planes(1), 0)
+    meta = ring._FrameRing__meta
+    meta[0, 0] += 1  # odd: the writer is mid-copy
+    assert ring.view(0) == (None, 0)
+    meta[0, 0] += 1
+    view, sequence = ring.view(0)
+    assert view is not None and ring.valid(0, sequence)
+
+
+@pytest.mark.parametrize("stateful", [False, True], ids=["direct", "copy"])
+def test_worker_discards_reads_the_writer_overwrote(ring, monkeypatch, stateful):
+    new_frame, stop, results = threading.Event(), threading.Event(), queue.Queue()
+    seen = []
+
+    def overwriting_task():
+        def run(view):
+            seen.append(int(view.luma()[0, 0]))
+            # The writer laps the ring while the task is still reading the frame
+            ring.publish(planes(2), SLOTS)
+            stop.set()
+            return "result"
+        return run
+
+    monkeypatch.setitem(frame_ring.TASKS, "overwrite", overwriting_task)
+    monkeypatch.setattr(frame_ring, "STATEFUL_TASKS", {"overwrite"} if stateful else set())
+    ring.publish(planes(1), 0)
+    new_frame.set()
+    frame_ring._worker_main(ring.name, SIZE, SLOTS, "overwrite", {}, new_frame, stop, results)
+
+    task_name, frame_number, result, _ = results.get_nowait()
+    assert (task_name, frame_number) == ("overwrite", 0)
+    assert seen == [1]
+    if stateful:
+        # The task ran on a private copy validated before it started
+        assert result == "result"
+    else:
+        assert result is None
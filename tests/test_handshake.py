@@ -0,0 +1,83 @@
+import asyncio
+import socket
+import threading
+import time
+
+from agent.agent import ClashAgent
+from agent.async_client import AsyncScrcpyClient
+from agent.replay import handshake_bytes
+
+HANDSHAKE = handshake_bytes("emulator", 480, 864)
+
+
+def serve(listener, sessions):
+    """
+    Accepts a video and a control connection per session and sends the session's
+    handshake bytes in the given pieces, then waits for the client to hang up.
+    """
+    for pieces, close in sessions:
+        video, _ = listener.accept()
+        control, _ = listener.accept()
+        for piece in pieces:
+            video.sendall(piece)
+            time.sleep(0.01)
+        if not close:
+            video.recv(1)
+        video.close()
+        control.close()
+
+
+def test_sequential_handshake_reads_exactly_and_reconnects_on_short_header():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(2)
+    port = listener.getsockname()[1]
+    sessions = [
+        # Header cut short, then the connection drops
+        ([HANDSHAKE[:70]], True),
+        # Complete, but arriving in fragments smaller than each read
+        ([HANDSHAKE[i:i + 5] for i in range(0, len(HANDSHAKE), 5)], False),
+    ]
+    server = threading.Thread(target=serve, args=(listener, sessions), daemon=True)
+    server.start()
+
+    agent = ClashAgent("adb", "missing.png", port=port, connect_timeout=5.0)
+    try:
+        agent._ClashAgent__connect_socket()
+        assert agent.ready
+        assert agent.coords.video_size == (480, 864)
+    finally:
+        if agent.controls is not None:
+            agent.controls.stop()
+        agent._ClashAgent__close_sockets()
+        server.join(timeout=2.0)
+        listener.close()
+
+
+def test_streams_closing_after_the_handshake_back_off_and_give_up():
+    async def run():
+        connections = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            # Video connections (every other one) get the handshake and then hang up
+            if len(connections) % 2 == 1:
+                writer.write(HANDSHAKE)
+                await writer.drain()
+                writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = AsyncScrcpyClient(port=port, connect_delay=0, backoff_initial=0.02, max_retries=3)
+        start = time.perf_counter()
+        frames = [frame async for frame in client.frames()]
+        elapsed = time.perf_counter() - start
+        await client.close()
+        server.close()
+        return frames, client, elapsed
+
+    frames, client, elapsed = asyncio.run(run())
+    assert frames == []
+    assert client.connections == 4
+    assert client.failures == 4
+    assert elapsed >= 0.02 + 0.04 + 0.08
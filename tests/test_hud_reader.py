@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+import pytest
+
+from agent import hud_reader
+from agent.change_map import ChangeMap
+from agent.hud_reader import CardBank, HudReader
+from benchmarks.synthetic import SyntheticMatch
+from constants import CARD_SLOT_BOXES, NEXT_CARD_BOX
+
+NAMES = ["knight", "archers", "giant", "musketeer", "valkyrie", "hog_rider"]
+SLOTS = [*CARD_SLOT_BOXES.values(), NEXT_CARD_BOX]
+
+
+@pytest.fixture(scope="module")
+def bank_images():
+    rng = np.random.default_rng(6)
+    images = [cv2.GaussianBlur(rng.integers(0, 256, (120, 96, 3), dtype=np.uint8), (9, 9), 0) for _ in NAMES]
+    return CardBank(NAMES, images), images
+
+
+def frame_with_hand(match, index, images, hand):
+    frame = match.frame(index)
+    for box, card in zip(SLOTS, hand):
+        frame[box["y"]:box["y"] + box["height"], box["x"]:box["x"] + box["width"]] = \
+            cv2.resize(images[card], (box["width"], box["height"]), interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def test_clean_slots_reuse_their_cached_result(bank_images, monkeypatch):
+    bank, images = bank_images
+    match = SyntheticMatch(seed=6)
+    reader = HudReader(bank)
+    changes = ChangeMap()
+    hand = [0, 1, 2, 3, 4]
+
+    frame = frame_with_hand(match, 0, images, hand)
+    changes.update(frame)
+    state = reader.read(frame, changes)
+    assert state.cards == tuple(NAMES[card] for card in hand[:4])
+    assert state.next_card == NAMES[hand[4]]
+    assert (reader.hits, reader.misses) == (0, 5)
+
+    # Sprites move over the battlefield; the HUD tiles stay clean, so no slot is
+    # even sampled again
+    sampled = []
+    original = hud_reader._descriptor
+    monkeypatch.setattr(hud_reader, "_descriptor", lambda *args: sampled.append(1) or original(*args))
+    for index in range(1, 6):
+        frame = frame_with_hand(match, index, images, hand)
+        assert changes.update(frame)
+        assert reader.read(frame, changes) == state
+    assert (reader.hits, reader.misses) == (25, 5)
+    assert sampled == []
+
+    # Playing a card only rescores its slot; the neighbors sharing its edge tiles
+    # are sampled again, but their samples match the cached ones
+    hand[1] = 5
+    frame = frame_with_hand(match, 6, images, hand)
+    changes.update(frame)
+    state = reader.read(frame, changes)
+    assert state.cards[1] == NAMES[5]
+    assert (reader.hits, reader.misses) == (29, 6)
+    assert len(sampled) == 3
@@ -0,0 +1,26 @@
+import time
+
+from agent.pipeline import _STOP, FramePipeline, LatestQueue
+
+
+def test_close_keeps_the_last_item():
+    q = LatestQueue("decoded")
+    q.put(1)
+    q.close()
+    assert q.get(timeout=0) == 1
+    assert q.get(timeout=0) is _STOP
+    assert q.dropped == 0
+
+
+def test_clean_stream_end_delivers_the_last_frame():
+    displayed = []
+
+    def display(frame):
+        displayed.append(frame)
+        time.sleep(0.005)
+
+    stats = FramePipeline(range(1, 21), convert=lambda f: f, process=lambda f: f, display=display,
+                          report_interval=0).run()
+    assert displayed[-1] == 20
+    assert stats["processed"] == stats["decoded"] - stats["dropped"]["decoded"] - stats["dropped"]["converted"]
+    assert len(displayed) == stats["processed"] - stats["dropped"]["processed"]
@@ -0,0 +1,91 @@
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from agent import preview
+from agent.preview import draw_overlays
+
+SHAPE = (64, 48, 3)
+BOX = {"x": 4, "y": 4, "width": 20, "height": 20}
+
+
+class FakeGui:
+    """
+    The cv2 window calls the viewer makes, recording what it shows.
+    """
+
+    def __init__(self):
+        self.shown = []
+        for name in ("rectangle", "putText", "FONT_HERSHEY_SIMPLEX"):
+            setattr(self, name, getattr(cv2, name))
+        self.WINDOW_AUTOSIZE = self.WND_PROP_VISIBLE = 0
+
+    def imshow(self, title, image):
+        self.shown.append(image.copy())
+
+    def namedWindow(self, *args):
+        pass
+
+    def waitKey(self, delay):
+        time.sleep(0.005)
+        return -1
+
+    def getWindowProperty(self, *args):
+        return 1
+
+    def destroyAllWindows(self):
+        pass
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "viewer did not catch up"
+        time.sleep(0.005)
+
+
+def test_viewer_draws_each_frame_with_its_own_overlays(monkeypatch):
+    gui = FakeGui()
+    monkeypatch.setattr(preview, "cv2", gui)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(SHAPE)))
+    shared = np.ndarray(SHAPE, dtype=np.uint8, buffer=shm.buf)
+    lock, closed, overlays = threading.Lock(), threading.Event(), queue.Queue()
+    sequence = SimpleNamespace(value=0)
+    viewer = threading.Thread(target=preview._viewer_main,
+                              args=(shm.name, SHAPE, lock, sequence, closed, overlays, 200.0, "test"))
+    viewer.start()
+    try:
+        # Frame 1 arrives before its overlays: shown bare, redrawn once they come
+        shared[:] = 10
+        sequence.value = 1
+        wait_for(lambda: len(gui.shown) == 1)
+        np.testing.assert_array_equal(gui.shown[0], np.full(SHAPE, 10, dtype=np.uint8))
+        overlays.put((1, [{"box": BOX, "color": (0, 0, 255)}]))
+        wait_for(lambda: len(gui.shown) == 2)
+        expected = draw_overlays(np.full(SHAPE, 10, dtype=np.uint8), [{"box": BOX, "color": (0, 0, 255)}])
+        np.testing.assert_array_equal(gui.shown[1], expected)
+
+        # Overlays for frame 3 queued while frame 2 (with none) is shown
+        overlays.put((2, []))
+        overlays.put((3, [{"box": BOX, "color": (255, 0, 0)}]))
+        shared[:] = 20
+        sequence.value = 2
+        wait_for(lambda: len(gui.shown) == 3)
+        np.testing.assert_array_equal(gui.shown[2], np.full(SHAPE, 20, dtype=np.uint8))
+        shared[:] = 30
+        sequence.value = 3
+        wait_for(lambda: len(gui.shown) == 4)
+        expected = draw_overlays(np.full(SHAPE, 30, dtype=np.uint8), [{"box": BOX, "color": (255, 0, 0)}])
+        np.testing.assert_array_equal(gui.shown[3], expected)
+        time.sleep(0.05)
+        assert len(gui.shown) == 4
+    finally:
+        closed.set()
+        viewer.join(timeout=2.0)
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,50 @@
+from agent.scheduler import TickScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def task(self, *costs_ms):
+        """
+        A task that advances the clock by the next cost (the last one repeats).
+        """
+        costs = list(costs_ms)
+
+        def run(frame):
+            self.now += (costs.pop(0) if len(costs) > 1 else costs[0]) / 1000
+            return frame
+        return run
+
+
+def test_task_that_no_longer_fits_the_frame_budget_is_skipped():
+    clock = FakeClock()
+    scheduler = TickScheduler(frame_budget_ms=5.0, clock=clock)
+    scheduler.add_task("towers", clock.task(4.0), budget_ms=10.0)
+    scheduler.add_task("hud", clock.task(3.0), budget_ms=10.0)
+
+    # Costs are unknown at first, so both run
+    assert scheduler.on_frame(0, 0) == ["towers", "hud"]
+    # Now hud's 3ms does not fit the 1ms left after towers
+    assert scheduler.on_frame(1, 1) == ["towers"]
+    assert scheduler.tasks["hud"].skipped == 1
+    state = scheduler.snapshot()
+    assert state.results["hud"].stale and state.results["hud"].frame_number == 0
+    assert not state.results["towers"].stale
+
+
+def test_overrun_backs_off_then_probes():
+    clock = FakeClock()
+    scheduler = TickScheduler(clock=clock)
+    scheduler.add_task("towers", clock.task(7.0, 1.0), budget_ms=2.0, probe_every=4)
+
+    ran = [frame for frame in range(11) if scheduler.on_frame(frame, frame)]
+    # 7ms on a 2ms budget skips the next 3 frames; the cost estimate still
+    # exceeds the budget after that, so the task only runs again as a probe
+    assert ran == [0, 5, 10]
+    summary = scheduler.summary()["towers"]
+    assert summary["overruns"] == 1
+    assert summary["skipped"] == 8
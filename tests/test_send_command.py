@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+
+from agent.async_client import _ControlChannel
+from agent.send_command import (
+    ACTION_DOWN,
+    ACTION_MOVE,
+    ACTION_UP,
+    KEYCODE_EVENT,
+    PRESSURE_MAX,
+    TOUCH_EVENT,
+    ControlSender,
+)
+
+
+class FakeSocket:
+    def __init__(self, expected: int):
+        self.writes = []
+        self.done = threading.Event()
+        self.expected = expected
+
+    def sendall(self, data: bytes) -> None:
+        self.writes.append(data)
+        if len(self.writes) == self.expected:
+            self.done.set()
+
+
+def touch_bytes(action: int, x: int, y: int, width: int, height: int) -> bytes:
+    """
+    scrcpy's touch message, field by field.
+    """
+    pressure = 0 if action == ACTION_UP else PRESSURE_MAX
+    return (bytes([2, action])
+            + (-2).to_bytes(8, "big", signed=True)  # pointer id: generic finger
+            + x.to_bytes(4, "big", signed=True) + y.to_bytes(4, "big", signed=True)
+            + width.to_bytes(2, "big") + height.to_bytes(2, "big")
+            + pressure.to_bytes(2, "big")
+            + (0).to_bytes(4, "big") + (0).to_bytes(4, "big"))
+
+
+def run(sender_calls, expected_writes: int):
+    sock = FakeSocket(expected_writes)
+    sender = ControlSender(sock, video_size=(480, 864)).start()
+    for call in sender_calls:
+        call(sender)
+    assert sock.done.wait(1.0)
+    sender.stop()
+    return sock.writes
+
+
+def test_message_sizes():
+    assert TOUCH_EVENT.size == 32
+    assert KEYCODE_EVENT.size == 14
+
+
+def test_touch_layout():
+    writes = run([lambda s: s.touch(ACTION_DOWN, 100, 200, space="video")], 1)
+    assert writes == [touch_bytes(ACTION_DOWN, 100, 200, 480, 864)]
+
+
+def test_drag_is_one_write_of_down_moves_up():
+    writes = run([lambda s: s.drag([(10, 20), (30, 40), (50, 60)], space="video")], 1)
+    assert writes == [touch_bytes(ACTION_DOWN, 10, 20, 480, 864)
+                      + touch_bytes(ACTION_MOVE, 30, 40, 480, 864)
+                      + touch_bytes(ACTION_MOVE, 50, 60, 480, 864)
+                      + touch_bytes(ACTION_UP, 50, 60, 480, 864)]
+
+
+def test_keycode_layout():
+    writes = run([lambda s: s.key(4, ACTION_DOWN, repeat=1, meta_state=0x41)], 1)
+    assert writes == [bytes([0, ACTION_DOWN]) + (4).to_bytes(4, "big") + (1).to_bytes(4, "big")
+                      + (0x41).to_bytes(4, "big")]
+
+
+def test_queued_writes_keep_their_order():
+    calls = [lambda s, i=i: s.tap(i, i, space="video") for i in range(50)]
+    writes = run(calls, 50)
+    assert writes == [touch_bytes(ACTION_DOWN, i, i, 480, 864) + touch_bytes(ACTION_UP, i, i, 480, 864)
+                      for i in range(50)]
+
+
+def test_sender_outlives_a_reconnecting_channel():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    received = bytearray()
+
+    async def handle(reader, writer):
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                return
+            received.extend(data)
+
+    async def connect():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        _, writer = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+        return server, writer
+
+    channel = _ControlChannel(write_timeout=1.0)
+    channel.loop = loop
+    sender = ControlSender(channel, video_size=(480, 864), survive_disconnects=True).start()
+    try:
+        # Reconnecting: no writer yet, so this tap is dropped
+        sender.tap(1, 1, space="video")
+        deadline = time.perf_counter() + 1.0
+        while sender.messages_dropped == 0 and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        assert sender.messages_dropped == 1
+
+        server, channel.writer = asyncio.run_coroutine_threadsafe(connect(), loop).result(1.0)
+        sender.tap(2, 2, space="video")
+        sender.tap(3, 3, space="video")
+        expected = b"".join(touch_bytes(action, i, i, 480, 864) for i in (2, 3) for action in (ACTION_DOWN, ACTION_UP))
+        deadline = time.perf_counter() + 1.0
+        while len(received) < len(expected) and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        assert bytes(received) == expected
+        assert sender.error is None and sender.messages_sent == 2
+    finally:
+        sender.stop()
+
+        async def shut_down():
+            channel.writer.close()
+            server.close()
+            await server.wait_closed()
+            await asyncio.sleep(0.05)  # let the handler see the hang-up
+        asyncio.run_coroutine_threadsafe(shut_down(), loop).result(1.0)
+        loop.call_soon_threadsafe(loop.stop)
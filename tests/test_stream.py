@@ -0,0 +1,106 @@
+import itertools
+import os
+
+import av
+import cv2
+import numpy as np
+import pytest
+
+from agent.agent import ClashAgent
+from agent.frame_access import FrameView
+from agent.frame_ring import TASKS
+from agent.stream import ANALYZER_REGIONS, StreamSettings, negotiate, regions
+
+SUBSETS = [list(subset) for size in range(1, len(ANALYZER_REGIONS) + 1)
+           for subset in itertools.combinations(sorted(ANALYZER_REGIONS), size)]
+
+
+@pytest.fixture(scope="module")
+def assets(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("assets")
+    rng = np.random.default_rng(0)
+    cards = directory / "cards"
+    cards.mkdir()
+    for name in ("knight", "archers", "giant"):
+        cv2.imwrite(str(cards / f"{name}.png"), rng.integers(0, 256, (120, 96, 3), dtype=np.uint8))
+    background = directory / "background.png"
+    cv2.imwrite(str(background), rng.integers(0, 256, (664, 488, 3), dtype=np.uint8))
+    return str(cards), str(background)
+
+
+def frame_view(size, seed=1):
+    width, height = size
+    image = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return FrameView(av.VideoFrame.from_ndarray(image, format="bgr24").reformat(format="yuv420p"))
+
+
+@pytest.mark.parametrize("analyzers", SUBSETS, ids="+".join)
+def test_negotiated_regions_fit_the_frame(analyzers):
+    settings = negotiate(analyzers)
+    width, height = settings.video_size
+    covered = regions(settings.coords(), settings.analyzers)
+    assert set(covered) == set(analyzers)
+    for boxes in covered.values():
+        for box in boxes.values():
+            assert box["x"] >= 0 and box["y"] >= 0 and box["width"] > 0 and box["height"] > 0
+            assert box["x"] + box["width"] <= width and box["y"] + box["height"] <= height
+
+
+@pytest.mark.parametrize("analyzers", SUBSETS, ids="+".join)
+def test_agent_builds_and_updates_negotiated_analyzers(analyzers, assets):
+    cards_path, background_path = assets
+    settings = negotiate(analyzers)
+    offloaded = {name: ({"cards_path": cards_path} if name == "hud" else {}) for name in analyzers}
+    agent = ClashAgent("adb", background_path, cards_path=cards_path, stream=settings, analysis_tasks=offloaded)
+
+    assert (agent.tower_tracker is not None) == ("towers" in analyzers)
+    assert (agent.hud_reader is not None) == ("hud" in analyzers)
+
+    view = frame_view(settings.video_size)
+    agent._ClashAgent__process_frame(view)
+    agent._ClashAgent__highlight_differences(view.bgr())
+    agent._ClashAgent__process_frame(frame_view(settings.video_size, seed=2))
+
+    # The same regions handed to the worker tasks
+    for name, kwargs in agent._ClashAgent__analysis_kwargs().items():
+        TASKS[name](**kwargs)(view)
+
+
+def test_offloading_uncovered_task_is_refused(assets):
+    cards_path, background_path = assets
+    agent = ClashAgent("adb", background_path, stream=negotiate(["troops"]), analysis_tasks=["towers"])
+    with pytest.raises(ValueError):
+        agent._ClashAgent__analysis_kwargs()
+
+
+def test_settings_round_trip(tmp_path):
+    settings = negotiate(["towers", "troops"])
+    path = os.path.join(tmp_path, "stream.json")
+    settings.save(path)
+    assert StreamSettings.load(path) == settings
+
+
+def test_pipelined_stages_convert_ahead_and_snapshot_towers(assets, monkeypatch):
+    cards_path, background_path = assets
+    settings = negotiate(["towers", "hud"])
+    agent = ClashAgent("adb", background_path, cards_path=cards_path, stream=settings)
+    width, height = settings.video_size
+    image = np.random.default_rng(3).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    frame = av.VideoFrame.from_ndarray(image, format="bgr24").reformat(format="yuv420p")
+
+    view = agent._ClashAgent__convert_frame(frame)
+
+    # The process stage only reads regions the convert stage already converted
+    def fail(width, height):
+        raise AssertionError("region converted on the process stage")
+
+    monkeypatch.setattr("agent.frame_access._scratch_frame", fail)
+    processed = agent._ClashAgent__process_frame(view)
+    assert processed.view is view
+    assert set(processed.towers) == set(agent.tower_tracker.states)
+
+    # Later frames update the tracker, not the snapshot handed to the display stage
+    towers = dict(processed.towers)
+    for state in agent.tower_tracker.states.values():
+        state.alive, state.health = False, 0.0
+    assert processed.towers == towers
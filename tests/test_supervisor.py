@@ -0,0 +1,57 @@
+import socket
+import time
+
+from agent import supervisor
+from agent.replay import StreamRecorder, encode_stream, handshake_bytes
+from agent.supervisor import ReplayBackend, Supervisor
+from benchmarks.synthetic import SyntheticMatch
+
+FRAMES = 20
+
+
+class CrashingReplayBackend(ReplayBackend):
+    """
+    Serves a stream that breaks right after the handshake for the first
+    `crashes` launches, then a playable one.
+    """
+
+    def __init__(self, broken: str, playable: str, crashes: int):
+        super().__init__(playable, count=1, realtime=False)
+        self.broken, self.playable = broken, playable
+        self.crashes = crashes
+        self.launches = []
+
+    def start_server(self, serial, port, log_path=None):
+        self.launches.append(time.perf_counter())
+        self.recording = self.broken if len(self.launches) <= self.crashes else self.playable
+        return super().start_server(serial, port, log_path)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_crashed_station_is_restarted_with_backoff(tmp_path, monkeypatch):
+    playable, broken = str(tmp_path / "match.bin"), str(tmp_path / "broken.bin")
+    encode_stream(SyntheticMatch(seed=8).frames(FRAMES), playable)
+    with StreamRecorder(broken) as recorder:
+        recorder.write(handshake_bytes("broken", 576, 1024), timestamp=0.0)
+        recorder.write(bytes(64), timestamp=0.0)
+    backend = CrashingReplayBackend(broken, playable, crashes=2)
+    monkeypatch.setattr(supervisor, "HEALTH_INTERVAL", 0.05)
+
+    runner = Supervisor(backend, base_port=free_port(), results_dir=str(tmp_path / "results"), matches=1,
+                        max_restarts=3, agent_args=("adb", ""))
+    records = runner.run(duration=60)
+
+    station = runner.stations[0]
+    assert (station.status, station.matches, station.restarts) == ("done", 1, 2)
+    failures = [record for record in records if "failure" in record]
+    assert len(failures) == 2
+    assert [record["frames"] for record in records if "failure" not in record][-1] == FRAMES
+    # 1 s, then 2 s between launches
+    first, second = (later - earlier for earlier, later in zip(backend.launches, backend.launches[1:]))
+    assert 1.0 <= first < second
+    assert second >= 2.0
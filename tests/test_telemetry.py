@@ -0,0 +1,23 @@
+import time
+
+from agent.telemetry import Telemetry
+
+
+def test_overlapping_runs_of_a_stage_keep_their_own_start():
+    telemetry = Telemetry(report_interval=0)
+    outer = telemetry.stage("decode")
+    with outer:
+        time.sleep(0.02)
+        with telemetry.stage("decode"):
+            pass
+    stats = telemetry.summary()["decode"]
+    assert stats["count"] == 2
+    assert stats["max"] >= 20.0
+
+
+def test_disabled_telemetry_records_nothing():
+    telemetry = Telemetry(enabled=False)
+    with telemetry.stage("decode"):
+        pass
+    telemetry.record("latency", 1.0)
+    assert telemetry.summary() == {}
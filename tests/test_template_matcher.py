@@ -0,0 +1,36 @@
+import cv2
+import pytest
+
+from benchmarks.synthetic import SyntheticMatch
+from constants import BATTLE_FIELD_BOX, TOWER_BOXES
+from tokenizer.template_matcher import TemplateMatcher
+
+FIELD = BATTLE_FIELD_BOX
+TEMPLATE_BOXES = {
+    "tower": TOWER_BOXES["enemy_left_tower"],
+    # Textured grass, walked over by sprites in later frames
+    "grass": {"x": FIELD["x"] + 121, "y": FIELD["y"] + 400, "width": 48, "height": 40},
+}
+
+
+@pytest.fixture(scope="module")
+def gray_frames():
+    match = SyntheticMatch(seed=4)
+    return [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in match.frames(30)]
+
+
+@pytest.mark.parametrize("name", TEMPLATE_BOXES)
+def test_pyramid_match_agrees_with_full_frame_match(gray_frames, name):
+    box = TEMPLATE_BOXES[name]
+    template = gray_frames[0][box["y"]:box["y"] + box["height"], box["x"]:box["x"] + box["width"]].copy()
+    matcher = TemplateMatcher(template)
+    assert matcher.levels == 2
+    tracker = TemplateMatcher(template)
+
+    for gray in gray_frames:
+        _, _, _, (x, y) = cv2.minMaxLoc(cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED))
+        for result in (matcher.full_search(gray), tracker.match(gray)):
+            assert result.found
+            assert abs(result.x - x) <= 1 and abs(result.y - y) <= 1
+    # Frames after the first are found from the tracking window
+    assert not tracker.last.full_search
@@ -0,0 +1,40 @@
+import numpy as np
+
+from tokenizer.game_types import SIDE_ENEMY, GameState, TroopNames
+from tokenizer.timeline import TOWER_NAMES, TimelineReader, TimelineWriter
+
+
+def test_towers_troops_and_names_round_trip(tmp_path):
+    path = str(tmp_path / "match")
+    # A table the reader's process never saw, with ids that differ from the timeline's
+    names = TroopNames(["archers", "giant", "knight"])
+    troops = GameState(names=names)
+    troops.add("knight", 0.25, 0.5, track_id=3)
+    troops.add("giant", 0.75, 0.125, side=SIDE_ENEMY, hp=0.5, track_id=7)
+    alive = np.ones(len(TOWER_NAMES), dtype=np.uint8)
+    alive[0] = 0
+    health = np.linspace(0, 1, len(TOWER_NAMES), dtype=np.float32)
+
+    with TimelineWriter(path) as writer:
+        writer.append(0, 0.0, alive, health, troops=troops, elixir=4.0)
+        writer.append(1, 0.1, alive, health)
+    # Reopening in another "process" keeps the saved ids
+    with TimelineWriter(path) as writer:
+        troops.clear()
+        troops.add("archers", 0.5, 0.5)
+        writer.append(2, 0.2, troops=troops)
+
+    reader = TimelineReader(path)
+    assert len(reader) == 3
+    first, second, third = reader.records
+    np.testing.assert_array_equal(first["tower_alive"], alive)
+    np.testing.assert_array_equal(first["tower_health"], health)
+    assert first["elixir"] == 4.0
+    assert reader.troop_names(first) == ["knight", "giant"]
+    stored = reader.troops(first)
+    np.testing.assert_array_equal(stored["x"], [0.25, 0.75])
+    np.testing.assert_array_equal(stored["side"], [0, SIDE_ENEMY])
+    np.testing.assert_array_equal(stored["track_id"], [3, 7])
+    assert second["troop_count"] == 0
+    assert reader.troop_names(third) == ["archers"]
+    assert reader.names.names() == ["giant", "knight", "archers"]
@@ -0,0 +1,16 @@
+import numpy as np
+
+from agent.tower_tracker import TowerTracker
+
+BOX = {"x": 0, "y": 0, "width": 64, "height": 64}
+
+
+def test_slow_change_is_rechecked_despite_dirty_gating():
+    tracker = TowerTracker(boxes={"enemy_king": BOX}, recheck_interval=10)
+    frame = np.random.default_rng(0).integers(40, 200, (64, 64, 3), dtype=np.uint8)
+    evaluated = tracker.update(frame)
+    for _ in range(20):
+        # Far below any per-frame threshold, so a change map never flags it
+        frame = frame + 1
+        evaluated += tracker.update(frame, dirty=[])
+    assert evaluated.count("enemy_king") == 3
@@ -0,0 +1,50 @@
+import numpy as np
+
+from benchmarks.synthetic import SyntheticMatch
+from tokenizer.background_model import RunningBackground
+from tokenizer.troop_detector import TroopDetector, TroopTracker
+
+# Seed whose sprites all stand out from the grass in grayscale and never touch
+MATCH = SyntheticMatch(sprites=6, seed=14)
+FRAMES = 90
+SPRITE_SIZE = (18, 22)
+
+
+def sprite_boxes(index):
+    return np.hstack([MATCH.positions(index), np.tile(SPRITE_SIZE, (6, 1))]).astype(np.float32)
+
+
+def test_detected_troops_keep_their_ids():
+    detector = TroopDetector(RunningBackground(warmup=10))
+    # The arena is empty before the troops are deployed
+    for _ in range(10):
+        detector.update(MATCH.background)
+
+    ids = {}
+    for index in range(FRAMES):
+        detector.update(MATCH.frame(index))
+        if index == 0:
+            continue  # tracks are reported from their second detection
+        boxes = detector.boxes_by_id()
+        assert len(boxes) == 6
+        for sprite, (x, y, w, h) in enumerate(sprite_boxes(index)):
+            cx, cy = x + w / 2, y + h / 2
+            found = [i for i, (bx, by, bw, bh) in boxes.items() if bx <= cx < bx + bw and by <= cy < by + bh]
+            assert len(found) == 1
+            assert ids.setdefault(sprite, found[0]) == found[0], f"sprite {sprite} changed id on frame {index}"
+    assert len(set(ids.values())) == 6
+
+
+def test_tracks_survive_missed_detections():
+    tracker = TroopTracker()
+    first = None
+    for index in range(40):
+        boxes = sprite_boxes(index)
+        # Sprite 0 goes undetected for a few frames
+        detections = boxes[1:] if 20 <= index < 23 else boxes
+        reported, ids = tracker.update(detections)
+        if index == 1:
+            first = {tuple(box): i for box, i in zip(reported, ids)}
+            first = [first[tuple(box)] for box in boxes]
+    final = dict(zip(map(tuple, reported), ids))
+    assert [final[tuple(box)] for box in boxes] == first
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+
+from agent.lazy import lazy_import
+from constants import BATTLE_FIELD_BOX
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+"""
+Running background model for the battlefield.
+
+Replaces OpenCV's GMG subtractor (slow, and only available in opencv-contrib)
+with a grayscale model that only looks at the battlefield box, optionally at
+reduced resolution. The background is either an exponential moving average or
+a running median over a short history, and is updated in place with
+vectorized NumPy on preallocated buffers.
+"""
+
+Box = Dict[str, int]
+
+METHODS = ("ema", "median")
+
+# opencv-contrib (cv2.bgsegm) subtractors by name, for comparing against RunningBackground
+CONTRIB_SUBTRACTORS = {
+    "gmg": "createBackgroundSubtractorGMG",
+    "mog": "createBackgroundSubtractorMOG",
+    "cnt": "createBackgroundSubtractorCNT",
+    "gsoc": "createBackgroundSubtractorGSOC",
+    "lsbp": "createBackgroundSubtractorLSBP",
+}
+
+
+def contrib_subtractor(name: str, **kwargs):
+    """
+    Creates an opencv-contrib background subtractor. cv2.bgsegm is only looked
+    up here, so nothing contrib-specific loads unless a subtractor is asked for.
+
+    Raises:
+        ImportError: The installed OpenCV build has no bgsegm module
+    """
+    if name not in CONTRIB_SUBTRACTORS:
+        raise ValueError(f"name must be one of {tuple(CONTRIB_SUBTRACTORS)}")
+    bgsegm = getattr(cv2, "bgsegm", None)
+    if bgsegm is None:
+        raise ImportError(f"The '{name}' background subtractor needs opencv-contrib-python")
+    return getattr(bgsegm, CONTRIB_SUBTRACTORS[name])(**kwargs)
+
+
+class RunningBackground:
+    """
+    Args:
+        box: Region to model, in frame px (battlefield by default)
+        scale: Resolution factor applied to the region before modeling
+        method: "ema" (exponential average) or "median" (running median)
+        alpha: EMA learning rate
+        history: Number of samples in the median history
+        median_every: Frames between median history samples
+        threshold: Gray-level difference above which a pixel is foreground
+        warmup: Frames used only to learn the background (empty masks meanwhile)
+        min_area: Minimum blob area in full-resolution px for boxes()
+    """
+
+    def __init__(self, box: Optional[Box] = None, scale: float = 0.5, method: str = "ema", alpha: float = 0.02,
+                 history: int = 15, median_every: int = 4, threshold: float = 25.0, warmup: int = 30,
+                 min_area: int = 200):
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}")
+        self.box = BATTLE_FIELD_BOX if box is None else box
+        self.scale = scale
+        self.method = method
+        self.alpha = alpha
+        self.median_every = median_every
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_area = min_area
+        self.frame_count = 0
+
+        w = max(int(self.box["width"] * scale), 1)
+        h = max(int(self.box["height"] * scale), 1)
+        self.size = (w, h)
+        self.__gray = np.empty((self.box["height"], self.box["width"]), dtype=np.uint8)
+        self.__sample = np.empty((h, w), dtype=np.uint8)
+        self.__sample_f = np.empty((h, w), dtype=np.float32)
+        self.__diff = np.empty((h, w), dtype=np.float32)
+        self.__background = np.zeros((h, w), dtype=np.float32)
+        self.__history = np.empty((history, h, w), dtype=np.uint8)
+        self.__median_work = np.empty_like(self.__history)
+        self.__history_count = 0
+        self.__foreground = np.zeros((h, w), dtype=np.bool_)
+        self.__kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+    @property
+    def background(self) -> np.ndarray:
+        return self.__background
+
+    def __load(self, frame: np.ndarray) -> None:
+        b = self.box
+        roi = frame[b["y"]:b["y"] + b["height"], b["x"]:b["x"] + b["width"]]
+        gray = roi if roi.ndim == 2 else cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY, dst=self.__gray)
+        if self.scale == 1:
+            self.__sample[:] = gray
+        else:
+            cv2.resize(gray, self.size, dst=self.__sample, interpolation=cv2.INTER_AREA)
+        self.__sample_f[:] = self.__sample
+
+    def __update(self) -> None:
+        if self.method == "ema":
+            if self.frame_count == 0:
+                self.__background[:] = self.__sample_f
+                return
+            # background += alpha * (sample - background)
+            np.subtract(self.__sample_f, self.__background, out=self.__diff)
+            self.__diff *= self.alpha
+            self.__background += self.__diff
+        elif self.frame_count % self.median_every == 0:
+            slot = self.__history_count % len(self.__history)
+            self.__history[slot] = self.__sample
+            self.__history_count += 1
+            filled = min(self.__history_count, len(self.__history))
+            # Partitions a copy in place (the history's slot order is needed for
+            # replacement); np.median would allocate a sorted copy on every call
+            work = self.__median_work[:filled]
+            np.copyto(work, self.__history[:filled])
+            middle = filled // 2
+            if filled % 2:
+                work.partition(middle, axis=0)
+                self.__background[:] = work[middle]
+            else:
+                work.partition((middle - 1, middle), axis=0)
+                np.add(work[middle - 1], work[middle], out=self.__background, dtype=np.float32)
+                self.__background *= 0.5
+
+    def apply(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Updates the model with a frame and returns its foreground mask.
+
+        Args:
+            frame: Full BGR (or grayscale) frame
+
+        Returns:
+            (h, w) uint8 mask of 0/1 values at model resolution, cleaned with an
+            opening and a dilation. Empty during warmup.
+        """
+        self.__load(frame)
+        if self.frame_count >= self.warmup:
+            np.subtract(self.__sample_f, self.__background, out=self.__diff)
+            np.abs(self.__diff, out=self.__diff)
+            np.greater(self.__diff, self.threshold, out=self.__foreground)
+        self.__update()
+        self.frame_count += 1
+
+        mask = self.__foreground.view(np.uint8)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.__kernel)
+        return cv2.dilate(mask, self.__kernel, iterations=2)
+
+    def boxes(self, mask: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """
+        Bounding boxes (x, y, w, h) of foreground blobs, in full frame px.
+        """
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = self.min_area * self.scale * self.scale
+        inverse = 1 / self.scale
+        ox, oy = self.box["x"], self.box["y"]
+        boxes = []
+        for cnt in contours:
+            if cv2.contourArea(cnt) > min_area:
+                x, y, w, h = cv2.boundingRect(cnt)
+                boxes.append((ox + int(x * inverse), oy + int(y * inverse), int(w * inverse), int(h * inverse)))
+        return boxes
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, List, NamedTuple, Optional
+
+from agent.change_map import ChangeMap
+from agent.coords import CoordinateSpaces
+from agent.decoder import DecoderConfig, configure_codec_context
+from agent.frame_access import YUV420_FORMATS, FrameView
+from agent.lazy import lazy_import
+from agent.tower_tracker import TowerTracker
+from constants import TOWER_BOXES
+from tokenizer.template_matcher import TemplateMatcher
+
+av = lazy_import("av")
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+"""
+Headless batch tokenization of recorded matches.
+
+Videos are split into shards of roughly --shard-frames frames, cut at keyframes
+so every shard can be decoded independently after a seek. Shards run on a
+process pool, and each one writes its per-frame records as columns to a single
+.npz file in the video's own directory (see video_key). A shard's file is
+written under a temporary name and renamed when complete, so a rerun after a
+crash skips every finished shard and redoes only the rest.
+
+Tower states are tracked per shard, but every shard's tracker is first seeded
+with the video's first frame, so the reference appearance and health bar are
+the same in all shards. A tower destroyed in an earlier shard is re-confirmed
+within a few frames of the next one, and load_tokens() keeps destroyed towers
+destroyed across shard boundaries.
+
+A tile change map decides what gets analyzed: exact duplicate frames repeat
+the previous record, towers are only re-evaluated when a tile under them
+changed, and the template match is reused while nothing changed under the last
+match.
+
+Usage:
+    python -m tokenizer.batch_tokenize videos/ --output tokens/ [--workers 8]
+    python -m tokenizer.batch_tokenize "videos/*.mp4" --template images/default_arena.jpeg
+"""
+
+# Containers only: raw Annex-B .h264 has no timestamps to cut and seek shards by
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".avi")
+
+TOWER_NAMES = list(TOWER_BOXES)
+
+
+class Shard(NamedTuple):
+    video_path: str
+    start: int  # first frame index (a keyframe)
+    end: int  # one past the last frame index
+    start_pts: int
+    end_pts: Optional[int]  # pts of frame `end`, None for the last shard
+
+    @property
+    def name(self) -> str:
+        return f"{video_key(self.video_path)}/{self.start:07d}_{self.end:07d}"
+
+
+def video_key(video_path: str) -> str:
+    """
+    Directory name for a video's shards: its file name plus a hash of its
+    absolute path, so same-named videos in different directories don't collide.
+    """
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    digest = hashlib.sha1(os.path.abspath(video_path).encode()).hexdigest()[:8]
+    return f"{stem}-{digest}"
+
+
+def find_videos(inputs: Iterable[str]) -> List[str]:
+    """
+    Expands directories and glob patterns into a sorted list of video files.
+    """
+    videos = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                videos.update(os.path.join(root, f) for f in files if f.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos.update(p for p in glob.glob(pattern) if os.path.isfile(p))
+    return sorted(videos)
+
+
+def plan_shards(video_path: str, shard_frames: int) -> List[Shard]:
+    """
+    Splits a video into shards at keyframes by demuxing packets (no decoding).
+    """
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        packets = [(p.pts, p.is_keyframe) for p in container.demux(stream) if p.pts is not None]
+
+    # Frame index follows presentation order
+    packets.sort()
+    pts = [p for p, _ in packets]
+    keyframes = [i for i, (_, key) in enumerate(packets) if key]
+    if not keyframes or keyframes[0] != 0:
+        keyframes.insert(0, 0)
+
+    shards = []
+    start = 0
+    for index in keyframes[1:] + [len(pts)]:
+        if index - start >= shard_frames or index == len(pts):
+            if index > start:
+                end_pts = pts[index] if index < len(pts) else None
+                shards.append(Shard(video_path, start, index, pts[start], end_pts))
+                start = index
+    return shards
+
+
+def _frame_view(frame) -> FrameView:
+    if frame.format.name not in YUV420_FORMATS:
+        frame = frame.reformat(format="yuv420p")
+    return FrameView(frame)
+
+
+def _first_frame(video_path: str) -> FrameView:
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        configure_codec_context(stream.codec_context, DecoderConfig(threading="single"))
+        return _frame_view(next(container.decode(stream)))
+
+
+def _match_box(match) -> dict:
+    return {"x": match.x, "y": match.y, "width": match.width, "height": match.height}
+
+
+def tokenize_shard(shard: Shard, output_dir: str, template_path: Optional[str] = None) -> str:
+    """
+    Decodes one shard and writes its per-frame records to <output_dir>/<shard>.npz.
+
+    Columns:
+        frame, timestamp                      - frame index and seconds from the start
+        tower_alive, tower_health             - (frames, towers) in TOWER_NAMES order
+        match_score, match_x, match_y         - template match (only with a template)
+    """
+    # One process per core already; keep OpenCV from spawning its own threads
+    cv2.setNumThreads(1)
+
+    matcher = None
+    if template_path is not None:
+        matcher = TemplateMatcher(cv2.imread(template_path, cv2.IMREAD_GRAYSCALE))
+
+    columns = {name: [] for name in ("frame", "timestamp", "tower_alive", "tower_health")}
+    if matcher is not None:
+        columns.update(match_score=[], match_x=[], match_y=[])
+
+    with av.open(shard.video_path) as container:
+        stream = container.streams.video[0]
+        configure_codec_context(stream.codec_context, DecoderConfig(threading="single"))
+        container.seek(shard.start_pts, stream=stream, backward=True, any_frame=False)
+
+        # Regions are measured on the 576x1024 layout; scale them to the recording's size
+        width, height = stream.codec_context.width, stream.codec_context.height
+        tower_boxes = CoordinateSpaces.from_stream(width, height).boxes(TOWER_BOXES)
+        tracker = TowerTracker(tower_boxes)
+        if shard.start > 0:
+            # Same tower references as the shard holding the video's first frame
+            tracker.update(_first_frame(shard.video_path))
+        changes = ChangeMap(width, height)
+
+        index = shard.start
+        for frame in container.decode(stream):
+            if frame.pts is None or frame.pts < shard.start_pts:
+                continue
+            if shard.end_pts is not None and frame.pts >= shard.end_pts:
+                break
+
+            view = _frame_view(frame)
+            columns["frame"].append(index)
+            columns["timestamp"].append(float((frame.pts - (stream.start_time or 0)) * stream.time_base))
+            index += 1
+            if not changes.update(view):
+                # Exact duplicate of the previous frame (never the first): same record
+                for name in columns.keys() - {"frame", "timestamp"}:
+                    columns[name].append(columns[name][-1])
+                continue
+
+            tracker.update(view, dirty=changes.dirty_regions(tower_boxes))
+            states = tracker.states
+            columns["tower_alive"].append([states[name].alive for name in TOWER_NAMES])
+            columns["tower_health"].append([states[name].health for name in TOWER_NAMES])
+            if matcher is not None:
+                match = matcher.last
+                if match is None or not match.found or changes.is_dirty(_match_box(match)):
+                    match = matcher.match(view.luma())
+                columns["match_score"].append(match.score)
+                columns["match_x"].append(match.x)
+                columns["match_y"].append(match.y)
+
+    dtypes = {"frame": np.int64, "timestamp": np.float64, "tower_alive": np.bool_, "tower_health": np.float32,
+              "match_score": np.float32, "match_x": np.int32, "match_y": np.int32}
+    arrays = {name: np.asarray(values, dtype=dtypes[name]) for name, values in columns.items()}
+
+    path = os.path.join(output_dir, shard.name + ".npz")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, path)
+    return path
+
+
+def run(inputs: List[str], output_dir: str, workers: Optional[int] = None, shard_frames: int = 900,
+        template_path: Optional[str] = None) -> List[str]:
+    """
+    Tokenizes every video, skipping shards whose output already exists.
+
+    Returns:
+        Paths of the shard files written in this run
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    videos = find_videos(inputs)
+    shards = []
+    for video in videos:
+        planned = plan_shards(video, shard_frames)
+        if not planned:
+            print(f"⚠️ {video}: no timestamped video packets, skipping")
+        shards.extend(planned)
+    pending = [s for s in shards if not os.path.exists(os.path.join(output_dir, s.name + ".npz"))]
+    print(f"{len(videos)} videos, {len(shards)} shards, {len(shards) - len(pending)} already done")
+
+    written = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(tokenize_shard, shard, output_dir, template_path): shard for shard in pending}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                written.append(future.result())
+                print(f"✅ {shard.name} ({len(written)}/{len(pending)})")
+            except Exception as e:
+                print(f"❗ {shard.name} failed: {e}")
+    return written
+
+
+def load_tokens(output_dir: str, video_path: str) -> dict:
+    """
+    Concatenates a video's shard files back into one set of columns, in frame order.
+
+    Destroyed is final, so a tower stays destroyed (health 0) from the first
+    frame any shard saw it destroyed.
+    """
+    paths = sorted(glob.glob(os.path.join(output_dir, glob.escape(video_key(video_path)), "*.npz")))
+    shards = [np.load(path) for path in paths]
+    if not shards:
+        return {}
+    tokens = {name: np.concatenate([shard[name] for shard in shards]) for name in shards[0].files}
+    alive = np.logical_and.accumulate(tokens["tower_alive"], axis=0)
+    tokens["tower_health"] = np.where(alive, tokens["tower_health"], 0).astype(np.float32)
+    tokens["tower_alive"] = alive
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tokenize recorded matches in parallel")
+    parser.add_argument("inputs", nargs="+", help="Video files, directories or glob patterns")
+    parser.add_argument("--output", default="tokens")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--shard-frames", type=int, default=900, help="Target frames per shard")
+    parser.add_argument("--template", default=None, help="Grayscale template to match every frame")
+    args = parser.parse_args()
+
+    run(args.inputs, args.output, workers=args.workers, shard_frames=args.shard_frames,
+        template_path=args.template)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,219 @@
-from pydantic import BaseModel
-from typing import Annotated
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Protocol
+
+from agent.lazy import lazy_import
+from constants import BATTLE_FIELD_BOX, TOWER_BOXES
+
+np = lazy_import("numpy")
 
 class Game:
     pass
 
-class Troop(BaseModel):
+class TroopLike(Protocol):
+    """
+    What GameState needs of a troop; tokenizer.troop.Troop satisfies it.
+    """
+    name: str
+    x_position: float
+    y_position: float
+
+
+def troop_model() -> type:
+    """
+    The pydantic Troop model (tokenizer/troop.py), imported on first use so that
+    pydantic is only loaded by code that actually handles Troop objects.
+    """
+    from tokenizer.troop import Troop
+
+    return Troop
+
+
+def __getattr__(name: str):
+    # Keeps `from tokenizer.game_types import Troop` working
+    if name == "Troop":
+        troop = globals()["Troop"] = troop_model()
+        return troop
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+SIDE_USER = 0
+SIDE_ENEMY = 1
+
+# Arena height over width, so distances in normalized coordinates can be made isotropic
+ARENA_ASPECT = BATTLE_FIELD_BOX["height"] / BATTLE_FIELD_BOX["width"]
+
+
+def _normalized_center(box: Dict[str, int]) -> tuple:
+    cx = box["x"] + box["width"] / 2
+    cy = box["y"] + box["height"] / 2
+    return ((cx - BATTLE_FIELD_BOX["x"]) / BATTLE_FIELD_BOX["width"],
+            (cy - BATTLE_FIELD_BOX["y"]) / BATTLE_FIELD_BOX["height"])
+
+
+# Tower centers in the same 0 to 1 arena coordinates as Troop positions
+# (the enemy king tower sits above the battlefield box, so its y is negative)
+TOWER_CENTERS = {name: _normalized_center(box) for name, box in TOWER_BOXES.items()}
+
+
+class TroopNames:
+    """
+    Interning table mapping troop names to small integer type ids.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.__ids: Dict[str, int] = {}
+        self.__names: List[str] = []
+        for name in names:
+            self.id(name)
+
+    def id(self, name: str) -> int:
+        type_id = self.__ids.get(name)
+        if type_id is None:
+            type_id = self.__ids[name] = len(self.__names)
+            self.__names.append(name)
+        return type_id
+
+    def name(self, type_id: int) -> str:
+        return self.__names[type_id]
+
+    def names(self) -> List[str]:
+        """
+        All names, indexed by type id.
+        """
+        return list(self.__names)
+
+    def __len__(self):
+        return len(self.__names)
+
 
-    name: str # i.e. witch
+# Shared so type ids stay the same across frames and snapshots
+TROOP_NAMES = TroopNames()
 
+
+class GameState:
     """
-        Position is displayed on 0 to 1 scale
-        1 is the end of the horizontal or vertical part of the screen
-        pos_on_screen = length_of_arena_on_screen * pos
+    Troops of one frame stored as NumPy columns (struct of arrays).
+
+    Columns: type_id, x, y (0 to 1 arena coordinates, like Troop), side
+    (SIDE_USER / SIDE_ENEMY), hp (0 to 1 estimate) and track_id (-1 if untracked).
+    Convert to and from Troop objects only at API boundaries.
     """
-    x_position: Annotated[float, {"min_value": 0, "max_value": 1}]
-    y_position: Annotated[float, {"min_value": 0, "max_value": 1}]
\ No newline at end of file
+
+    # dtype names rather than NumPy types, so NumPy is not loaded at import time
+    COLUMNS = {
+        "type_id": "int16",
+        "x": "float32",
+        "y": "float32",
+        "side": "int8",
+        "hp": "float32",
+        "track_id": "int32",
+    }
+
+    def __init__(self, capacity: int = 64, names: TroopNames = TROOP_NAMES):
+        self.names = names
+        self.count = 0
+        self.__columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.COLUMNS.items()}
+
+    def __len__(self):
+        return self.count
+
+    def __column(self, name: str) -> np.ndarray:
+        return self.__columns[name][:self.count]
+
+    type_id = property(lambda self: self.__column("type_id"))
+    x = property(lambda self: self.__column("x"))
+    y = property(lambda self: self.__column("y"))
+    side = property(lambda self: self.__column("side"))
+    hp = property(lambda self: self.__column("hp"))
+    track_id = property(lambda self: self.__column("track_id"))
+
+    def __reserve(self, size: int) -> None:
+        capacity = len(self.__columns["x"])
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name, column in self.__columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.count] = column[:self.count]
+            self.__columns[name] = grown
+
+    def clear(self) -> None:
+        """
+        Empties the state, keeping its buffers for the next frame.
+        """
+        self.count = 0
+
+    def add(self, name: str, x: float, y: float, side: int = SIDE_USER, hp: float = 1.0, track_id: int = -1) -> int:
+        """
+        Appends one troop and returns its row index.
+        """
+        self.__reserve(self.count + 1)
+        row = self.count
+        values = (self.names.id(name), x, y, side, hp, track_id)
+        for column, value in zip(self.__columns.values(), values):
+            column[row] = value
+        self.count += 1
+        return row
+
+    def extend(self, type_id: np.ndarray, x: np.ndarray, y: np.ndarray, side=SIDE_USER, hp=1.0,
+               track_id=-1) -> None:
+        """
+        Appends many troops at once. Scalars are broadcast.
+        """
+        n = len(x)
+        self.__reserve(self.count + n)
+        start, end = self.count, self.count + n
+        values = (type_id, x, y, side, hp, track_id)
+        for column, value in zip(self.__columns.values(), values):
+            column[start:end] = value
+        self.count = end
+
+    def within_radius(self, x: float, y: float, radius: float, side: Optional[int] = None) -> np.ndarray:
+        """
+        Row indices of troops within radius of (x, y).
+
+        Distances are measured in arena widths, with y scaled by the arena's
+        aspect ratio so the radius is a circle on screen.
+        """
+        dx = self.x - x
+        dy = (self.y - y) * ARENA_ASPECT
+        inside = dx * dx + dy * dy <= radius * radius
+        if side is not None:
+            inside &= self.side == side
+        return np.flatnonzero(inside)
+
+    def near_tower(self, tower: str, radius: float, side: Optional[int] = None) -> np.ndarray:
+        """
+        Row indices of troops within radius (arena widths) of a tower's center.
+        """
+        x, y = TOWER_CENTERS[tower]
+        return self.within_radius(x, y, radius, side)
+
+    def snapshot(self) -> "GameState":
+        """
+        Compact copy of the current rows, safe to keep after this state is reused.
+        """
+        copy = GameState(capacity=max(self.count, 1), names=self.names)
+        for name, column in self.__columns.items():
+            copy.__columns[name][:self.count] = column[:self.count]
+        copy.count = self.count
+        return copy
+
+    @classmethod
+    def from_troops(cls, troops: Iterable[TroopLike], side: int = SIDE_USER) -> "GameState":
+        troops = list(troops)
+        state = cls(capacity=max(len(troops), 1))
+        for troop in troops:
+            state.add(troop.name, troop.x_position, troop.y_position, side=side)
+        return state
+
+    def to_troops(self) -> List[TroopLike]:
+        """
+        Rows as tokenizer.troop.Troop objects.
+        """
+        return [
+            troop_model()(name=self.names.name(int(type_id)), x_position=float(x), y_position=float(y))
+            for type_id, x, y in zip(self.type_id, self.x, self.y)
+        ]
@@ -1,24 +1,39 @@
-import cv2
-import numpy as np
+from __future__ import annotations
+
+from typing import Optional
+
+from agent.change_map import ChangeMap
+from agent.coords import CoordinateSpaces
+from agent.lazy import lazy_import
+from agent.preview import Preview
+from agent.telemetry import Telemetry
+from constants import BATTLE_FIELD_BOX
+from tokenizer.background_model import RunningBackground, contrib_subtractor
+from tokenizer.template_matcher import TemplateMatcher
+from tokenizer.troop_detector import TroopDetector
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
 
 def get_state_from_frame(frame):
     """return state object from frame in video"""
     pass
 
-def analyze_video_frame_by_frame(video_path, template_path):
+def _frame_size(cap) -> tuple:
+    return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+def analyze_video_frame_by_frame(video_path, template_path, telemetry: Optional[Telemetry] = None,
+                                 preview: str = "window"):
+    telemetry = telemetry if telemetry is not None else Telemetry()
 
     template = cv2.imread(template_path, 0) # Read in grayscale for simplicity/speed
     if template is None:
         print(f"Error: Could not load template image at {template_path}")
         return
 
-    # Get the width and height of the template
-    w, h = template.shape[::-1] 
-    
-    # Define the template matching method
-    # Normalized Cross-Correlation is robust and works well
-    method = cv2.TM_CCOEFF_NORMED
-
+    # Coarse-to-fine matcher: searches a pyramid, then tracks around the last match
+    # You can set a threshold to ignore bad matches
+    matcher = TemplateMatcher(template, threshold=0.3) # A score close to 1.0 is a perfect match
 
     # 1. Open the video file
     # 0 is often used for the default camera, but for a file, use the path.
@@ -28,9 +43,12 @@ def analyze_video_frame_by_frame(video_path, template_path):
     if not cap.isOpened():
         print(f"Error: Could not open video file at {video_path}")
         return
+    # Sized to the video, so changes land on the tiles the match box is checked against
+    changes = ChangeMap(*_frame_size(cap))
 
     # A counter to track which frame we are processing
     frame_count = 0
+    viewer = Preview(preview, title='Video with Bounding Box')
 
     print("--- Starting Frame-by-Frame Analysis ---")
 
@@ -39,66 +57,71 @@ def analyze_video_frame_by_frame(video_path, template_path):
         # Read the next frame
         # 'ret' (boolean) is True if a frame was successfully read, False otherwise
         # 'frame' is the actual frame (a numpy array)
-        ret, frame = cap.read()
+        with telemetry.stage("read"):
+            ret, frame = cap.read()
 
         if ret:
             # --- START: Template Matching Logic ---
 
-            # Convert the current frame to grayscale
-            # Matching in grayscale often gives better results and is faster
-            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-            # Perform Template Matching
-            # The result is a 2D array (result_matrix) where each element 
-            # represents the match score at that (x, y) location.
-            result_matrix = cv2.matchTemplate(gray_frame, template, method)
-            
-            # Find the best match location
-            # minVal: minimum score, maxVal: maximum score
-            # minLoc: location (x, y) of the minimum score, maxLoc: location of the maximum score
-            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result_matrix)
+            with telemetry.stage("match"):
+                # Convert the current frame to grayscale
+                # Matching in grayscale often gives better results and is faster
+                gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+                # Find the best match location (data only, drawing happens below)
+                # The last match still holds while nothing changed under it
+                changes.update(gray_frame)
+                match = matcher.last
+                if match is None or not match.found or changes.is_dirty(
+                        {"x": match.x, "y": match.y, "width": match.width, "height": match.height}):
+                    match = matcher.match(gray_frame)
             
-            # For TM_CCOEFF_NORMED, the best match is the maximum value
-            top_left = max_loc
-            
-            # Define the coordinates for the bounding box
-            bottom_right = (top_left[0] + w, top_left[1] + h)
-            
-            # You can set a threshold to ignore bad matches
-            threshold = 0.3 # A score close to 1.0 is a perfect match
-            print(max_loc, max_val)
-            if max_val >= threshold:
-                # Draw the bounding box on the original color frame
-                cv2.rectangle(frame, top_left, bottom_right, (0, 255, 0), 2) # Green box, thickness 2
-                
-                # Optional: Add text showing the confidence score
-                cv2.putText(frame, f"Match: {max_val:.2f}", (top_left[0], top_left[1] - 10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            overlays = []
+            if match.found:
+                # The viewer draws the bounding box and the confidence score
+                overlays.append({"box": {"x": match.x, "y": match.y, "width": match.width, "height": match.height},
+                                 "label": f"Match: {match.score:.2f}"})
             # --- END: Template Matching Logic ---
 
-            # Display the result
-            cv2.imshow('Video with Bounding Box', frame)
+            # Display the result (rate limited, in the viewer process)
+            with telemetry.stage("display"):
+                keep_going = viewer.publish(frame, overlays)
+            telemetry.maybe_report()
             
-            # Exit on 'q' press
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            # Exit on 'q' press in the viewer
+            if not keep_going:
                 break
         else:
             # Break the loop if 'ret' is False (i.e., we've reached the end of the video)
             print("\nEnd of video stream.")
             break
 
-    # 3. Release the video object and destroy all windows
+    # 3. Release the video object and close the viewer
     cap.release()
-    cv2.destroyAllWindows()
+    viewer.close()
+    telemetry.report()
     print("--- Analysis Complete ---")
 
-def run_background_extraction(video_path):
-    # Use Mixture of Gaussain distribution models
-    # basically colors (rgb vals) that appear in many consecutive frames will be considered part of the background
-    # backSub = cv2.createBackgroundSubtractorMOG2(history=10, varThreshold=50, detectShadows=True)
-
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
-    backSub = cv2.bgsegm.createBackgroundSubtractorGMG(initializationFrames=120, decisionThreshold=0.8)
+def run_background_extraction(video_path, telemetry: Optional[Telemetry] = None, method: str = "running",
+                              preview: str = "window"):
+    """
+    Draws boxes around moving objects in the battlefield.
+
+    method="running" uses TroopDetector (RunningBackground model over the
+    battlefield at half resolution, connected components, tracked ids);
+    method="gmg" uses OpenCV's GMG subtractor on the full frame, which needs
+    opencv-contrib, and labels nothing.
+    """
+    telemetry = telemetry if telemetry is not None else Telemetry()
+
+    if method == "gmg":
+        # Use Mixture of Gaussain distribution models
+        # basically colors (rgb vals) that appear in many consecutive frames will be considered part of the background
+        # backSub = cv2.createBackgroundSubtractorMOG2(history=10, varThreshold=50, detectShadows=True)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
+        backSub = contrib_subtractor("gmg", initializationFrames=120, decisionThreshold=0.8)
+    labels = []
+    boxes = []
 
     cap = cv2.VideoCapture(video_path)
 
@@ -107,44 +130,70 @@ def run_background_extraction(video_path):
         print(f"Error: Could not open video file at {video_path}")
         return
 
+    # The battlefield box and the change map follow the video's size
+    width, height = _frame_size(cap)
+    changes = ChangeMap(width, height)
+    if method != "gmg":
+        coords = CoordinateSpaces.from_stream(width, height)
+        detector = TroopDetector(RunningBackground(box=coords.box(BATTLE_FIELD_BOX, "layout", "video")),
+                                 coords=coords)
+
     print("--- Starting Frame-by-Frame Analysis ---")
+    viewer = Preview(preview, title='Clash Detector - Result')
 
     while cap.isOpened():
-        ret, frame = cap.read()
+        with telemetry.stage("read"):
+            ret, frame = cap.read()
         if not ret:
             break
 
-        # --- THE CORE LOGIC ---
-        # Apply the subtractor to get the foreground mask
-        fg_mask = backSub.apply(frame)
-
-        # Clean up the mask (Morphological Operations)
-        # kernel = np.ones((5, 5), np.uint8)
-        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, kernel)
-        fg_mask = cv2.dilate(fg_mask, kernel, iterations=2)
-
-        # Find and draw contours on the ORIGINAL frame
-        contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        for cnt in contours:
-            if cv2.contourArea(cnt) > 200: # Adjust based on character size
-                x, y, w, h = cv2.boundingRect(cnt)
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                cv2.putText(frame, "Moving Object", (x, y-10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        # Exact duplicate frames skip the model and keep the previous boxes
+        if changes.update(frame):
+            # --- THE CORE LOGIC ---
+            with telemetry.stage("subtract"):
+                if method == "gmg":
+                    # Apply the subtractor to get the foreground mask
+                    fg_mask = backSub.apply(frame)
+
+                    # Clean up the mask (Morphological Operations)
+                    # kernel = np.ones((5, 5), np.uint8)
+                    fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, kernel)
+                    fg_mask = cv2.dilate(fg_mask, kernel, iterations=2)
+                else:
+                    detector.update(frame)
+
+            # Find blobs and draw them on the ORIGINAL frame
+            with telemetry.stage("contours"):
+                if method == "gmg":
+                    contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                    boxes = [cv2.boundingRect(cnt) for cnt in contours
+                             if cv2.contourArea(cnt) > 200] # Adjust based on character size
+                    labels = ["Moving Object"] * len(boxes)
+                else:
+                    tracked = detector.boxes_by_id()
+                    boxes = list(tracked.values())
+                    labels = [f"Troop #{track_id}" for track_id in tracked]
+
+        overlays = [{"box": {"x": x, "y": y, "width": w, "height": h}, "label": label}
+                    for (x, y, w, h), label in zip(boxes, labels)]
 
         # --- LOCAL DISPLAY ---
-        cv2.imshow('Clash Detector - Result', frame)
-        # cv2.imshow('MOG2 Background Mask', fg_mask)
+        # Boxes are drawn by the viewer process, which shows at most 10 fps
+        with telemetry.stage("display"):
+            keep_going = viewer.publish(frame, overlays)
+        telemetry.maybe_report()
 
-        # Press 'q' to exit the loop
-        if cv2.waitKey(30) & 0xFF == ord('q'):
+        # Press 'q' in the viewer to exit the loop
+        if not keep_going:
             break
 
     cap.release()
-    cv2.destroyAllWindows()
+    viewer.close()
+    telemetry.report()
 
 
-video_file_path = 'videos/vid_2.mp4' 
-template_image_path = "images/default_arena.jpeg"
-run_background_extraction(video_file_path)
\ No newline at end of file
+# The preview's viewer process is spawned, and re-imports this module as __mp_main__
+if __name__ == "__main__":
+    video_file_path = 'videos/vid_2.mp4' 
+    template_image_path = "images/default_arena.jpeg"
+    run_background_extraction(video_file_path)
\ No newline at end of file
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from typing import List, NamedTuple, Optional
+
+from agent.lazy import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+"""
+Coarse-to-fine template matching.
+
+A full search runs cv2.matchTemplate on a downsampled image pyramid: the best
+match is found at the coarsest level and refined in a small window at each finer
+level. Once the target has been found, the next frames only search a window
+around the last match, and fall back to a full search when the score drops.
+"""
+
+# Name of the cv2 matching method, resolved when cv2 is first used
+METHOD = "TM_CCOEFF_NORMED"
+
+# Coarsest pyramid level may not shrink the template below this size (px)
+MIN_TEMPLATE_SIZE = 8
+
+# Search radius (px) around the upscaled coarse match at each finer level
+REFINE_RADIUS = 3
+
+
+class MatchResult(NamedTuple):
+    found: bool  # score >= threshold
+    score: float
+    x: int  # top left of the match in full-resolution frame px
+    y: int
+    width: int
+    height: int
+    full_search: bool  # False when the result came from the tracking window
+
+
+class TemplateMatcher:
+    """
+    Args:
+        template: Grayscale template image
+        levels: Number of pyramid levels below full resolution (reduced if the
+            template would get too small)
+        threshold: Minimum score for a match to count as found
+        track_threshold: Minimum score to keep using the tracking window
+        window_margin: Pixels searched around the last match in each direction
+    """
+
+    def __init__(self, template: np.ndarray, levels: int = 2, threshold: float = 0.3,
+                 track_threshold: float = 0.6, window_margin: int = 24):
+        if template.ndim != 2:
+            raise ValueError("template must be grayscale")
+        self.threshold = threshold
+        self.track_threshold = track_threshold
+        self.window_margin = window_margin
+        self.height, self.width = template.shape
+
+        self.__templates: List[np.ndarray] = [template]
+        while len(self.__templates) <= levels:
+            h, w = self.__templates[-1].shape
+            if min(h, w) // 2 < MIN_TEMPLATE_SIZE:
+                break
+            self.__templates.append(cv2.pyrDown(self.__templates[-1]))
+        self.levels = len(self.__templates) - 1
+
+        self.last: Optional[MatchResult] = None
+
+    def reset(self) -> None:
+        self.last = None
+
+    @staticmethod
+    def __search(image: np.ndarray, template: np.ndarray, x0: int, y0: int, x1: int, y1: int):
+        """
+        Best match with its top left inside [x0, x1] x [y0, y1] (clamped to the image).
+        Returns (score, x, y).
+        """
+        th, tw = template.shape
+        ih, iw = image.shape
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, iw - tw), min(y1, ih - th)
+        if x1 < x0 or y1 < y0:
+            return -1.0, x0, y0
+        window = image[y0:y1 + th, x0:x1 + tw]
+        _, score, _, (x, y) = cv2.minMaxLoc(cv2.matchTemplate(window, template, getattr(cv2, METHOD)))
+        return score, x0 + x, y0 + y
+
+    def __result(self, score: float, x: int, y: int, full_search: bool) -> MatchResult:
+        result = MatchResult(score >= self.threshold, float(score), x, y, self.width, self.height, full_search)
+        self.last = result
+        return result
+
+    def full_search(self, gray_frame: np.ndarray) -> MatchResult:
+        pyramid = [gray_frame]
+        for _ in range(self.levels):
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+
+        coarse, template = pyramid[-1], self.__templates[-1]
+        score, x, y = self.__search(coarse, template, 0, 0, coarse.shape[1], coarse.shape[0])
+        for level in range(self.levels - 1, -1, -1):
+            x, y = x * 2, y * 2
+            score, x, y = self.__search(pyramid[level], self.__templates[level],
+                                        x - REFINE_RADIUS, y - REFINE_RADIUS,
+                                        x + REFINE_RADIUS, y + REFINE_RADIUS)
+        return self.__result(score, x, y, True)
+
+    def match(self, gray_frame: np.ndarray) -> MatchResult:
+        """
+        Finds the template in a grayscale frame, searching near the last match
+        first when it was confident.
+        """
+        last = self.last
+        if last is not None and last.score >= self.track_threshold:
+            margin = self.window_margin
+            score, x, y = self.__search(gray_frame, self.__templates[0],
+                                        last.x - margin, last.y - margin, last.x + margin, last.y + margin)
+            if score >= self.track_threshold:
+                return self.__result(score, x, y, False)
+        return self.full_search(gray_frame)
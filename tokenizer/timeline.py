@@ -0,0 +1,328 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from constants import TOWER_BOXES
+from tokenizer.game_types import GameState, TroopNames
+
+"""
+Memory-mapped, append-only game timeline.
+
+Per-frame game states (towers, troops, elixir, timestamps) are appended as
+fixed-size records to <path>.timeline, with a side index in <path>.idx mapping
+frame number and timestamp to record offset. Both files start with a small
+header holding the number of committed records; the writer fills a record and
+its index entry first and bumps the count last, so readers in other processes
+can map the same files while a match is still being recorded and only ever see
+complete records.
+
+Troop type ids are process-local (see TroopNames), so the writer keeps its own
+name table, stores troops under its ids and saves the table to <path>.names
+(JSON list, index = type id) whenever it gains a name. Readers load it to map
+type_id back to troop names.
+
+Readers slice frame or time ranges straight out of the mapping: results are
+NumPy structured-array views, with no parsing or copying.
+"""
+
+MAGIC = b"CLASHTLF"
+VERSION = 1
+HEADER_SIZE = 64
+GROW_RECORDS = 1024
+
+MAX_TROOPS = 64
+TOWER_NAMES = list(TOWER_BOXES)
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("record_size", "<u4"),
+    ("max_troops", "<u4"),
+    ("count", "<u8"),
+])
+
+TROOP_DTYPE = np.dtype([
+    ("type_id", "<i2"),
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("side", "i1"),
+    ("hp", "<f4"),
+    ("track_id", "<i4"),
+])
+
+RECORD_DTYPE = np.dtype([
+    ("frame", "<i8"),
+    ("timestamp", "<f8"),
+    ("elixir", "<f4"),
+    ("tower_alive", "u1", (len(TOWER_NAMES),)),
+    ("tower_health", "<f4", (len(TOWER_NAMES),)),
+    ("troop_count", "<u2"),
+    ("troops", TROOP_DTYPE, (MAX_TROOPS,)),
+])
+
+INDEX_DTYPE = np.dtype([
+    ("frame", "<i8"),
+    ("timestamp", "<f8"),
+    ("offset", "<i8"),
+])
+
+
+def _paths(path: str) -> tuple:
+    return path + ".timeline", path + ".idx"
+
+
+def _names_path(path: str) -> str:
+    return path + ".names"
+
+
+def _load_names(path: str) -> List[str]:
+    try:
+        with open(_names_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+class _MappedArray:
+    """
+    Header + growable array of records in one memory-mapped file.
+    """
+
+    def __init__(self, path: str, dtype: np.dtype, writable: bool):
+        self.path = path
+        self.dtype = dtype
+        self.writable = writable
+        self.header = None
+        self.records = None
+        self.capacity = 0
+        self.map()
+
+    def map(self) -> None:
+        mode = "r+" if self.writable else "r"
+        size = os.path.getsize(self.path)
+        self.capacity = (size - HEADER_SIZE) // self.dtype.itemsize
+        self.header = np.memmap(self.path, dtype=HEADER_DTYPE, mode=mode, shape=(1,))
+        if self.header["magic"][0] != MAGIC:
+            raise ValueError(f"{self.path} is not a timeline file")
+        self.records = np.memmap(self.path, dtype=self.dtype, mode=mode, offset=HEADER_SIZE,
+                                 shape=(self.capacity,)) if self.capacity else np.empty(0, dtype=self.dtype)
+
+    @property
+    def count(self) -> int:
+        return int(self.header["count"][0])
+
+    def grow(self, capacity: int) -> None:
+        self.flush()
+        with open(self.path, "r+b") as f:
+            f.truncate(HEADER_SIZE + capacity * self.dtype.itemsize)
+        self.map()
+
+    def flush(self) -> None:
+        if self.writable and isinstance(self.records, np.memmap):
+            self.records.flush()
+            self.header.flush()
+
+
+def _create(path: str, dtype: np.dtype) -> None:
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"], header["version"] = MAGIC, VERSION
+    header["record_size"], header["max_troops"] = dtype.itemsize, MAX_TROOPS
+    with open(path, "wb") as f:
+        f.write(header.tobytes().ljust(HEADER_SIZE, b"\x00"))
+
+
+class TimelineWriter:
+    """
+    Appends per-frame states to a timeline. Reopening an existing timeline
+    continues after its last committed record.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        data_path, index_path = _paths(path)
+        if not os.path.exists(data_path):
+            _create(data_path, RECORD_DTYPE)
+            _create(index_path, INDEX_DTYPE)
+        self.__data = _MappedArray(data_path, RECORD_DTYPE, writable=True)
+        self.__index = _MappedArray(index_path, INDEX_DTYPE, writable=True)
+        self.names = TroopNames(_load_names(path))
+        self.__saved_names = len(self.names)
+
+    def __len__(self):
+        return self.__data.count
+
+    def __type_ids(self, troops: GameState, count: int) -> np.ndarray:
+        """
+        The troops' type ids translated into this timeline's name table.
+        """
+        type_ids = troops.type_id[:count]
+        lookup = np.zeros(len(troops.names), dtype=np.int16)
+        for type_id in np.unique(type_ids):
+            lookup[type_id] = self.names.id(troops.names.name(int(type_id)))
+        if len(self.names) > self.__saved_names:
+            self.__save_names()
+        return lookup[type_ids]
+
+    def __save_names(self) -> None:
+        # Written to a temporary file and renamed, so readers never see a partial table
+        path = _names_path(self.path)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.names.names(), f)
+        os.replace(path + ".tmp", path)
+        self.__saved_names = len(self.names)
+
+    def append(self, frame: int, timestamp: float, tower_alive: Optional[np.ndarray] = None,
+               tower_health: Optional[np.ndarray] = None, troops: Optional[GameState] = None,
+               elixir: float = float("nan")) -> int:
+        """
+        Appends one frame's state and commits it.
+
+        Args:
+            frame: Frame number (must increase)
+            timestamp: Seconds since the start of the match
+            tower_alive, tower_health: Per-tower values in TOWER_NAMES order
+            troops: Troops on the field; rows beyond MAX_TROOPS are dropped. Their
+                type ids are mapped to this timeline's names before being stored
+            elixir: Current elixir (NaN when unknown)
+
+        Returns:
+            Row of the new record
+        """
+        row = self.__data.count
+        if row >= self.__data.capacity:
+            self.__data.grow(self.__data.capacity + GROW_RECORDS)
+            self.__index.grow(self.__index.capacity + GROW_RECORDS)
+
+        record = self.__data.records[row]
+        record["frame"] = frame
+        record["timestamp"] = timestamp
+        record["elixir"] = elixir
+        record["tower_alive"] = 1 if tower_alive is None else tower_alive
+        record["tower_health"] = 1.0 if tower_health is None else tower_health
+        count = 0
+        if troops is not None:
+            count = min(len(troops), MAX_TROOPS)
+            slots = record["troops"]
+            for name in TROOP_DTYPE.names:
+                if name != "type_id":
+                    slots[name][:count] = getattr(troops, name)[:count]
+            slots["type_id"][:count] = self.__type_ids(troops, count)
+        record["troop_count"] = count
+
+        entry = self.__index.records[row]
+        entry["frame"], entry["timestamp"] = frame, timestamp
+        entry["offset"] = HEADER_SIZE + row * RECORD_DTYPE.itemsize
+
+        # Publish: readers only look at rows below the committed count
+        self.__index.header["count"] = row + 1
+        self.__data.header["count"] = row + 1
+        return row
+
+    def append_towers(self, frame: int, timestamp: float, states: Dict[str, object], **kwargs) -> int:
+        """
+        append() taking TowerTracker.states directly.
+        """
+        alive = np.array([states[name].alive for name in TOWER_NAMES], dtype=np.uint8)
+        health = np.array([states[name].health for name in TOWER_NAMES], dtype=np.float32)
+        return self.append(frame, timestamp, alive, health, **kwargs)
+
+    def flush(self) -> None:
+        self.__data.flush()
+        self.__index.flush()
+
+    def close(self) -> None:
+        self.flush()
+        # Trim the preallocated tail so the file ends at the last record
+        for mapped in (self.__data, self.__index):
+            count = mapped.count
+            mapped.records = mapped.header = None
+            with open(mapped.path, "r+b") as f:
+                f.truncate(HEADER_SIZE + count * mapped.dtype.itemsize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class TimelineReader:
+    """
+    Read-only view of a timeline. Safe to use while a writer is appending;
+    call refresh() to pick up new records.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        data_path, index_path = _paths(path)
+        self.__data = _MappedArray(data_path, RECORD_DTYPE, writable=False)
+        self.__index = _MappedArray(index_path, INDEX_DTYPE, writable=False)
+        self.__count = 0
+        self.names = TroopNames()
+        self.__names_version = None
+        self.refresh()
+
+    def refresh(self) -> int:
+        """
+        Picks up records committed since the last refresh. Returns the record count.
+        """
+        # Read before the count: the writer saves new names before committing records that use them
+        try:
+            stat = os.stat(_names_path(self.path))
+            version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            version = None
+        if version != self.__names_version:
+            self.names = TroopNames(_load_names(self.path))
+            self.__names_version = version
+        count = min(self.__data.count, self.__index.count)
+        if count > self.__data.capacity or count > self.__index.capacity:
+            self.__data.map()
+            self.__index.map()
+            count = min(count, self.__data.capacity, self.__index.capacity)
+        self.__count = count
+        return count
+
+    def __len__(self):
+        return self.__count
+
+    @property
+    def records(self) -> np.ndarray:
+        return self.__data.records[:self.__count]
+
+    @property
+    def index(self) -> np.ndarray:
+        return self.__index.records[:self.__count]
+
+    def frames(self, start: int, stop: Optional[int] = None) -> np.ndarray:
+        """
+        Records with start <= frame < stop, as a view into the mapping.
+        """
+        frames = self.index["frame"]
+        first = int(np.searchsorted(frames, start, side="left"))
+        last = self.__count if stop is None else int(np.searchsorted(frames, stop, side="left"))
+        return self.records[first:last]
+
+    def between(self, start: float, stop: float) -> np.ndarray:
+        """
+        Records with start <= timestamp < stop (seconds), as a view into the mapping.
+        """
+        timestamps = self.index["timestamp"]
+        first = int(np.searchsorted(timestamps, start, side="left"))
+        last = int(np.searchsorted(timestamps, stop, side="left"))
+        return self.records[first:last]
+
+    def troops(self, record: np.void) -> np.ndarray:
+        """
+        The used troop slots of a record.
+        """
+        return record["troops"][:record["troop_count"]]
+
+    def troop_names(self, record: np.void) -> List[str]:
+        """
+        Names of the used troop slots of a record.
+        """
+        return [self.names.name(int(type_id)) for type_id in self.troops(record)["type_id"]]
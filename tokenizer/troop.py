@@ -0,0 +1,21 @@
+from typing import Annotated
+
+from pydantic import BaseModel
+
+"""
+The pydantic Troop model, in its own module so that only code handling Troop
+objects imports pydantic (tokenizer.game_types re-exports it on first use).
+"""
+
+
+class Troop(BaseModel):
+
+    name: str # i.e. witch
+
+    """
+        Position is displayed on 0 to 1 scale
+        1 is the end of the horizontal or vertical part of the screen
+        pos_on_screen = length_of_arena_on_screen * pos
+    """
+    x_position: Annotated[float, {"min_value": 0, "max_value": 1}]
+    y_position: Annotated[float, {"min_value": 0, "max_value": 1}]
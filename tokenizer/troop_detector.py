@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+
+from agent.coords import CoordinateSpaces
+from agent.lazy import lazy_import
+from tokenizer.background_model import RunningBackground
+from tokenizer.game_types import ARENA_ASPECT, SIDE_ENEMY, SIDE_USER, TROOP_NAMES, GameState
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+"""
+Troop detection and tracking on the battlefield.
+
+Blobs come from cv2.connectedComponentsWithStats over the RunningBackground
+foreground mask (one pass, boxes and areas included, no contour tracing). A
+tracker gives each blob a stable id across frames: candidate track/detection
+pairs are taken only from nearby cells of a uniform grid, scored by IoU (or
+centroid distance for small, fast blobs) in one vectorized step, and matched
+greedily from the best score down. Cost grows with the number of nearby pairs
+rather than with every track against every detection, so big pushes stay cheap.
+
+The same grid, built over the current troops in arena coordinates, answers
+neighbor and lane queries.
+"""
+
+# Arena grid in Clash Royale tiles: 18 wide, 32 tall
+ARENA_TILES = (18, 32)
+LANES = {"left": (0.0, 0.5), "right": (0.5, 1.0)}
+
+UNKNOWN_TROOP = "unknown"
+
+
+class SpatialGrid:
+    """
+    Uniform grid over points, rebuilt from arrays each frame.
+
+    Points are bucketed by cell with one argsort; queries gather the points of the
+    cells a circle or box overlaps and filter them exactly.
+
+    Args:
+        width, height: Extent of the space (points outside are clamped to the border cells)
+        cols, rows: Grid resolution
+    """
+
+    def __init__(self, width: float = 1.0, height: float = 1.0, cols: int = ARENA_TILES[0],
+                 rows: int = ARENA_TILES[1]):
+        self.width, self.height = width, height
+        self.cols, self.rows = cols, rows
+        self.__cell_w, self.__cell_h = width / cols, height / rows
+        self.x = np.empty(0, dtype=np.float32)
+        self.y = np.empty(0, dtype=np.float32)
+        self.__order = np.empty(0, dtype=np.intp)
+        self.__starts = np.zeros(cols * rows + 1, dtype=np.intp)
+
+    def __cells(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        col = np.clip((x / self.__cell_w).astype(np.intp), 0, self.cols - 1)
+        row = np.clip((y / self.__cell_h).astype(np.intp), 0, self.rows - 1)
+        return col, row
+
+    def build(self, x: np.ndarray, y: np.ndarray) -> "SpatialGrid":
+        self.x, self.y = np.asarray(x), np.asarray(y)
+        col, row = self.__cells(self.x, self.y)
+        cell = row * self.cols + col
+        self.__order = np.argsort(cell, kind="stable")
+        self.__starts = np.searchsorted(cell[self.__order], np.arange(self.cols * self.rows + 1))
+        return self
+
+    def __in_cells(self, col0: int, row0: int, col1: int, row1: int) -> np.ndarray:
+        col0, col1 = max(col0, 0), min(col1, self.cols - 1)
+        row0, row1 = max(row0, 0), min(row1, self.rows - 1)
+        if col1 < col0 or row1 < row0:
+            return np.empty(0, dtype=np.intp)
+        # Cells of one grid row are contiguous in the sorted order
+        chunks = [self.__order[self.__starts[r * self.cols + col0]:self.__starts[r * self.cols + col1 + 1]]
+                  for r in range(row0, row1 + 1)]
+        return np.concatenate(chunks)
+
+    def within_box(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """
+        Indices of points with x0 <= x < x1 and y0 <= y < y1.
+        """
+        (c0, c1), (r0, r1) = self.__cells(np.array([x0, x1]), np.array([y0, y1]))
+        candidates = self.__in_cells(int(c0), int(r0), int(c1), int(r1))
+        x, y = self.x[candidates], self.y[candidates]
+        return candidates[(x >= x0) & (x < x1) & (y >= y0) & (y < y1)]
+
+    def within_radius(self, x: float, y: float, radius: float, aspect: float = 1.0) -> np.ndarray:
+        """
+        Indices of points within radius of (x, y); y distances are multiplied by aspect.
+        """
+        ry = radius / aspect
+        candidates = self.within_box(x - radius, y - ry, x + radius, y + ry)
+        dx = self.x[candidates] - x
+        dy = (self.y[candidates] - y) * aspect
+        return candidates[dx * dx + dy * dy <= radius * radius]
+
+    def neighbor_pairs(self, qx: np.ndarray, qy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (point, query) index pairs for every point in the 3x3 cells around each query
+        point, computed without a per-query loop.
+        """
+        qcol, qrow = self.__cells(np.asarray(qx), np.asarray(qy))
+        col0 = np.maximum(qcol - 1, 0)
+        col1 = np.minimum(qcol + 1, self.cols - 1)
+        points, queries = [], []
+        for row_offset in (-1, 0, 1):
+            row = qrow + row_offset
+            inside = np.flatnonzero((row >= 0) & (row < self.rows))
+            # The three cells of a grid row are one contiguous run of the sorted order
+            start = self.__starts[row[inside] * self.cols + col0[inside]]
+            end = self.__starts[row[inside] * self.cols + col1[inside] + 1]
+            counts = end - start
+            total = int(counts.sum())
+            run_offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            points.append(self.__order[np.repeat(start, counts) + run_offsets])
+            queries.append(np.repeat(inside, counts))
+        return np.concatenate(points), np.concatenate(queries)
+
+    def lane(self, name: str) -> np.ndarray:
+        """
+        Indices of points in a lane ("left" or "right"), assuming arena coordinates.
+        """
+        x0, x1 = LANES[name]
+        return self.within_box(x0 * self.width, 0.0, x1 * self.width + 1e-6, self.height + 1e-6)
+
+
+def iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Element-wise IoU of two (N, 4) arrays of (x, y, w, h) boxes.
+    """
+    x0 = np.maximum(a[:, 0], b[:, 0])
+    y0 = np.maximum(a[:, 1], b[:, 1])
+    x1 = np.minimum(a[:, 0] + a[:, 2], b[:, 0] + b[:, 2])
+    y1 = np.minimum(a[:, 1] + a[:, 3], b[:, 1] + b[:, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    union = a[:, 2] * a[:, 3] + b[:, 2] * b[:, 3] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+class TroopTracker:
+    """
+    Assigns stable ids to detection boxes across frames.
+
+    Args:
+        iou_threshold: Minimum IoU for a detection to continue a track
+        max_distance: Centroid distance (px) under which a non-overlapping
+            detection may still continue a track
+        max_misses: Frames a track survives without a detection
+        min_hits: Detections before a track is reported
+        cell: Grid cell size (px) used to find candidate pairs
+    """
+
+    def __init__(self, iou_threshold: float = 0.2, max_distance: float = 24.0, max_misses: int = 5,
+                 min_hits: int = 2, cell: float = 64.0):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.cell = cell
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int32)
+        self.hits = np.empty(0, dtype=np.int32)
+        self.misses = np.empty(0, dtype=np.int32)
+        self.__next_id = 0
+
+    def __candidates(self, detections: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (track, detection) index pairs whose centroids share or neighbor a grid cell.
+        """
+        if not len(self.boxes) or not len(detections):
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        track_centers = self.boxes[:, :2] + self.boxes[:, 2:] / 2
+        centers = detections[:, :2] + detections[:, 2:] / 2
+        # Cells are at least as large as the match radius, so a 3x3 neighborhood suffices
+        cell = max(self.cell, self.max_distance)
+        max_x = max(track_centers[:, 0].max(), centers[:, 0].max()) + 1
+        max_y = max(track_centers[:, 1].max(), centers[:, 1].max()) + 1
+        grid = SpatialGrid(max_x, max_y, max(int(max_x // cell), 1), max(int(max_y // cell), 1))
+        grid.build(track_centers[:, 0], track_centers[:, 1])
+        return grid.neighbor_pairs(centers[:, 0], centers[:, 1])
+
+    def update(self, detections: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Matches an (N, 4) array of (x, y, w, h) detections to the tracks.
+
+        Returns:
+            (boxes, ids) of the confirmed tracks seen this frame
+        """
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 4)
+        tracks, dets = self.__candidates(detections)
+
+        matched_tracks = np.zeros(len(self.boxes), dtype=np.bool_)
+        matched_dets = np.full(len(detections), -1, dtype=np.intp)
+        if len(tracks):
+            overlap = iou(self.boxes[tracks], detections[dets])
+            a = self.boxes[tracks, :2] + self.boxes[tracks, 2:] / 2
+            b = detections[dets, :2] + detections[dets, 2:] / 2
+            distance = np.hypot(*(a - b).T)
+            # Overlap first; among non-overlapping pairs, closer is better
+            score = np.where(overlap > 0, overlap + 1.0, 1.0 - distance / (self.max_distance * 2))
+            keep = (overlap >= self.iou_threshold) | (distance <= self.max_distance)
+            order = np.argsort(-score[keep], kind="stable")
+            for track, det in zip(tracks[keep][order], dets[keep][order]):
+                if matched_tracks[track] or matched_dets[det] >= 0:
+                    continue
+                matched_tracks[track] = True
+                matched_dets[det] = track
+
+        # Continue matched tracks
+        continued = matched_dets >= 0
+        track_rows = matched_dets[continued]
+        self.boxes[track_rows] = detections[continued]
+        self.hits[track_rows] += 1
+        self.misses[track_rows] = 0
+        self.misses[~matched_tracks] += 1
+
+        # Start new tracks, drop lost ones
+        new = detections[~continued]
+        new_ids = np.arange(self.__next_id, self.__next_id + len(new), dtype=np.int32)
+        self.__next_id += len(new)
+        alive = self.misses <= self.max_misses
+        seen = np.concatenate([matched_tracks[alive], np.ones(len(new), dtype=np.bool_)])
+        self.boxes = np.concatenate([self.boxes[alive], new])
+        self.ids = np.concatenate([self.ids[alive], new_ids])
+        self.hits = np.concatenate([self.hits[alive], np.ones(len(new), dtype=np.int32)])
+        self.misses = np.concatenate([self.misses[alive], np.zeros(len(new), dtype=np.int32)])
+
+        report = seen & (self.hits >= self.min_hits)
+        return self.boxes[report], self.ids[report]
+
+
+class TroopDetector:
+    """
+    Args:
+        model: Background model producing the battlefield foreground mask
+        min_area: Minimum blob area in full-resolution px (model.min_area by default)
+        coords: Coordinate spaces used to convert detections to arena coordinates
+        tracker: Tracker assigning ids (a default TroopTracker if None)
+    """
+
+    def __init__(self, model: Optional[RunningBackground] = None, min_area: Optional[int] = None,
+                 coords: Optional[CoordinateSpaces] = None, tracker: Optional[TroopTracker] = None):
+        self.model = model if model is not None else RunningBackground()
+        self.min_area = self.model.min_area if min_area is None else min_area
+        self.coords = coords if coords is not None else CoordinateSpaces()
+        self.tracker = tracker if tracker is not None else TroopTracker()
+        self.state = GameState()
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.grid = SpatialGrid()
+        self.__unknown = TROOP_NAMES.id(UNKNOWN_TROOP)
+
+    def detect(self, mask: np.ndarray) -> np.ndarray:
+        """
+        Foreground blobs of a model-resolution mask as an (N, 4) float32 array of
+        (x, y, w, h) boxes in full frame px.
+        """
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        stats = stats[1:]  # label 0 is the background
+        scale = self.model.scale
+        stats = stats[stats[:, cv2.CC_STAT_AREA] >= self.min_area * scale * scale]
+        boxes = stats[:, :4].astype(np.float32) / scale
+        boxes[:, 0] += self.model.box["x"]
+        boxes[:, 1] += self.model.box["y"]
+        return boxes
+
+    def update(self, frame: np.ndarray) -> GameState:
+        """
+        Detects and tracks troops in a BGR (or grayscale) frame.
+
+        Returns:
+            This detector's GameState, refilled with the tracked troops (arena
+            coordinates, track ids, side from the half of the arena they are in)
+        """
+        mask = self.model.apply(frame)
+        boxes, ids = self.tracker.update(self.detect(mask))
+        self.boxes = boxes
+
+        centers = boxes[:, :2] + boxes[:, 2:] / 2
+        arena = self.coords.transform(centers, "video", "arena")
+        side = np.where(arena[:, 1] < 0.5, SIDE_ENEMY, SIDE_USER)
+        self.state.clear()
+        self.state.extend(np.full(len(ids), self.__unknown, dtype=np.int16), arena[:, 0], arena[:, 1],
+                          side=side, track_id=ids)
+        self.grid.build(self.state.x, self.state.y)
+        return self.state
+
+    def boxes_by_id(self) -> Dict[int, Tuple[int, int, int, int]]:
+        """
+        Boxes (x, y, w, h) in frame px of the troops from the last update, by track id.
+        """
+        return {int(i): tuple(int(v) for v in box) for i, box in zip(self.state.track_id, self.boxes)}
+
+    def neighbors(self, row: int, radius: float) -> List[int]:
+        """
+        Rows of the troops within radius (arena widths) of troop `row`, itself excluded.
+        """
+        found = self.grid.within_radius(float(self.state.x[row]), float(self.state.y[row]), radius, ARENA_ASPECT)
+        return [int(i) for i in found if i != row]